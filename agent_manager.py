@@ -14,10 +14,14 @@ import random
 from apscheduler.schedulers.background import BackgroundScheduler
 from config import carregar_config, listar_agentes, get_agent_db_path, get_agent_session_path
 from database import Database
-from ai_services import AIServices
 from news_apis import NewsAPIs
 from instagram import InstagramManager
-from media import MediaProcessor
+from filtros import criar_cadeia_noticias, preparar_contexto, enfileirar
+from enriquecimento import (executor_enriquecimento, enriquecer_contexto, legenda_do_item,
+                            preencher_legendas_pendentes, PERFIL_PADRAO)
+from quase_duplicatas import obter_indice
+from indice_semantico import obter_indice_semantico
+from renderizacao import renderizar_pendentes, arte_do_item
 
 class AgentManager:
     def __init__(self):
@@ -47,6 +51,9 @@ class AgentManager:
             # Configura banco de dados específico do agente
             db_path = get_agent_db_path(agent_id)
             Database.setup_database_for_agent(agent_id, db_path)
+            # Constrói os índices locais de duplicatas
+            obter_indice(agent_id)
+            obter_indice_semantico(agent_id)
             
             # Configura Instagram com sessão específica
             instagram = InstagramManager(get_agent_session_path(agent_id))
@@ -83,6 +90,24 @@ class AgentManager:
                 id=f'postador_{agent_id}'
             )
             
+            # Completa legendas de itens que entraram na fila sem elas
+            scheduler.add_job(
+                preencher_legendas_pendentes,
+                'interval',
+                minutes=config.get("intervalo_backfill_legendas", 10),
+                args=[agent_id, config.get('insta_user', PERFIL_PADRAO)],
+                id=f'backfill_legendas_{agent_id}'
+            )
+            
+            # Gera as imagens dos itens da fila que ainda não têm arte e limpa as antigas
+            scheduler.add_job(
+                renderizar_pendentes,
+                'interval',
+                minutes=config.get("intervalo_render_antecipado", 5),
+                args=[agent_id, config],
+                id=f'render_antecipado_{agent_id}'
+            )
+            
             scheduler.start()
             
             # Armazena o agente
@@ -95,7 +120,7 @@ class AgentManager:
             
             logging.info(f"[AGENT-{agent_id}] Iniciado com sucesso (pasta: {config.get('pasta_feed', 'geral')})")
             return True
-            
+        
         except Exception as e:
             logging.error(f"[AGENT-{agent_id}] Erro na inicialização: {e}")
             return False
@@ -110,97 +135,25 @@ class AgentManager:
         
         logging.info(f"[AGENT-{agent_id}] Iniciando busca de notícias (pasta: {config.get('pasta_feed', 'geral')})")
         
-        noticias = NewsAPIs.buscar_todas_noticias(config)
+        noticias, cursores = NewsAPIs.buscar_noticias_com_cursores(config, agent_id)
         
-        for noticia in noticias:
-            custo_total_noticia = 0.0
-            
-            # Extrai dados básicos
-            titulo_bruto = noticia.get("title")
-            url_imagem = noticia.get("image")
-            
-            if not titulo_bruto or not MediaProcessor.validar_imagem(url_imagem):
-                continue
-            
-            # Remove fonte do título se presente
-            titulo_original = titulo_bruto.rsplit(" - ", 1)[0] if " - " in titulo_bruto else titulo_bruto
-            conteudo_original = noticia.get("content") or noticia.get("description", "")
-            
-            # Gera hash semântico para detectar duplicatas
-            semantic_hash, custo_hash = AIServices.gerar_titulo_canonico(titulo_original, conteudo_original)
-            custo_total_noticia += custo_hash
-            
-            # Prepara dados para histórico
-            dados_para_historico = {
-                "titulo_original": titulo_original,
-                "conteudo_original": conteudo_original,
-                "idioma_original": noticia['idioma_original'],
-                "api_fonte": noticia['api_fonte'],
-                "custo_usd": custo_total_noticia,
-                "semantic_hash": semantic_hash,
-                "pasta_feed": noticia.get('pasta_feed', config.get('pasta_feed', 'geral'))
-            }
-            
-            # Verifica duplicata por título primeiro (específico do agente)
-            if Database.verificar_titulo_duplicado_agente(agent_id, titulo_original):
-                dados_para_historico.update({"titulo_refinado": f"[DUPLICATA TÍTULO] {titulo_original[:150]}"})
-                Database.registrar_no_historico_agente(agent_id, dados_para_historico, "REJEITADA", "Título já processado")
-                logging.info(f"[AGENT-{agent_id}] Notícia ignorada - título já processado: {titulo_original[:100]}...")
-                continue
-            
-            # Verifica duplicata semântica (específico do agente)
-            if Database.verificar_duplicata_semantica_agente(agent_id, semantic_hash):
-                dados_para_historico.update({"titulo_refinado": f"[DUPLICATA] {titulo_original[:150]}"})
-                Database.registrar_no_historico_agente(agent_id, dados_para_historico, "REJEITADA", "Duplicata Semântica")
-                continue
-            
-            # Processa conforme lógica original...
-            # (resto do processamento idêntico ao app.py original, mas usando funções específicas do agente)
-            
-            # Filtra relevância
-            veredito, custo_filtro = AIServices.filtrar_relevancia(titulo_original, conteudo_original)
-            custo_total_noticia += custo_filtro
-            dados_para_historico["custo_usd"] = custo_total_noticia
-            
-            if veredito != "APROVADA":
-                dados_para_historico.update({
-                    "titulo_refinado": f"[REJEITADO] {titulo_original[:150]}",
-                    "conteudo_reescrito": ""
-                })
-                Database.registrar_no_historico_agente(agent_id, dados_para_historico, "REJEITADA", veredito)
-                continue
-            
-            # Traduz se necessário
-            if noticia['idioma_original'] == 'en':
-                titulo_processado, custo_trad_titulo = AIServices.traduzir_texto(titulo_original, 'Inglês')
-                conteudo_processado, custo_trad_conteudo = AIServices.traduzir_texto(conteudo_original, 'Inglês')
-                custo_total_noticia += custo_trad_titulo + custo_trad_conteudo
-            else:
-                titulo_processado = titulo_original
-                conteudo_processado = conteudo_original
-            
-            # Refina título
-            titulo_refinado, custo_refino = AIServices.melhorar_titulo(titulo_processado)
-            custo_total_noticia += custo_refino
-            dados_para_historico.update({"titulo_refinado": titulo_refinado})
-            
-            # Reescreve conteúdo e categoriza
-            conteudo_reescrito, custo_reescrita = AIServices.reescrever_legenda(conteudo_processado)
-            categoria_ia, custo_categoria = AIServices.categorizar_noticia(titulo_refinado, conteudo_reescrito)
-            custo_total_noticia += custo_reescrita + custo_categoria
-            
-            # Finaliza dados
-            dados_para_historico.update({
-                "conteudo_reescrito": conteudo_reescrito,
-                "categoria_ia": categoria_ia,
-                "custo_usd": custo_total_noticia,
-                "url_imagem": url_imagem,
-                "fonte": noticia.get("source", {}).get("name"),
-                "descricao": noticia.get("description")
-            })
-            
-            # Adiciona na fila do agente
-            Database.adicionar_na_fila_agente(agent_id, dados_para_historico)
+        # Filtros baratos primeiro; só chegam aqui notícias aprovadas em todas as etapas
+        contextos = [preparar_contexto(noticia, config.get('pasta_feed', 'geral')) for noticia in noticias]
+        aprovados = criar_cadeia_noticias(agent_id).executar(contextos)
+        
+        # Enriquecimento em paralelo; a fila recebe as notícias na ordem original
+        perfil = config.get('insta_user', PERFIL_PADRAO)
+        executor_enriquecimento.executar(
+            agent_id, aprovados, lambda contexto: enriquecer_contexto(contexto, perfil),
+            lambda dados: enfileirar(dados, agent_id))
+        obter_indice_semantico(agent_id).salvar()
+        
+        # Só agora os cursores avançam: as notícias desta busca já estão na fila, foram descartadas
+        # ou ficaram adiadas no banco (noticias_adiadas), de onde voltam no próximo ciclo
+        NewsAPIs.avancar_cursores(cursores, agent_id)
+        
+        # Gera já as imagens dos itens que acabaram de entrar na fila
+        renderizar_pendentes(agent_id, config)
     
     def postar_da_fila_agente(self, agent_id, item_id=None):
         """Posta próximo item da fila de um agente específico"""
@@ -224,24 +177,12 @@ class AgentManager:
         item = dict(item_row) if hasattr(item_row, 'keys') else item_row
         logging.info(f"--- [AGENT-{agent_id}] Iniciando postagem: {item['titulo_refinado']} ---")
         
-        # Cria imagem
-        caminho_imagem = MediaProcessor.criar_imagem_post(
-            item['titulo_refinado'], 
-            item['url_imagem'], 
-            item['categoria_ia']
-        )
+        # Usa a imagem gerada antecipadamente; só renderiza aqui se ela não estiver pronta
+        caminho_imagem = arte_do_item(item, config, agent_id)
         
         if caminho_imagem:
-            # Prepara legenda
-            conteudo_curado = item.get("conteudo_reescrito") or "Sem conteúdo adicional."
-            fonte = item.get("fonte", "Fonte não informada")
-            categoria_ia = item.get("categoria_ia", "noticias")
-            
-            # Gera hashtags
-            hashtags_ia, custo_hashtags = AIServices.gerar_hashtags(f"{item['titulo_refinado']} {conteudo_curado}")
-            item['custo_usd'] += custo_hashtags
-            
-            legenda = f"siga: @{config.get('insta_user', 'noticiasbr.ai')} | {conteudo_curado}\n\nFonte: {fonte}\n\n#{categoria_ia.replace(' ','')} {hashtags_ia}"
+            # Legenda gerada na entrada da fila; postar não depende da IA
+            legenda = legenda_do_item(item, config.get('insta_user', PERFIL_PADRAO))
             
             # Posta
             sucesso = instagram.postar_foto(caminho_imagem, legenda)
@@ -1,35 +1,115 @@
-import google.generativeai as genai
+import json
 import logging
 import re
-from config import PRECO_INPUT_USD_1M_TOKENS, PRECO_OUTPUT_USD_1M_TOKENS, carregar_config
+import threading
+from config import PRECO_INPUT_USD_1M_TOKENS, PRECO_OUTPUT_USD_1M_TOKENS, config_snapshot
+from cache_llm import cache_llm
+from cliente_llm import cliente_llm
+from resiliencia_llm import resiliencia_llm, LLMIndisponivel
+from orcamento_prompt import ajustar, registrar_prompt
 
-custo_sessao_atual = {"total_custo_usd": 0.0}
+MODELO_GEMINI = 'gemini-2.5-flash-lite-preview-06-17'
+
+CRITERIOS_RELEVANCIA = """Você é um editor de pauta sênior, extremamente criterioso e cético. Sua função é analisar o título e o conteúdo de um artigo para determinar se é uma notícia genuína ou se é conteúdo promocional, marketing, 'caça-cliques' ou de baixo valor jornalístico.
+
+REPROVE o conteúdo se ele se encaixar em qualquer uma destas categorias:
+
+Anúncios, publieditoriais ou marketing disfarçado de notícia.
+
+Venda ou sugestão explícita de cursos, webinars, e-books ou produtos.
+
+Listas de "dicas" ou "curiosidades" de baixo impacto (ex: '5 formas de limpar seu celular', 'o segredo para descascar um ovo').
+
+Notícias "bestas", fofocas de celebridades ou entretenimento de baixo valor que não se encaixam em editorias sérias.
+
+Resultados de loteria, horóscopo, ou conteúdo sobre sorte e previsões.
+
+Artigos de opinião pessoal sem base em fatos concretos.
+
+Qualquer noticia que nao seja de jogos extremamente conhecidos como GTA.
+
+APROVE apenas se for uma notícia genuína sobre:
+
+Eventos globais ou nacionais significativos.
+
+Anúncios de produtos ou tecnologias de grandes empresas (ex: Apple, Google, NASA).
+
+Descobertas científicas ou avanços médicos importantes.
+
+Análises sobre o mercado financeiro e economia.
+
+Resultados e eventos de esportes relevantes."""
+
+# Veredito de relevância quando o modelo está indisponível: a notícia volta no próximo ciclo
+VEREDITO_ADIADO = "ADIADA"
+
+CATEGORIAS_PERMITIDAS = ["Política", "Economia", "Ciência", "IA", "Tecnologia", "Educação", "Saúde", "Governo", "Mundo", "Guerra"]
+
+custo_sessao_atual = {
+    "total_custo_usd": 0.0,
+    "cache_llm": {"acertos": 0, "falhas": 0, "taxa_acerto": 0.0, "usd_economizado": 0.0}
+}
+_custo_lock = threading.Lock()  # As notícias são enriquecidas em paralelo
 
 class AIServices:
     
     @staticmethod
-    def _chamar_gemini(prompt, funcao_nome):
-        cfg = carregar_config()
+    def _chamar_gemini(prompt, funcao_nome, adiavel=False):
+        """
+        Retorna (texto, custo). Em falha retorna (None, 0.0); com adiavel=True,
+        indisponibilidade do modelo levanta LLMIndisponivel para o chamador adiar.
+        """
+        cfg = config_snapshot()
+        registrar_prompt(funcao_nome, prompt)
+        backend = cfg.get("llm_backend", "gemini")
+        # Respostas de outros backends (stub) não se misturam às do Gemini no cache
+        modelo_cache = MODELO_GEMINI if backend == "gemini" else f"{backend}/{MODELO_GEMINI}"
         
-        if not cfg.get("google_api_key") or cfg.get("google_api_key") == "SUA_CHAVE_API_DO_GEMINI_AQUI":
+        # Cache de respostas: acerto custa zero e não chama a API
+        usar_cache = cfg.get("cache_llm_ativo", True) and cfg.get("cache_llm_funcoes", {}).get(funcao_nome, True)
+        if usar_cache:
+            ttl = float(cfg.get("cache_llm_ttl_horas", 72)) * 3600
+            max_memoria = int(cfg.get("cache_llm_max_memoria", 2000))
+            chave_cache = cache_llm.chave(modelo_cache, prompt)
+            em_cache = cache_llm.obter(chave_cache, ttl, max_memoria)
+            with _custo_lock:
+                stats_cache = custo_sessao_atual["cache_llm"]
+                if em_cache is not None:
+                    stats_cache["acertos"] += 1
+                    stats_cache["usd_economizado"] += em_cache[1]
+                else:
+                    stats_cache["falhas"] += 1
+                stats_cache["taxa_acerto"] = round(stats_cache["acertos"] / (stats_cache["acertos"] + stats_cache["falhas"]), 3)
+            if em_cache is not None:
+                return em_cache[0], 0.0
+        
+        if cliente_llm.backend_requer_chave(cfg) and (
+                not cfg.get("google_api_key") or cfg.get("google_api_key") == "SUA_CHAVE_API_DO_GEMINI_AQUI"):
             logging.warning(f"[IA] Chave do Gemini não configurada. Pulando '{funcao_nome}'.")
             return None, 0.0
         
         try:
-            model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-06-17')
-            response = model.generate_content(prompt)
-            custo_usd = 0.0
+            backend_llm = cliente_llm.obter(MODELO_GEMINI, cfg)
+            resposta = resiliencia_llm.executar(MODELO_GEMINI, lambda: backend_llm.gerar(prompt), cfg)
+            custo_in = (resposta.tokens_entrada / 1_000_000) * PRECO_INPUT_USD_1M_TOKENS
+            custo_out = (resposta.tokens_saida / 1_000_000) * PRECO_OUTPUT_USD_1M_TOKENS
+            custo_usd = custo_in + custo_out
+            if custo_usd:
+                with _custo_lock:
+                    custo_sessao_atual["total_custo_usd"] += custo_usd
             
-            if hasattr(response, 'usage_metadata'):
-                tokens_in = response.usage_metadata.prompt_token_count
-                tokens_out = response.usage_metadata.candidates_token_count
-                custo_in = (tokens_in / 1_000_000) * PRECO_INPUT_USD_1M_TOKENS
-                custo_out = (tokens_out / 1_000_000) * PRECO_OUTPUT_USD_1M_TOKENS
-                custo_usd = custo_in + custo_out
-                custo_sessao_atual["total_custo_usd"] += custo_usd
+            texto = resposta.texto
+            if usar_cache and texto:
+                cache_llm.guardar(chave_cache, modelo_cache, funcao_nome, texto, custo_usd, ttl,
+                                  int(cfg.get("cache_llm_max_entradas", 20000)), max_memoria)
             
-            return response.text.strip(), custo_usd
+            return texto, custo_usd
             
+        except LLMIndisponivel as e:
+            logging.warning(f"[IA] '{funcao_nome}' sem resposta: {e}.")
+            if adiavel:
+                raise
+            return None, 0.0
         except Exception as e:
             logging.error(f"[IA ERRO] Falha ao chamar Gemini em '{funcao_nome}': {e}.")
             return None, 0.0
@@ -39,7 +119,7 @@ class AIServices:
         # Trata caso do conteúdo ser None ou vazio
         conteudo_texto = ""
         if conteudo and len(conteudo.strip()) > 0:
-            conteudo_texto = conteudo[:300]
+            conteudo_texto = ajustar("Título Canônico", conteudo)
         else:
             conteudo_texto = "Conteúdo não disponível"
             
@@ -66,39 +146,11 @@ Manchete Canônica:"""
         # Trata caso do conteúdo ser None ou vazio
         conteudo_texto = ""
         if conteudo and len(conteudo.strip()) > 0:
-            conteudo_texto = conteudo[:700]
+            conteudo_texto = ajustar("Filtro de Relevância", conteudo)
         else:
             conteudo_texto = "Conteúdo não disponível"
             
-        prompt = f"""Você é um editor de pauta sênior, extremamente criterioso e cético. Sua função é analisar o título e o conteúdo de um artigo para determinar se é uma notícia genuína ou se é conteúdo promocional, marketing, 'caça-cliques' ou de baixo valor jornalístico.
-
-REPROVE o conteúdo se ele se encaixar em qualquer uma destas categorias:
-
-Anúncios, publieditoriais ou marketing disfarçado de notícia.
-
-Venda ou sugestão explícita de cursos, webinars, e-books ou produtos.
-
-Listas de "dicas" ou "curiosidades" de baixo impacto (ex: '5 formas de limpar seu celular', 'o segredo para descascar um ovo').
-
-Notícias "bestas", fofocas de celebridades ou entretenimento de baixo valor que não se encaixam em editorias sérias.
-
-Resultados de loteria, horóscopo, ou conteúdo sobre sorte e previsões.
-
-Artigos de opinião pessoal sem base em fatos concretos.
-
-Qualquer noticia que nao seja de jogos extremamente conhecidos como GTA.
-
-APROVE apenas se for uma notícia genuína sobre:
-
-Eventos globais ou nacionais significativos.
-
-Anúncios de produtos ou tecnologias de grandes empresas (ex: Apple, Google, NASA).
-
-Descobertas científicas ou avanços médicos importantes.
-
-Análises sobre o mercado financeiro e economia.
-
-Resultados e eventos de esportes relevantes.
+        prompt = f"""{CRITERIOS_RELEVANCIA}
 
 Responda APENAS com APROVADA ou REPROVADA.
 
@@ -110,7 +162,10 @@ Conteúdo: {conteudo_texto}...
 
 Veredito:"""
         
-        veredito, custo = AIServices._chamar_gemini(prompt, "Filtro de Relevância")
+        try:
+            veredito, custo = AIServices._chamar_gemini(prompt, "Filtro de Relevância", adiavel=True)
+        except LLMIndisponivel:
+            return VEREDITO_ADIADO, 0.0
         
         if veredito not in ["APROVADA", "REPROVADA"]:
             logging.warning("[IA - Filtro] Resposta inesperada. Reprovando por segurança.")
@@ -119,10 +174,93 @@ Veredito:"""
         logging.info(f"[IA - Filtro] Veredito para '{titulo[:50]}...': {veredito}")
         return veredito, custo
     
+    @staticmethod
+    def _extrair_json(texto):
+        """Lê JSON da resposta do modelo, ignorando cercas de código markdown"""
+        if not texto:
+            return None
+        texto = re.sub(r'^```(?:json)?\s*|\s*```$', '', texto.strip())
+        try:
+            return json.loads(texto)
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def filtrar_relevancia_lote(itens, tamanho_lote=None):
+        """
+        Filtra vários (titulo, conteudo) com uma chamada por lote.
+        Retorna uma lista de (veredito, custo) na mesma ordem dos itens; itens
+        ausentes ou malformados na resposta são refeitos individualmente.
+        """
+        if tamanho_lote is None:
+            tamanho_lote = int(config_snapshot().get("relevancia_tamanho_lote", 10))
+        tamanho_lote = max(1, tamanho_lote)
+        resultados = []
+        
+        for inicio in range(0, len(itens), tamanho_lote):
+            lote = itens[inicio:inicio + tamanho_lote]
+            
+            if len(lote) == 1:
+                resultados.append(AIServices.filtrar_relevancia(*lote[0]))
+                continue
+            
+            textos = []
+            for numero, (titulo, conteudo) in enumerate(lote, start=1):
+                conteudo_texto = ajustar("Filtro de Relevância em Lote", conteudo) if conteudo and len(conteudo.strip()) > 0 else "Conteúdo não disponível"
+                textos.append(f"[{numero}]\nTítulo: {titulo}\nConteúdo: {conteudo_texto}...")
+            
+            prompt = f"""{CRITERIOS_RELEVANCIA}
+
+Você receberá {len(lote)} textos numerados. Avalie cada um de forma independente.
+
+Responda APENAS com um array JSON contendo um objeto por texto, no formato:
+[{{"id": 1, "veredito": "APROVADA"}}, {{"id": 2, "veredito": "REPROVADA"}}]
+
+Textos:
+---
+{chr(10).join(textos)}
+---
+
+JSON:"""
+            
+            try:
+                resposta, custo = AIServices._chamar_gemini(prompt, "Filtro de Relevância em Lote", adiavel=True)
+            except LLMIndisponivel:
+                resultados.extend((VEREDITO_ADIADO, 0.0) for _ in lote)
+                continue
+            dados = AIServices._extrair_json(resposta)
+            
+            vereditos = {}
+            if isinstance(dados, list):
+                for entrada in dados:
+                    if isinstance(entrada, dict) and entrada.get("veredito") in ["APROVADA", "REPROVADA"]:
+                        try:
+                            vereditos[int(entrada.get("id"))] = entrada["veredito"]
+                        except (TypeError, ValueError):
+                            continue
+            
+            # Custo do lote dividido entre todos os itens, inclusive os refeitos individualmente
+            custo_item = custo / len(lote)
+            faltantes = 0
+            for numero, (titulo, conteudo) in enumerate(lote, start=1):
+                if numero in vereditos:
+                    logging.info(f"[IA - Filtro] Veredito para '{titulo[:50]}...': {vereditos[numero]}")
+                    resultados.append((vereditos[numero], custo_item))
+                else:
+                    faltantes += 1
+                    veredito, custo_individual = AIServices.filtrar_relevancia(titulo, conteudo)
+                    resultados.append((veredito, custo_item + custo_individual))
+            
+            if faltantes:
+                logging.warning(f"[IA - Filtro] Lote sem veredito válido para {faltantes} de {len(lote)} itens. Refeitos individualmente.")
+        
+        return resultados
+    
     @staticmethod
     def traduzir_texto(texto, idioma_original='Inglês'):
         if not texto:
             return texto, 0.0
+        texto = ajustar("Tradução", texto)
             
         prompt = f"""Traduza o seguinte texto de {idioma_original} para o Português do Brasil, mantendo o sentido e o tom jornalístico. 
 
@@ -148,7 +286,7 @@ Exemplo: Notícia sobre o iPhone.|||E você, vai atualizar?
 
 Texto original:
 ---
-{texto_original}
+{ajustar("Reescrita de Legenda", texto_original)}
 ---
 
 Texto reescrito:"""
@@ -158,15 +296,19 @@ Texto reescrito:"""
         if response_text:
             partes = response_text.split('|||')
             if len(partes) == 2:
-                resumo = re.sub(r'^\s*[\d\.\-\*]+\s*', '', partes[0].strip())
-                gancho = re.sub(r'^\s*[\d\.\-\*]+\s*', '', partes[1].strip())
-                texto_formatado = f"{resumo}\n\n{gancho}"
+                texto_formatado = AIServices._formatar_legenda(partes[0], partes[1])
             else:
                 texto_formatado = re.sub(r'^\s*[\d\.\-\*]+\s*', '', response_text)
             return texto_formatado, custo
         
         return texto_original, 0.0
     
+    @staticmethod
+    def _formatar_legenda(resumo, gancho):
+        resumo = re.sub(r'^\s*[\d\.\-\*]+\s*', '', resumo.strip())
+        gancho = re.sub(r'^\s*[\d\.\-\*]+\s*', '', gancho.strip())
+        return f"{resumo}\n\n{gancho}"
+    
     @staticmethod
     def melhorar_titulo(titulo_original):
         if not titulo_original:
@@ -188,13 +330,13 @@ Título refinado:"""
         # Trata caso do conteúdo ser None ou vazio
         conteudo_texto = ""
         if conteudo and len(conteudo.strip()) > 0:
-            conteudo_texto = conteudo
+            conteudo_texto = ajustar("Categorização", conteudo)
         else:
             conteudo_texto = "Conteúdo não disponível"
             
         prompt = f"""Você é um classificador de conteúdo especialista. Sua tarefa é ler o título e o conteúdo de uma notícia e classificá-la na categoria mais apropriada de uma lista pré-definida.
 
-A lista de categorias permitidas é: Política, Economia, Ciência, IA, Tecnologia, Educação, Saúde, Governo, Mundo, Guerra.
+A lista de categorias permitidas é: {', '.join(CATEGORIAS_PERMITIDAS)}.
 
 Analise o texto e retorne APENAS o nome de UMA categoria da lista. Se nenhuma se encaixar perfeitamente, escolha a mais próxima ou 'Mundo'.
 
@@ -224,10 +366,135 @@ Exemplo: #inteligenciaartificial #tecnologia #inovacao
 
 Texto base:
 ---
-{texto_para_seo}
+{ajustar("Geração de Hashtags", texto_para_seo)}
 ---
 
 Hashtags:"""
         
         hashtags, custo = AIServices._chamar_gemini(prompt, "Geração de Hashtags")
-        return hashtags or "", custo
\ No newline at end of file
+        return hashtags or "", custo
+    
+    @staticmethod
+    def _enriquecer_sequencial(titulo, conteudo, idioma_original, incluir_hashtags=False):
+        """Cadeia original: tradução, refinamento, reescrita e categorização em chamadas separadas"""
+        custo_total = 0.0
+        
+        # Traduz se necessário
+        if idioma_original == 'en':
+            titulo_processado, custo_trad_titulo = AIServices.traduzir_texto(titulo, 'Inglês')
+            conteudo_processado, custo_trad_conteudo = AIServices.traduzir_texto(conteudo, 'Inglês')
+            custo_total += custo_trad_titulo + custo_trad_conteudo
+        else:
+            titulo_processado = titulo
+            conteudo_processado = conteudo
+        
+        titulo_refinado, custo_refino = AIServices.melhorar_titulo(titulo_processado)
+        conteudo_reescrito, custo_reescrita = AIServices.reescrever_legenda(conteudo_processado)
+        categoria_ia, custo_categoria = AIServices.categorizar_noticia(titulo_refinado, conteudo_reescrito)
+        custo_total += custo_refino + custo_reescrita + custo_categoria
+        
+        resultado = {
+            "titulo_refinado": titulo_refinado,
+            "conteudo_reescrito": conteudo_reescrito,
+            "categoria_ia": categoria_ia
+        }
+        
+        if incluir_hashtags:
+            resultado["hashtags"], custo_hashtags = AIServices.gerar_hashtags(f"{titulo_refinado} {conteudo_reescrito}")
+            custo_total += custo_hashtags
+        
+        return resultado, custo_total
+    
+    @staticmethod
+    def enriquecer_noticia(titulo, conteudo, idioma_original='pt', incluir_hashtags=False):
+        """
+        Gera título refinado, legenda reescrita, categoria e (opcionalmente) hashtags.
+        Com enriquecimento_unificado, tudo sai de uma única chamada com resposta JSON;
+        campos ausentes ou inválidos são refeitos com o método individual correspondente.
+        Retorna (dict, custo).
+        """
+        if not config_snapshot().get("enriquecimento_unificado", True):
+            return AIServices._enriquecer_sequencial(titulo, conteudo, idioma_original, incluir_hashtags)
+        
+        instrucao_idioma = "O texto original está em inglês: traduza tudo para o Português do Brasil. " if idioma_original == 'en' else ""
+        campo_hashtags = ',\n  "hashtags": "as 3 hashtags mais relevantes em português do Brasil, separadas por espaço, começando com # (nada de genéricas como #noticia ou #brasil)"' if incluir_hashtags else ""
+        
+        prompt = f"""Aja como editor e copywriter sênior da página @noticiasbr.ai. {instrucao_idioma}A partir do título e do artigo abaixo, produza o conteúdo do post em Português do Brasil.
+
+Responda APENAS com um objeto JSON neste formato:
+{{
+  "titulo": "título refinado, claro e atraente, com pontuação corrigida",
+  "resumo": "legenda de Instagram magnética e de fácil leitura: um parágrafo de resumo (máx 250 palavras), sem marcadores como '1.' ou '-'",
+  "gancho": "uma frase ou pergunta final curta e provocativa",
+  "categoria": "exatamente uma destas: {', '.join(CATEGORIAS_PERMITIDAS)}"{campo_hashtags}
+}}
+
+Título original: "{titulo}"
+
+Artigo original:
+---
+{ajustar("Enriquecimento Unificado", conteudo) if conteudo else "Conteúdo não disponível"}
+---
+
+JSON:"""
+        
+        resposta, custo_total = AIServices._chamar_gemini(prompt, "Enriquecimento Unificado")
+        dados = AIServices._extrair_json(resposta)
+        if not isinstance(dados, dict):
+            dados = {}
+        
+        def texto_valido(chave):
+            valor = dados.get(chave)
+            return valor.strip() if isinstance(valor, str) and valor.strip() else None
+        
+        resultado = {}
+        campos_refeitos = []
+        traducoes = {}
+        
+        def traduzido(chave, texto):
+            # Traduz no máximo uma vez cada texto usado pelos campos refeitos
+            nonlocal custo_total
+            if idioma_original != 'en':
+                return texto
+            if chave not in traducoes:
+                traducoes[chave], custo = AIServices.traduzir_texto(texto, 'Inglês')
+                custo_total += custo
+            return traducoes[chave]
+        
+        titulo_refinado = texto_valido("titulo")
+        if titulo_refinado:
+            resultado["titulo_refinado"] = titulo_refinado.replace('"', '')
+        else:
+            campos_refeitos.append("titulo")
+            resultado["titulo_refinado"], custo = AIServices.melhorar_titulo(traduzido("titulo", titulo))
+            custo_total += custo
+        
+        resumo, gancho = texto_valido("resumo"), texto_valido("gancho")
+        if resumo and gancho:
+            resultado["conteudo_reescrito"] = AIServices._formatar_legenda(resumo, gancho)
+        else:
+            campos_refeitos.append("legenda")
+            resultado["conteudo_reescrito"], custo = AIServices.reescrever_legenda(traduzido("conteudo", conteudo))
+            custo_total += custo
+        
+        categoria = texto_valido("categoria")
+        if categoria in CATEGORIAS_PERMITIDAS:
+            resultado["categoria_ia"] = categoria
+        else:
+            campos_refeitos.append("categoria")
+            resultado["categoria_ia"], custo = AIServices.categorizar_noticia(resultado["titulo_refinado"], resultado["conteudo_reescrito"])
+            custo_total += custo
+        
+        if incluir_hashtags:
+            hashtags = texto_valido("hashtags")
+            if hashtags and all(tag.startswith('#') for tag in hashtags.split()):
+                resultado["hashtags"] = hashtags
+            else:
+                campos_refeitos.append("hashtags")
+                resultado["hashtags"], custo = AIServices.gerar_hashtags(f"{resultado['titulo_refinado']} {resultado['conteudo_reescrito']}")
+                custo_total += custo
+        
+        if campos_refeitos:
+            logging.warning(f"[IA - Enriquecimento] Campos refeitos individualmente: {', '.join(campos_refeitos)}")
+        
+        return resultado, custo_total
@@ -16,10 +16,22 @@ print("🚀 INICIANDO BOT DE INSTAGRAM...")
 try:
     from config import setup_logging, carregar_config, salvar_config
     from database import setup_database, Database
-    from ai_services import AIServices, custo_sessao_atual
+    from ai_services import custo_sessao_atual
     from news_apis import NewsAPIs
     from instagram import InstagramManager
-    from media import MediaProcessor
+    from filtros import criar_cadeia_noticias, preparar_contexto, enfileirar, obter_estatisticas_filtros
+    from enriquecimento import executor_enriquecimento, enriquecer_contexto, legenda_do_item, preencher_legendas_pendentes
+    from resiliencia_llm import resiliencia_llm
+    from classificador_relevancia import treinar_classificador, obter_estatisticas_classificador
+    from orcamento_prompt import obter_estatisticas_prompts
+    from quase_duplicatas import obter_indice
+    from indice_semantico import obter_indice_semantico
+    from http_client import cliente_http
+    from cache_imagens import cache_imagens
+    from layout_texto import layout_texto
+    from renderizacao import renderizar_pendentes, arte_do_item, obter_estatisticas_renderizacao, servico_renderizacao
+    from cache_busca import cache_busca
+    from limitador_cota import limitador_cota
     print("✅ Todos os módulos importados com sucesso!")
 except Exception as e:
     print(f"❌ Erro ao importar módulos: {e}")
@@ -34,93 +46,22 @@ scheduler = BackgroundScheduler(daemon=True, timezone='America/Sao_Paulo')
 
 def processar_noticias():
     """Processa novas notícias encontradas pelas APIs"""
-    noticias = NewsAPIs.buscar_todas_noticias()
+    noticias, cursores = NewsAPIs.buscar_noticias_com_cursores()
     
-    for noticia in noticias:
-        custo_total_noticia = 0.0
-        
-        # Extrai dados básicos
-        titulo_bruto = noticia.get("title")
-        url_imagem = noticia.get("image")
-        
-        if not titulo_bruto or not MediaProcessor.validar_imagem(url_imagem):
-            continue
-        
-        # Remove fonte do título se presente
-        titulo_original = titulo_bruto.rsplit(" - ", 1)[0] if " - " in titulo_bruto else titulo_bruto
-        conteudo_original = noticia.get("content") or noticia.get("description", "")
-        
-        # Gera hash semântico para detectar duplicatas
-        semantic_hash, custo_hash = AIServices.gerar_titulo_canonico(titulo_original, conteudo_original)
-        custo_total_noticia += custo_hash
-        
-        # Prepara dados para histórico
-        dados_para_historico = {
-            "titulo_original": titulo_original,
-            "conteudo_original": conteudo_original,
-            "idioma_original": noticia['idioma_original'],
-            "api_fonte": noticia['api_fonte'],
-            "custo_usd": custo_total_noticia,
-            "semantic_hash": semantic_hash
-        }
-        
-        # Verifica duplicata por título primeiro
-        if Database.verificar_titulo_duplicado(titulo_original):
-            dados_para_historico.update({"titulo_refinado": f"[DUPLICATA TÍTULO] {titulo_original[:150]}"})
-            Database.registrar_no_historico(dados_para_historico, "REJEITADA", "Título já processado")
-            logging.info(f"[FILTRO] Notícia ignorada - título já processado: {titulo_original[:100]}...")
-            continue
-        
-        # Verifica duplicata semântica
-        if Database.verificar_duplicata_semantica(semantic_hash):
-            dados_para_historico.update({"titulo_refinado": f"[DUPLICATA] {titulo_original[:150]}"})
-            Database.registrar_no_historico(dados_para_historico, "REJEITADA", "Duplicata Semântica")
-            continue
-        
-        # Filtra relevância
-        veredito, custo_filtro = AIServices.filtrar_relevancia(titulo_original, conteudo_original)
-        custo_total_noticia += custo_filtro
-        dados_para_historico["custo_usd"] = custo_total_noticia
-        
-        if veredito != "APROVADA":
-            dados_para_historico.update({
-                "titulo_refinado": f"[REJEITADO] {titulo_original[:150]}",
-                "conteudo_reescrito": ""
-            })
-            Database.registrar_no_historico(dados_para_historico, "REJEITADA", veredito)
-            continue
-        
-        # Traduz se necessário
-        if noticia['idioma_original'] == 'en':
-            titulo_processado, custo_trad_titulo = AIServices.traduzir_texto(titulo_original, 'Inglês')
-            conteudo_processado, custo_trad_conteudo = AIServices.traduzir_texto(conteudo_original, 'Inglês')
-            custo_total_noticia += custo_trad_titulo + custo_trad_conteudo
-        else:
-            titulo_processado = titulo_original
-            conteudo_processado = conteudo_original
-        
-        # Refina título
-        titulo_refinado, custo_refino = AIServices.melhorar_titulo(titulo_processado)
-        custo_total_noticia += custo_refino
-        dados_para_historico.update({"titulo_refinado": titulo_refinado})
-        
-        # Reescreve conteúdo e categoriza
-        conteudo_reescrito, custo_reescrita = AIServices.reescrever_legenda(conteudo_processado)
-        categoria_ia, custo_categoria = AIServices.categorizar_noticia(titulo_refinado, conteudo_reescrito)
-        custo_total_noticia += custo_reescrita + custo_categoria
-        
-        # Finaliza dados
-        dados_para_historico.update({
-            "conteudo_reescrito": conteudo_reescrito,
-            "categoria_ia": categoria_ia,
-            "custo_usd": custo_total_noticia,
-            "url_imagem": url_imagem,
-            "fonte": noticia.get("source", {}).get("name"),
-            "descricao": noticia.get("description")
-        })
-        
-        # Adiciona na fila
-        Database.adicionar_na_fila(dados_para_historico)
+    # Filtros baratos primeiro; só chegam aqui notícias aprovadas em todas as etapas
+    contextos = [preparar_contexto(noticia) for noticia in noticias]
+    aprovados = criar_cadeia_noticias().executar(contextos)
+    
+    # Enriquecimento em paralelo; a fila recebe as notícias na ordem original
+    executor_enriquecimento.executar("global", aprovados, enriquecer_contexto, enfileirar)
+    obter_indice_semantico().salvar()
+    
+    # Só agora os cursores avançam: as notícias desta busca já estão na fila, foram descartadas
+    # ou ficaram adiadas no banco (noticias_adiadas), de onde voltam no próximo ciclo
+    NewsAPIs.avancar_cursores(cursores)
+    
+    # Gera já as imagens dos itens que acabaram de entrar na fila
+    renderizar_pendentes()
 
 def postar_da_fila(item_id=None):
     """Posta próximo item da fila ou item específico"""
@@ -142,24 +83,12 @@ def postar_da_fila(item_id=None):
     item = dict(item_row) if hasattr(item_row, 'keys') else item_row
     logging.info(f"--- [POST] Iniciando processo de postagem para: {item['titulo_refinado']} ---")
     
-    # Cria imagem
-    caminho_imagem = MediaProcessor.criar_imagem_post(
-        item['titulo_refinado'], 
-        item['url_imagem'], 
-        item['categoria_ia']
-    )
+    # Usa a imagem gerada antecipadamente; só renderiza aqui se ela não estiver pronta
+    caminho_imagem = arte_do_item(item)
     
     if caminho_imagem:
-        # Prepara legenda
-        conteudo_curado = item.get("conteudo_reescrito") or "Sem conteúdo adicional."
-        fonte = item.get("fonte", "Fonte não informada")
-        categoria_ia = item.get("categoria_ia", "noticias")
-        
-        # Gera hashtags
-        hashtags_ia, custo_hashtags = AIServices.gerar_hashtags(f"{item['titulo_refinado']} {conteudo_curado}")
-        item['custo_usd'] += custo_hashtags
-        
-        legenda = f"siga: @noticiasbr.ai | {conteudo_curado}\n\nFonte: {fonte}\n\n#{categoria_ia.replace(' ','')} {hashtags_ia}"
+        # Legenda gerada na entrada da fila; postar não depende da IA
+        legenda = legenda_do_item(item)
         
         # Posta
         sucesso = instagram.postar_foto(caminho_imagem, legenda)
@@ -219,6 +148,12 @@ def limpar_fila():
     logging.info("Fila de postagens foi limpa manualmente.")
     return redirect(url_for('index'))
 
+@app.route("/retreinar_classificador", methods=["POST"])
+def retreinar_classificador():
+    logging.info("Retreino do classificador de relevância solicitado...")
+    threading.Thread(target=treinar_classificador).start()
+    return redirect(url_for('index'))
+
 @app.route("/status_update")
 def status_update():
     cfg = carregar_config()
@@ -229,6 +164,18 @@ def status_update():
     status_json["log_recente"] = list(Database.pegar_log_recente())
     status_json["custo_sessao"] = custo_sessao_atual
     status_json["custo_total"] = Database.obter_custo_total()
+    status_json["http"] = cliente_http.estatisticas()
+    status_json["cache_busca"] = cache_busca.estatisticas()
+    status_json["cota_apis"] = limitador_cota.estatisticas()
+    status_json["filtros"] = obter_estatisticas_filtros()
+    status_json["enriquecimento"] = executor_enriquecimento.estatisticas()
+    status_json["llm"] = resiliencia_llm.estatisticas()
+    status_json["classificador"] = obter_estatisticas_classificador()
+    status_json["prompts"] = obter_estatisticas_prompts()
+    status_json["cache_imagens"] = cache_imagens.estatisticas()
+    status_json["layout_texto"] = layout_texto.estatisticas()
+    status_json["renderizacao"] = obter_estatisticas_renderizacao()
+    status_json["servico_renderizacao"] = servico_renderizacao.estatisticas()
     
     try:
         status_json["proxima_busca"] = scheduler.get_job('buscador_noticias').next_run_time.strftime('%H:%M:%S')
@@ -329,6 +276,8 @@ if __name__ == "__main__":
     
     print("📦 Configurando banco de dados...")
     setup_database()
+    obter_indice()
+    obter_indice_semantico()
     
     print("🔧 Carregando configurações...")
     config = carregar_config()
@@ -385,6 +334,22 @@ if __name__ == "__main__":
             id='postador_fila'
         )
         
+        # Completa legendas de itens que entraram na fila sem elas
+        scheduler.add_job(
+            preencher_legendas_pendentes,
+            'interval',
+            minutes=config.get("intervalo_backfill_legendas", 10),
+            id='backfill_legendas'
+        )
+        
+        # Gera as imagens dos itens da fila que ainda não têm arte e limpa as antigas
+        scheduler.add_job(
+            renderizar_pendentes,
+            'interval',
+            minutes=config.get("intervalo_render_antecipado", 5),
+            id='render_antecipado'
+        )
+        
         print("⏰ Agendamento configurado. Primeira busca acontecerá no intervalo programado.")
         # Inicia apenas o scheduler, sem busca inicial
         scheduler.start()
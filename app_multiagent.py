@@ -18,8 +18,20 @@ print("🚀 INICIANDO SISTEMA MULTI-AGENTE...")
 # Importa os módulos
 try:
     from config import setup_logging, carregar_config, salvar_config, listar_agentes, criar_novo_agente
+    from database import setup_database
     from agent_manager import agent_manager
     from ai_services import custo_sessao_atual
+    from http_client import cliente_http
+    from cache_imagens import cache_imagens
+    from layout_texto import layout_texto
+    from renderizacao import obter_estatisticas_renderizacao, servico_renderizacao
+    from cache_busca import cache_busca
+    from limitador_cota import limitador_cota
+    from filtros import obter_estatisticas_filtros
+    from enriquecimento import executor_enriquecimento
+    from resiliencia_llm import resiliencia_llm
+    from classificador_relevancia import treinar_classificador, obter_estatisticas_classificador
+    from orcamento_prompt import obter_estatisticas_prompts
     print("✅ Todos os módulos importados com sucesso!")
 except Exception as e:
     print(f"❌ Erro ao importar módulos: {e}")
@@ -147,6 +159,14 @@ def postar_manual_agente(agent_id):
     
     return redirect(url_for('visualizar_agente', agent_id=agent_id))
 
+@app.route("/retreinar_classificador/<agent_id>", methods=['POST'])
+def retreinar_classificador_agente(agent_id):
+    """Retreina o classificador de relevância com o histórico do agente"""
+    import threading
+    threading.Thread(target=treinar_classificador, args=(agent_id,)).start()
+    logging.info(f"[AGENT-{agent_id}] Retreino do classificador solicitado")
+    return redirect(url_for('visualizar_agente', agent_id=agent_id))
+
 @app.route("/reprovar_item/<agent_id>/<item_id>", methods=['POST'])
 def reprovar_item_agente(agent_id, item_id):
     """Reprova um item específico de um agente"""
@@ -173,7 +193,19 @@ def status_sistema():
         'agentes_ativos': len(status_agentes),
         'config_global': config_global,
         'agentes': status_agentes,
-        'custo_sessao': custo_sessao_atual
+        'custo_sessao': custo_sessao_atual,
+        'http': cliente_http.estatisticas(),
+        'cache_busca': cache_busca.estatisticas(),
+        'cota_apis': limitador_cota.estatisticas(),
+        'filtros': obter_estatisticas_filtros(),
+        'enriquecimento': executor_enriquecimento.estatisticas(),
+        'llm': resiliencia_llm.estatisticas(),
+        'classificador': obter_estatisticas_classificador(),
+        'prompts': obter_estatisticas_prompts(),
+        'cache_imagens': cache_imagens.estatisticas(),
+        'layout_texto': layout_texto.estatisticas(),
+        'renderizacao': obter_estatisticas_renderizacao(),
+        'servico_renderizacao': servico_renderizacao.estatisticas()
     })
 
 @app.route("/config_global")
@@ -206,6 +238,9 @@ if __name__ == "__main__":
     print("⚙️ Configurando logging...")
     setup_logging()
     
+    print("📦 Configurando banco de dados...")
+    setup_database()
+    
     print("🔧 Carregando configurações...")
     config = carregar_config()
     
@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+import logging
+from config import carregar_config
+
+class _BuscaEmAndamento:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.erro = None
+
+class CacheBusca:
+    """
+    Cache de respostas das APIs de notícias compartilhado por todos os agentes.
+    Requisições idênticas simultâneas esperam a mesma chamada (single-flight)
+    e as respostas ficam válidas por cache_busca_ttl segundos.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}  # {chave: (momento, valor)}
+        self._em_andamento = {}  # {chave: _BuscaEmAndamento}
+        self._acertos = 0
+        self._falhas = 0
+        self._coalescidas = 0
+    
+    def obter(self, chave, carregar):
+        """
+        Retorna uma cópia da resposta em cache para a chave ou chama carregar().
+        Erros não são guardados em cache e são repassados a todos que esperavam.
+        """
+        ttl = float(carregar_config().get("cache_busca_ttl", 300))
+        agora = time.monotonic()
+        
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and agora - entrada[0] < ttl:
+                self._acertos += 1
+                return copy.deepcopy(entrada[1])
+            
+            busca = self._em_andamento.get(chave)
+            lider = busca is None
+            if lider:
+                busca = _BuscaEmAndamento()
+                self._em_andamento[chave] = busca
+                self._falhas += 1
+            else:
+                self._coalescidas += 1
+        
+        if lider:
+            try:
+                busca.valor = carregar()
+                with self._lock:
+                    self._remover_expiradas(ttl)
+                    if ttl > 0:
+                        self._entradas[chave] = (time.monotonic(), busca.valor)
+            except Exception as e:
+                busca.erro = e
+            finally:
+                with self._lock:
+                    del self._em_andamento[chave]
+                busca.evento.set()
+        else:
+            logging.info("[CACHE] Aguardando busca idêntica já em andamento...")
+            busca.evento.wait()
+        
+        if busca.erro is not None:
+            raise busca.erro
+        return copy.deepcopy(busca.valor)
+    
+    def _remover_expiradas(self, ttl):
+        agora = time.monotonic()
+        for chave in [c for c, (momento, _) in self._entradas.items() if agora - momento >= ttl]:
+            del self._entradas[chave]
+    
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+    
+    def estatisticas(self):
+        with self._lock:
+            total = self._acertos + self._falhas + self._coalescidas
+            return {
+                "acertos": self._acertos,
+                "falhas": self._falhas,
+                "coalescidas": self._coalescidas,
+                "entradas": len(self._entradas),
+                "taxa_acerto": round((self._acertos + self._coalescidas) / total, 3) if total else 0.0
+            }
+
+# Instância global compartilhada entre agentes
+cache_busca = CacheBusca()
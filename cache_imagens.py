@@ -0,0 +1,211 @@
+import os
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import logging
+from config import CACHE_IMAGENS_DIR, carregar_config, listar_agentes, get_agent_db_path
+from http_client import cliente_http
+from database import Database
+
+class ImagemInvalida(Exception):
+    """Download interrompido: tipo, tamanho ou dimensões fora do aceito"""
+
+class CacheImagens:
+    """
+    Cache em disco das imagens das notícias, endereçado pelo SHA-256 do conteúdo.
+    Um índice SQLite liga cada URL ao seu conteúdo e guarda o último acesso
+    para o despejo LRU quando o tamanho total passa de cache_imagens_max_mb.
+    Arquivos são gravados em um temporário e renomeados (escrita atômica).
+    """
+    
+    def __init__(self, diretorio=CACHE_IMAGENS_DIR):
+        self._diretorio = diretorio
+        self._conn = None
+        self._lock = threading.Lock()
+        self._estatisticas = {"acertos": 0, "downloads": 0, "erros": 0, "despejos": 0}
+    
+    def _conexao(self):
+        if self._conn is None:
+            os.makedirs(self._diretorio, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self._diretorio, "indice.db"), check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS arquivos (
+                    sha256 TEXT PRIMARY KEY,
+                    tamanho INTEGER,
+                    ultimo_acesso REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_acesso ON arquivos (ultimo_acesso)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_sha ON urls (sha256)")
+            self._conn.commit()
+        return self._conn
+    
+    def caminho_arquivo(self, sha256):
+        return os.path.join(self._diretorio, sha256[:2], sha256)
+    
+    def _consultar(self, url):
+        """Caminho em cache da URL (atualizando o acesso) ou None"""
+        with self._lock:
+            conn = self._conexao()
+            row = conn.execute("SELECT sha256 FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            caminho = self.caminho_arquivo(row[0])
+            if not os.path.exists(caminho):
+                conn.execute("DELETE FROM arquivos WHERE sha256 = ?", (row[0],))
+                conn.execute("DELETE FROM urls WHERE sha256 = ?", (row[0],))
+                conn.commit()
+                return None
+            conn.execute("UPDATE arquivos SET ultimo_acesso = ? WHERE sha256 = ?", (time.time(), row[0]))
+            conn.commit()
+            self._estatisticas["acertos"] += 1
+            return caminho
+    
+    def guardar(self, url, conteudo):
+        """Grava o conteúdo (se ainda não existir) e associa a URL a ele. Retorna o caminho."""
+        sha256 = hashlib.sha256(conteudo).hexdigest()
+        caminho = self.caminho_arquivo(sha256)
+        
+        if not os.path.exists(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            fd, caminho_tmp = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(conteudo)
+                os.replace(caminho_tmp, caminho)
+            except OSError:
+                if os.path.exists(caminho_tmp):
+                    os.remove(caminho_tmp)
+                raise
+        
+        with self._lock:
+            conn = self._conexao()
+            conn.execute("INSERT OR REPLACE INTO arquivos (sha256, tamanho, ultimo_acesso) VALUES (?, ?, ?)",
+                         (sha256, len(conteudo), time.time()))
+            conn.execute("INSERT OR REPLACE INTO urls (url, sha256) VALUES (?, ?)", (url, sha256))
+            conn.commit()
+            self._despejar(conn, sha256)
+        return caminho
+    
+    @staticmethod
+    def _em_uso():
+        """SHA-256 das imagens referenciadas pela fila global ou de algum agente"""
+        caminhos = Database.pegar_imagens_cache_da_fila()
+        for agente in listar_agentes():
+            if os.path.exists(get_agent_db_path(agente["id"])):
+                caminhos |= Database.pegar_imagens_cache_da_fila(agente["id"])
+        return {os.path.basename(caminho) for caminho in caminhos}
+    
+    def _despejar(self, conn, preservar):
+        """
+        Remove os arquivos menos usados até o total ficar abaixo do limite.
+        Imagens de itens ainda na fila são mantidas: a arte deles depende delas.
+        """
+        limite = float(carregar_config().get("cache_imagens_max_mb", 500)) * 1024 * 1024
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM arquivos").fetchone()[0]
+        if total <= limite:
+            return
+        
+        protegidos = self._em_uso() | {preservar}
+        for sha256, tamanho in conn.execute("SELECT sha256, tamanho FROM arquivos ORDER BY ultimo_acesso ASC").fetchall():
+            if total <= limite:
+                break
+            if sha256 in protegidos:
+                continue
+            try:
+                os.remove(self.caminho_arquivo(sha256))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"[IMAGEM] Não foi possível remover {sha256} do cache: {e}")
+                continue
+            conn.execute("DELETE FROM arquivos WHERE sha256 = ?", (sha256,))
+            conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+            total -= tamanho
+            self._estatisticas["despejos"] += 1
+        conn.commit()
+    
+    def _baixar(self, url, timeout, limite_bytes, verificar_parcial):
+        """
+        Baixa em streaming, recusando pelo Content-Type/Content-Length e
+        interrompendo ao passar de limite_bytes. verificar_parcial(bytes) é
+        chamada a cada bloco até retornar True (ou levantar ImagemInvalida).
+        """
+        with cliente_http.get(url, timeout=timeout or cliente_http.timeout(leitura=10), stream=True) as response:
+            response.raise_for_status()
+            
+            tipo = response.headers.get("Content-Type", "")
+            if tipo and not tipo.lower().startswith(("image/", "application/octet-stream")):
+                raise ImagemInvalida(f"Content-Type {tipo}")
+            tamanho = response.headers.get("Content-Length")
+            if limite_bytes and tamanho and tamanho.isdigit() and int(tamanho) > limite_bytes:
+                raise ImagemInvalida(f"{int(tamanho) // 1024} KB acima do limite")
+            
+            conteudo = bytearray()
+            verificado = verificar_parcial is None
+            for bloco in response.iter_content(chunk_size=64 * 1024):
+                conteudo.extend(bloco)
+                if limite_bytes and len(conteudo) > limite_bytes:
+                    raise ImagemInvalida(f"mais de {limite_bytes // 1024} KB")
+                if not verificado:
+                    verificado = verificar_parcial(bytes(conteudo)) is True
+            
+            if not verificado and verificar_parcial(bytes(conteudo)) is not True:
+                raise ImagemInvalida("cabeçalho da imagem ilegível")
+            return bytes(conteudo)
+    
+    def obter(self, url, timeout=None, limite_bytes=None, verificar_parcial=None):
+        """
+        Caminho local da imagem da URL, baixando só na primeira vez.
+        Levanta ImagemInvalida ou o erro do download.
+        """
+        caminho = self._consultar(url)
+        if caminho:
+            return caminho
+        
+        try:
+            conteudo = self._baixar(url, timeout, limite_bytes, verificar_parcial)
+        except Exception:
+            with self._lock:
+                self._estatisticas["erros"] += 1
+            raise
+        
+        with self._lock:
+            self._estatisticas["downloads"] += 1
+        return self.guardar(url, conteudo)
+    
+    def contadores(self):
+        with self._lock:
+            return dict(self._estatisticas)
+    
+    def mesclar(self, contadores):
+        """Soma contadores vindos de outro processo (pool de renderização)"""
+        with self._lock:
+            for campo, valor in contadores.items():
+                self._estatisticas[campo] = self._estatisticas.get(campo, 0) + valor
+    
+    def estatisticas(self):
+        with self._lock:
+            resultado = dict(self._estatisticas)
+            try:
+                arquivos, total = self._conexao().execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM arquivos").fetchone()
+            except sqlite3.Error:
+                arquivos, total = 0, 0
+        consultas = resultado["acertos"] + resultado["downloads"]
+        resultado.update({
+            "arquivos": arquivos,
+            "tamanho_mb": round(total / (1024 * 1024), 1),
+            "taxa_acerto": round(resultado["acertos"] / consultas, 3) if consultas else 0.0
+        })
+        return resultado
+
+# Instância global compartilhada
+cache_imagens = CacheImagens()
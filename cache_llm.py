@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import LLM_CACHE_PATH
+
+class CacheLLM:
+    """
+    Cache persistente de respostas do LLM endereçado por (modelo, hash do prompt).
+    Uma LRU em memória atende os acertos repetidos; o SQLite guarda as respostas
+    entre reinícios, limitado por TTL e número máximo de entradas.
+    """
+    
+    def __init__(self, caminho=LLM_CACHE_PATH):
+        self._caminho = caminho
+        self._conn = None
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()  # {chave: (resposta, custo_usd, criado_em)}
+        self._insercoes = 0
+    
+    def _conexao(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._caminho, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    modelo TEXT,
+                    funcao TEXT,
+                    resposta TEXT,
+                    custo_usd REAL,
+                    criado_em REAL,
+                    ultimo_acesso REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (ultimo_acesso)")
+            self._conn.commit()
+        return self._conn
+    
+    @staticmethod
+    def chave(modelo, prompt):
+        return hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+    
+    def obter(self, chave, ttl_segundos, max_memoria):
+        """Retorna (resposta, custo_original_usd) ou None"""
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                if agora - entrada[2] < ttl_segundos:
+                    self._memoria.move_to_end(chave)
+                    return entrada[0], entrada[1]
+                del self._memoria[chave]
+            
+            try:
+                conn = self._conexao()
+                row = conn.execute("SELECT resposta, custo_usd, criado_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+                if row is None or agora - row[2] >= ttl_segundos:
+                    return None
+                conn.execute("UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"[CACHE IA] ERRO ao ler cache: {e}")
+                return None
+            
+            self._guardar_memoria(chave, (row[0], row[1], row[2]), max_memoria)
+            return row[0], row[1]
+    
+    def guardar(self, chave, modelo, funcao, resposta, custo_usd, ttl_segundos, max_entradas, max_memoria):
+        agora = time.time()
+        with self._lock:
+            self._guardar_memoria(chave, (resposta, custo_usd, agora), max_memoria)
+            try:
+                conn = self._conexao()
+                conn.execute("""
+                    INSERT OR REPLACE INTO respostas (chave, modelo, funcao, resposta, custo_usd, criado_em, ultimo_acesso)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (chave, modelo, funcao, resposta, custo_usd, agora, agora))
+                
+                # Remoção das expiradas e despejo LRU em lote a cada 100 inserções
+                self._insercoes += 1
+                if self._insercoes % 100 == 0:
+                    conn.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - ttl_segundos,))
+                    conn.execute("""
+                        DELETE FROM respostas WHERE chave IN (
+                            SELECT chave FROM respostas ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (max_entradas,))
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"[CACHE IA] ERRO ao gravar cache: {e}")
+    
+    def _guardar_memoria(self, chave, entrada, max_memoria):
+        self._memoria[chave] = entrada
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > max_memoria:
+            self._memoria.popitem(last=False)
+
+# Instância global compartilhada
+cache_llm = CacheLLM()
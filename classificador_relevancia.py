@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import threading
+import logging
+import numpy as np
+from config import DB_PATH, carregar_config, get_agent_db_path
+from database import Database
+from quase_duplicatas import normalizar_texto
+
+DIMENSOES = 2 ** 18
+
+# Estatísticas de uso por escopo: {escopo: {...}}
+estatisticas_classificador = {}
+_estatisticas_lock = threading.Lock()
+
+def _termos(titulo, conteudo):
+    """Índices (hash) dos unigramas e bigramas distintos do título e do início do conteúdo"""
+    tokens = normalizar_texto(titulo, conteudo, tamanho_lead=700).split()
+    termos = set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+    return np.unique(np.fromiter((zlib.crc32(t.encode("utf-8")) % DIMENSOES for t in termos),
+                                 dtype=np.int64, count=len(termos)))
+
+class ClassificadorRelevancia:
+    """
+    Naive Bayes multinomial binarizado sobre n-gramas com hashing.
+    Classe 1 = aprovada pela IA, classe 0 = reprovada.
+    """
+    
+    def __init__(self, log_prob, log_prior, metricas=None):
+        self.log_prob = log_prob
+        self.log_prior = log_prior
+        self.metricas = metricas or {}
+    
+    @classmethod
+    def _ajustar(cls, termos, rotulos, alfa=1.0):
+        contagens = np.zeros((2, DIMENSOES), dtype=np.float64)
+        for indices, rotulo in zip(termos, rotulos):
+            contagens[rotulo, indices] += 1
+        log_prob = np.log(contagens + alfa) - np.log(contagens.sum(axis=1, keepdims=True) + alfa * DIMENSOES)
+        frequencias = np.bincount(rotulos, minlength=2) + 1
+        return cls(log_prob.astype(np.float32), np.log(frequencias / frequencias.sum()))
+    
+    def _probabilidade(self, indices):
+        pontuacao = self.log_prior + self.log_prob[:, indices].sum(axis=1)
+        return float(1.0 / (1.0 + np.exp(pontuacao[0] - pontuacao[1])))
+    
+    def probabilidade(self, titulo, conteudo):
+        """Probabilidade estimada de a IA aprovar a notícia"""
+        return self._probabilidade(_termos(titulo, conteudo))
+    
+    @classmethod
+    def treinar(cls, exemplos, limiar):
+        """
+        Treina com todos os exemplos. As métricas vêm de uma validação com 20%
+        separados: cobertura (fração decidida localmente) e discordância com a IA.
+        """
+        termos = [_termos(titulo, conteudo) for titulo, conteudo, _ in exemplos]
+        rotulos = np.array([rotulo for _, _, rotulo in exemplos], dtype=np.int64)
+        
+        ordem = np.random.RandomState(0).permutation(len(exemplos))
+        corte = int(len(ordem) * 0.8)
+        treino, teste = ordem[:corte], ordem[corte:]
+        validacao = cls._ajustar([termos[i] for i in treino], rotulos[treino])
+        decididas = discordancias = 0
+        for i in teste:
+            p = validacao._probabilidade(termos[i])
+            if p >= limiar or p <= 1 - limiar:
+                decididas += 1
+                discordancias += int((p >= limiar) != bool(rotulos[i]))
+        
+        modelo = cls._ajustar(termos, rotulos)
+        modelo.metricas = {
+            "exemplos": len(exemplos),
+            "aprovadas": int(rotulos.sum()),
+            "reprovadas": int(len(rotulos) - rotulos.sum()),
+            "validacao_cobertura": round(decididas / len(teste), 3) if len(teste) else 0.0,
+            "validacao_discordancia": round(discordancias / decididas, 3) if decididas else 0.0,
+            "treinado_em": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        return modelo
+    
+    def salvar(self, caminho):
+        caminho_tmp = caminho + ".tmp.npz"
+        np.savez_compressed(caminho_tmp, log_prob=self.log_prob, log_prior=self.log_prior,
+                            metricas=np.array(json.dumps(self.metricas)))
+        os.replace(caminho_tmp, caminho)
+    
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            return cls(dados["log_prob"], dados["log_prior"], json.loads(str(dados["metricas"])))
+
+def caminho_modelo(agent_id=None):
+    caminho_db = get_agent_db_path(agent_id) if agent_id else DB_PATH
+    return os.path.splitext(caminho_db)[0] + "_classificador.npz"
+
+class PreClassificador:
+    """
+    Decide a relevância localmente quando o modelo está confiante; caso
+    contrário devolve None e a notícia segue para a IA. Uma amostra das
+    decisões locais também é enviada à IA para medir a discordância.
+    """
+    
+    def __init__(self, escopo, modelo, limiar, amostra_auditoria):
+        self.escopo = escopo
+        self.modelo = modelo
+        self.limiar = limiar
+        self.amostra_auditoria = amostra_auditoria
+    
+    def _contar(self, **valores):
+        with _estatisticas_lock:
+            stats = estatisticas_classificador.setdefault(self.escopo, {
+                "avaliadas": 0,
+                "aprovadas_local": 0,
+                "reprovadas_local": 0,
+                "enviadas_ia": 0,
+                "chamadas_evitadas": 0,
+                "auditadas": 0,
+                "discordancias": 0,
+                "taxa_discordancia": 0.0
+            })
+            for campo, valor in valores.items():
+                stats[campo] += valor
+            if stats["auditadas"]:
+                stats["taxa_discordancia"] = round(stats["discordancias"] / stats["auditadas"], 3)
+            if self.modelo:
+                stats["modelo"] = self.modelo.metricas
+    
+    def decidir(self, titulo, conteudo):
+        """Retorna (veredito_local ou None, auditar)"""
+        if self.modelo is None:
+            self._contar(avaliadas=1, enviadas_ia=1)
+            return None, False
+        
+        p = self.modelo.probabilidade(titulo, conteudo)
+        if self.limiar > p > 1 - self.limiar:
+            self._contar(avaliadas=1, enviadas_ia=1)
+            return None, False
+        
+        veredito = "APROVADA" if p >= self.limiar else "REPROVADA"
+        auditar = random.random() < self.amostra_auditoria
+        self._contar(avaliadas=1, aprovadas_local=int(veredito == "APROVADA"), reprovadas_local=int(veredito == "REPROVADA"),
+                     enviadas_ia=int(auditar), chamadas_evitadas=int(not auditar))
+        return veredito, auditar
+    
+    def registrar_auditoria(self, veredito_local, veredito_ia):
+        self._contar(auditadas=1, discordancias=int(veredito_local != veredito_ia))
+        if veredito_local != veredito_ia:
+            logging.info(f"[CLASSIFICADOR] {self.escopo}: local {veredito_local}, IA {veredito_ia}.")
+
+_modelos = {}  # {escopo: (mtime, modelo)}
+_modelos_lock = threading.Lock()
+
+def obter_classificador(agent_id=None):
+    """Pré-classificador do agente (ou global), recarregando o modelo se o arquivo mudou"""
+    cfg = carregar_config()
+    escopo = agent_id or "global"
+    modelo = None
+    
+    if cfg.get("classificador_ativo", True):
+        caminho = caminho_modelo(agent_id)
+        try:
+            mtime = os.stat(caminho).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        with _modelos_lock:
+            em_memoria = _modelos.get(escopo)
+            if mtime is not None and (em_memoria is None or em_memoria[0] != mtime):
+                try:
+                    _modelos[escopo] = (mtime, ClassificadorRelevancia.carregar(caminho))
+                    logging.info(f"[CLASSIFICADOR] Modelo de {escopo} carregado de {caminho}.")
+                except (OSError, ValueError, KeyError) as e:
+                    logging.error(f"[CLASSIFICADOR] ERRO ao carregar {caminho}: {e}")
+                    _modelos.pop(escopo, None)
+            elif mtime is None:
+                _modelos.pop(escopo, None)
+            if escopo in _modelos:
+                modelo = _modelos[escopo][1]
+    
+    return PreClassificador(escopo, modelo, float(cfg.get("classificador_limiar", 0.95)),
+                            float(cfg.get("classificador_amostra_auditoria", 0.05)))
+
+def treinar_classificador(agent_id=None):
+    """Treina a partir do histórico do agente (ou global) e grava o modelo. Retorna as métricas ou None."""
+    cfg = carregar_config()
+    escopo = agent_id or "global"
+    exemplos = Database.pegar_exemplos_relevancia(int(cfg.get("classificador_max_exemplos", 20000)), agent_id)
+    aprovadas = sum(rotulo for _, _, rotulo in exemplos)
+    minimo = int(cfg.get("classificador_min_exemplos", 200))
+    
+    if len(exemplos) < minimo or min(aprovadas, len(exemplos) - aprovadas) < minimo // 10:
+        logging.warning(f"[CLASSIFICADOR] {escopo}: exemplos insuficientes ({aprovadas} aprovadas, "
+                        f"{len(exemplos) - aprovadas} reprovadas; mínimo {minimo}). Modelo não treinado.")
+        return None
+    
+    inicio = time.perf_counter()
+    modelo = ClassificadorRelevancia.treinar(exemplos, float(cfg.get("classificador_limiar", 0.95)))
+    modelo.salvar(caminho_modelo(agent_id))
+    logging.info(f"[CLASSIFICADOR] {escopo}: treinado com {len(exemplos)} exemplos em {time.perf_counter() - inicio:.1f}s "
+                 f"(cobertura {modelo.metricas['validacao_cobertura']:.0%}, discordância {modelo.metricas['validacao_discordancia']:.1%}).")
+    return modelo.metricas
+
+def obter_estatisticas_classificador():
+    with _estatisticas_lock:
+        return {escopo: dict(stats) for escopo, stats in estatisticas_classificador.items()}
+
+if __name__ == "__main__":
+    # Uso: python classificador_relevancia.py [agent_id ...]  (sem argumentos treina o global)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    for alvo in sys.argv[1:] or [None]:
+        print(treinar_classificador(alvo))
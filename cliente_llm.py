@@ -0,0 +1,93 @@
+import threading
+import logging
+import google.generativeai as genai
+from http_client import cliente_http
+
+class RespostaLLM:
+    """Texto gerado e tokens consumidos (0 quando o backend não informa)"""
+    
+    def __init__(self, texto, tokens_entrada=0, tokens_saida=0):
+        self.texto = texto
+        self.tokens_entrada = tokens_entrada
+        self.tokens_saida = tokens_saida
+
+class BackendGemini:
+    """Modelo do Gemini configurado uma vez e reutilizado entre chamadas"""
+    
+    requer_chave = True
+    
+    def __init__(self, modelo, cfg):
+        # A chave do SDK é global ao processo; só é reconfigurada quando muda
+        genai.configure(api_key=cfg.get("google_api_key"))
+        self._model = genai.GenerativeModel(modelo)
+    
+    def gerar(self, prompt):
+        response = self._model.generate_content(prompt)
+        tokens_entrada = tokens_saida = 0
+        if hasattr(response, 'usage_metadata'):
+            tokens_entrada = response.usage_metadata.prompt_token_count
+            tokens_saida = response.usage_metadata.candidates_token_count
+        return RespostaLLM(response.text.strip(), tokens_entrada, tokens_saida)
+
+class BackendStub:
+    """
+    Servidor local que imita o Gemini em testes e benchmarks de carga.
+    Recebe POST {"modelo", "prompt"} e responde {"texto", "tokens_entrada", "tokens_saida"}.
+    """
+    
+    requer_chave = False
+    
+    def __init__(self, modelo, cfg):
+        self._modelo = modelo
+        self._url = cfg.get("llm_stub_url", "http://127.0.0.1:8089/gerar")
+    
+    def gerar(self, prompt):
+        response = cliente_http.post(self._url, json={"modelo": self._modelo, "prompt": prompt})
+        response.raise_for_status()
+        dados = response.json()
+        return RespostaLLM((dados.get("texto") or "").strip(),
+                           int(dados.get("tokens_entrada", 0)), int(dados.get("tokens_saida", 0)))
+
+BACKENDS = {
+    "gemini": BackendGemini,
+    "stub": BackendStub
+}
+
+def registrar_backend(nome, classe):
+    """Registra um backend extra: classe(modelo, cfg) com requer_chave e gerar(prompt)"""
+    BACKENDS[nome] = classe
+
+class ClienteLLM:
+    """
+    Mantém um backend configurado por (backend, modelo, chave/URL).
+    O backend só é recriado quando a configuração correspondente muda.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._backend = None
+    
+    @staticmethod
+    def _assinatura_de(modelo, cfg):
+        nome = cfg.get("llm_backend", "gemini")
+        return (nome, modelo, cfg.get("google_api_key") if nome == "gemini" else cfg.get("llm_stub_url"))
+    
+    def obter(self, modelo, cfg):
+        assinatura = self._assinatura_de(modelo, cfg)
+        with self._lock:
+            if self._backend is None or self._assinatura != assinatura:
+                classe = BACKENDS.get(assinatura[0])
+                if classe is None:
+                    raise ValueError(f"Backend de LLM desconhecido: {assinatura[0]}")
+                self._backend = classe(modelo, cfg)
+                self._assinatura = assinatura
+                logging.info(f"[IA] Cliente '{assinatura[0]}' configurado para o modelo {modelo}.")
+            return self._backend
+    
+    def backend_requer_chave(self, cfg):
+        classe = BACKENDS.get(cfg.get("llm_backend", "gemini"))
+        return getattr(classe, "requer_chave", True)
+
+# Instância global compartilhada
+cliente_llm = ClienteLLM()
@@ -1,12 +1,16 @@
 import json
 import os
 import logging
+import threading
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 AGENTS_DIR = os.path.join(BASE_DIR, "agents")
 DB_PATH = os.path.join(BASE_DIR, "bot_database.db")
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
 SESSION_FILE = os.path.join(BASE_DIR, "session.json")
+LLM_CACHE_PATH = os.path.join(BASE_DIR, "cache_llm.db")
+CACHE_IMAGENS_DIR = os.path.join(BASE_DIR, "cache_imagens")
+ARTES_DIR = os.path.join(BASE_DIR, "artes")
 
 def get_agent_config_path(agent_id):
     return os.path.join(AGENTS_DIR, f"agent_{agent_id}.json")
@@ -24,6 +28,7 @@ DEFAULT_CONFIG = {
     "apis_ativas": ["gnews"],
     "categorias_ativas": ["technology"],
     "opacidade": 0.3,
+    "arquivo_overlay": "overlay.png",
     "intervalo_busca": 15,
     "intervalo_post": 30,
     "intervalo_post_min": 8,
@@ -34,7 +39,71 @@ DEFAULT_CONFIG = {
     "insta_pass": "",
     "gnews_api_key": "",
     "newsdata_api_key": "",
-    "google_api_key": ""
+    "google_api_key": "",
+    "busca_concorrente": True,
+    "busca_max_workers": 8,
+    "busca_limite_por_api": {"gnews": 3, "newsdata": 2, "servidor_local": 1},
+    "busca_prazo_ciclo": 90,
+    "http_pool_hosts": 20,
+    "http_pool_por_host": 10,
+    "http_timeout_conexao": 5,
+    "http_timeout_leitura": 15,
+    "cache_busca_ttl": 300,
+    "cota_diaria": {"gnews": 100, "newsdata": 200},
+    "cota_por_segundo": {"gnews": 1, "newsdata": 0.5},
+    "cota_espera_max": 30,
+    "quase_duplicata_limiar": 0.7,
+    "quase_duplicata_limiar_canonico": 0.3,
+    "quase_duplicata_dias": 30,
+    "cache_llm_ativo": True,
+    "cache_llm_ttl_horas": 72,
+    "cache_llm_max_entradas": 20000,
+    "cache_llm_max_memoria": 2000,
+    "cache_llm_funcoes": {},
+    "relevancia_em_lote": True,
+    "relevancia_tamanho_lote": 10,
+    "enriquecimento_unificado": True,
+    "semantica_limiar": 0.8,
+    "semantica_limiar_canonico": 0.45,
+    "semantica_janela_dias": 30,
+    "enriquecimento_max_global": 6,
+    "enriquecimento_max_por_agente": 3,
+    "llm_backend": "gemini",
+    "llm_stub_url": "http://127.0.0.1:8089/gerar",
+    "llm_max_tentativas": 4,
+    "llm_backoff_base": 1.0,
+    "llm_backoff_max": 20.0,
+    "llm_prazo_chamada": 60,
+    "llm_hedge_apos": 0,
+    "llm_max_workers": 16,
+    "llm_disjuntor_falhas": 5,
+    "llm_disjuntor_pausa": 60,
+    "llm_max_adiadas": 200,
+    "classificador_ativo": True,
+    "classificador_limiar": 0.95,
+    "classificador_amostra_auditoria": 0.05,
+    "classificador_min_exemplos": 200,
+    "classificador_max_exemplos": 20000,
+    "orcamento_tokens": {},
+    "legendas_lote_backfill": 10,
+    "legendas_max_tentativas": 3,
+    "intervalo_backfill_legendas": 10,
+    "cache_imagens_max_mb": 500,
+    "imagem_max_mb": 15,
+    "imagem_min_lado": 200,
+    "imagem_max_megapixels": 50,
+    "qualidade_score_minimo": 0.45,
+    "qualidade_notas_minimas": {"contraste": 0.1, "nitidez": 0.2, "resolucao": 0.1, "bordas": 0.75},
+    "imagem_dedupe_distancia": 6,
+    "imagem_dedupe_dias": 14,
+    "imagem_dedupe_acao": "rejeitar",
+    "imagem_dedupe_penalidade": 0.5,
+    "render_antecipado_lote": 10,
+    "intervalo_render_antecipado": 5,
+    "artes_carencia_minutos": 30,
+    "render_max_tentativas": 4,
+    "render_espera_retentativa_minutos": 10,
+    "render_max_workers": 2
 }
 
 def carregar_config(agent_id=None):
@@ -52,6 +121,26 @@ def carregar_config(agent_id=None):
     except (FileNotFoundError, json.JSONDecodeError):
         return DEFAULT_CONFIG.copy()
 
+_snapshot = {"assinatura": None, "config": None}
+_snapshot_lock = threading.Lock()
+
+def config_snapshot():
+    """
+    Configuração global relida do disco apenas quando config.json muda.
+    O dicionário retornado é compartilhado: use somente para leitura.
+    """
+    try:
+        estado = os.stat(CONFIG_FILE)
+        assinatura = (estado.st_mtime_ns, estado.st_size)
+    except OSError:
+        assinatura = None
+    
+    with _snapshot_lock:
+        if _snapshot["config"] is None or _snapshot["assinatura"] != assinatura:
+            _snapshot["config"] = carregar_config()
+            _snapshot["assinatura"] = assinatura
+        return _snapshot["config"]
+
 def get_default_agent_config():
     return {
         "agent_name": "Novo Agente",
@@ -1,9 +1,36 @@
 import sqlite3
 import uuid
+import json
 import logging
 from collections import deque
 from config import DB_PATH, get_agent_db_path
 
+# Colunas da fila adicionadas depois da criação original da tabela
+COLUNAS_EXTRAS_FILA = [
+    ("hashtags", "TEXT"),
+    ("legenda", "TEXT"),
+    ("imagem_cache", "TEXT"),
+    ("qualidade_imagem", "REAL"),
+    ("phash", "TEXT"),
+    ("arte_caminho", "TEXT"),
+    ("arte_status", "TEXT"),
+    ("origem_relevancia", "TEXT"),
+    ("arte_tentativas", "INTEGER"),
+    ("arte_atualizado", "TIMESTAMP"),
+    ("legenda_tentativas", "INTEGER")
+]
+COLUNAS_EXTRAS_HISTORICO = [
+    ("phash", "TEXT"),
+    ("origem_relevancia", "TEXT")
+]
+
+def _garantir_colunas(cursor, tabela, colunas):
+    """Adiciona em bancos já existentes as colunas criadas em versões mais novas"""
+    existentes = {row[1] for row in cursor.execute(f"PRAGMA table_info({tabela})").fetchall()}
+    for nome, tipo in colunas:
+        if nome not in existentes:
+            cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}")
+
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
@@ -58,14 +85,47 @@ def setup_database():
         )
     """)
     
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cursores_busca (
+            api TEXT,
+            categoria TEXT,
+            idioma TEXT,
+            pasta TEXT,
+            ultimo_visto TEXT,
+            data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (api, categoria, idioma, pasta)
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS noticias_adiadas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            etapa TEXT,
+            contexto TEXT,
+            data_adiada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cota_diaria (
+            provedor TEXT,
+            chave TEXT,
+            dia TEXT,
+            usados INTEGER DEFAULT 0,
+            PRIMARY KEY (provedor, chave, dia)
+        )
+    """)
+    
     cursor.execute("INSERT OR IGNORE INTO estatisticas (chave, valor) VALUES ('custo_total_vida', 0.0)")
+    _garantir_colunas(cursor, "fila_postagem", COLUNAS_EXTRAS_FILA)
+    _garantir_colunas(cursor, "historico", COLUNAS_EXTRAS_HISTORICO)
     
     conn.commit()
     conn.close()
     logging.info("[SISTEMA] Banco de dados verificado e pronto.")
 
 class Database:
-    
+
     @staticmethod
     def adicionar_na_fila(noticia):
         conn = get_db_connection()
@@ -74,18 +134,21 @@ class Database:
                 INSERT INTO fila_postagem (
                     id, titulo_original, titulo_refinado, semantic_hash, descricao,
                     conteudo_original, conteudo_reescrito, url_imagem, fonte,
-                    categoria_ia, idioma_original, api_fonte, custo_usd
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    categoria_ia, idioma_original, api_fonte, custo_usd, hashtags, legenda, imagem_cache,
+                    qualidade_imagem, phash, origem_relevancia
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 str(uuid.uuid4()), noticia['titulo_original'], noticia['titulo_refinado'],
                 noticia['semantic_hash'], noticia.get('descricao', ''), noticia['conteudo_original'],
                 noticia['conteudo_reescrito'], noticia['url_imagem'], noticia['fonte'],
                 noticia['categoria_ia'], noticia['idioma_original'], noticia['api_fonte'],
-                noticia['custo_usd']
+                noticia['custo_usd'], noticia.get('hashtags'), noticia.get('legenda'), noticia.get('imagem_cache'),
+                noticia.get('qualidade_imagem'), noticia.get('phash'), noticia.get('origem_relevancia')
             ))
             conn.commit()
+            return True
         except sqlite3.IntegrityError:
-            pass
+            return False
         finally:
             conn.close()
     
@@ -99,13 +162,14 @@ class Database:
                 INSERT INTO historico (
                     id, titulo_original, titulo_refinado, semantic_hash,
                     conteudo_original, conteudo_reescrito, idioma_original,
-                    api_fonte, status, motivo_rejeicao, custo_usd
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    api_fonte, status, motivo_rejeicao, custo_usd, phash, origem_relevancia
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 str(uuid.uuid4()), noticia.get('titulo_original'), noticia.get('titulo_refinado'),
                 noticia.get('semantic_hash'), noticia.get('conteudo_original'),
                 noticia.get('conteudo_reescrito'), noticia.get('idioma_original'),
-                noticia.get('api_fonte'), status, motivo, custo
+                noticia.get('api_fonte'), status, motivo, custo, noticia.get('phash'),
+                noticia.get('origem_relevancia')
             ))
             conn.commit()
         except sqlite3.IntegrityError:
@@ -119,7 +183,7 @@ class Database:
     def verificar_duplicata_semantica(semantic_hash):
         if not semantic_hash:
             return True
-            
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -132,10 +196,299 @@ class Database:
         if cursor.fetchone():
             conn.close()
             return True
-            
+        
         conn.close()
         return False
     
+    @staticmethod
+    def _conexao(agent_id=None):
+        """Conexão com o banco do agente ou, sem agent_id, com o banco principal"""
+        return Database.get_agent_connection(agent_id) if agent_id else get_db_connection()
+    
+    @staticmethod
+    def obter_cursor_busca(api, categoria, idioma, pasta, agent_id=None):
+        """Data do artigo mais recente já visto para a combinação de busca (None na primeira busca)"""
+        conn = Database._conexao(agent_id)
+        try:
+            row = conn.execute("""
+                SELECT ultimo_visto FROM cursores_busca
+                WHERE api = ? AND categoria = ? AND idioma = ? AND pasta = ?
+            """, (api, categoria, idioma, pasta or '')).fetchone()
+            return row['ultimo_visto'] if row else None
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def atualizar_cursor_busca(api, categoria, idioma, pasta, ultimo_visto, agent_id=None):
+        """Salva a data do artigo mais recente repassado para a combinação de busca"""
+        conn = Database._conexao(agent_id)
+        try:
+            conn.execute("""
+                INSERT INTO cursores_busca (api, categoria, idioma, pasta, ultimo_visto, data_atualizacao)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (api, categoria, idioma, pasta)
+                DO UPDATE SET ultimo_visto = excluded.ultimo_visto, data_atualizacao = CURRENT_TIMESTAMP
+            """, (api, categoria, idioma, pasta or '', ultimo_visto))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            logging.error(f"[BUSCA] ERRO ao salvar cursor de {api}/{categoria}: {e}")
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def adiar_noticias(etapa, contextos, limite, agent_id=None):
+        """
+        Guarda as notícias adiadas (notícia da API e dados para o histórico) para
+        serem retomadas na etapa indicada, mesmo depois de reiniciar. Acima do
+        limite as mais antigas saem da tabela e são retornadas para registro.
+        """
+        conn = Database._conexao(agent_id)
+        try:
+            conn.executemany("INSERT INTO noticias_adiadas (etapa, contexto) VALUES (?, ?)", [
+                (etapa, json.dumps({"noticia": contexto["noticia"], "dados": contexto["dados"]},
+                                   default=lambda valor: valor.item() if hasattr(valor, "item") else str(valor)))
+                for contexto in contextos])
+            excedentes = conn.execute("""
+                SELECT id, contexto FROM noticias_adiadas ORDER BY id DESC LIMIT -1 OFFSET ?
+            """, (int(limite),)).fetchall()
+            conn.executemany("DELETE FROM noticias_adiadas WHERE id = ?", [(row['id'],) for row in excedentes])
+            conn.commit()
+            return [json.loads(row['contexto'])["dados"] for row in excedentes]
+        except sqlite3.OperationalError as e:
+            logging.error(f"[SISTEMA] ERRO ao guardar notícias adiadas: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def retomar_adiadas(etapas, agent_id=None):
+        """Remove e retorna (etapa, contexto) das notícias adiadas nas etapas, das mais antigas para as mais novas"""
+        conn = Database._conexao(agent_id)
+        marcadores = ", ".join("?" * len(etapas))
+        try:
+            rows = conn.execute(f"SELECT id, etapa, contexto FROM noticias_adiadas WHERE etapa IN ({marcadores}) ORDER BY id",
+                                list(etapas)).fetchall()
+            conn.executemany("DELETE FROM noticias_adiadas WHERE id = ?", [(row['id'],) for row in rows])
+            conn.commit()
+        except sqlite3.OperationalError:
+            return []
+        finally:
+            conn.close()
+        
+        retomadas = []
+        for row in rows:
+            salvo = json.loads(row['contexto'])
+            dados = salvo["dados"]
+            retomadas.append((row['etapa'], {
+                "noticia": salvo["noticia"],
+                "titulo_original": dados["titulo_original"],
+                "conteudo_original": dados["conteudo_original"],
+                "dados": dados
+            }))
+        return retomadas
+    
+    @staticmethod
+    def contar_adiadas(agent_id=None):
+        conn = Database._conexao(agent_id)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM noticias_adiadas").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def obter_uso_cota(provedor, chave, dia):
+        """Requisições já feitas no dia (UTC) para o provedor e a chave de API"""
+        conn = get_db_connection()
+        try:
+            row = conn.execute("SELECT usados FROM cota_diaria WHERE provedor = ? AND chave = ? AND dia = ?",
+                               (provedor, chave, dia)).fetchone()
+            return row['usados'] if row else 0
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def registrar_uso_cota(provedor, chave, dia):
+        conn = get_db_connection()
+        try:
+            conn.execute("""
+                INSERT INTO cota_diaria (provedor, chave, dia, usados) VALUES (?, ?, ?, 1)
+                ON CONFLICT (provedor, chave, dia) DO UPDATE SET usados = usados + 1
+            """, (provedor, chave, dia))
+            conn.execute("DELETE FROM cota_diaria WHERE dia < DATE(?, '-7 days')", (dia,))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            logging.error(f"[COTA] ERRO ao registrar uso de {provedor}: {e}")
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def pegar_textos_recentes(dias, agent_id=None):
+        """Título, conteúdo original e data das notícias postadas (ou com falha ao postar) e da fila dos últimos dias"""
+        conn = Database._conexao(agent_id)
+        try:
+            textos = [(row['titulo_original'], row['conteudo_original'], row['data']) for row in conn.execute("""
+                SELECT titulo_original, conteudo_original, data_processamento AS data FROM historico
+                WHERE titulo_original IS NOT NULL AND status IN ('POSTADO', 'FALHA') AND data_processamento >= DATETIME('now', ?)
+                UNION ALL
+                SELECT titulo_original, conteudo_original, data_adicionado AS data FROM fila_postagem
+                WHERE titulo_original IS NOT NULL AND data_adicionado >= DATETIME('now', ?)
+            """, (f'-{int(dias)} days', f'-{int(dias)} days')).fetchall()]
+        except sqlite3.OperationalError:
+            textos = []
+        finally:
+            conn.close()
+        return textos
+    
+    @staticmethod
+    def pegar_phashes_recentes(dias, agent_id=None):
+        """Hash perceptual e data das imagens postadas (ou com falha ao postar) e da fila dos últimos dias"""
+        conn = Database._conexao(agent_id)
+        try:
+            hashes = [(row['phash'], row['data']) for row in conn.execute("""
+                SELECT phash, data_processamento AS data FROM historico
+                WHERE phash IS NOT NULL AND status IN ('POSTADO', 'FALHA') AND data_processamento >= DATETIME('now', ?)
+                UNION ALL
+                SELECT phash, data_adicionado AS data FROM fila_postagem
+                WHERE phash IS NOT NULL AND data_adicionado >= DATETIME('now', ?)
+            """, (f'-{int(dias)} days', f'-{int(dias)} days')).fetchall()]
+        except sqlite3.OperationalError:
+            hashes = []
+        finally:
+            conn.close()
+        return hashes
+    
+    @staticmethod
+    def pegar_itens_sem_legenda(limite, agent_id=None, max_tentativas=3):
+        """
+        Itens da fila ainda sem legenda pré-gerada, com menos de max_tentativas
+        falhas; os que ainda não falharam vêm antes, dos mais antigos para os
+        mais novos.
+        """
+        conn = Database._conexao(agent_id)
+        try:
+            return [dict(row) for row in conn.execute("""
+                SELECT * FROM fila_postagem
+                WHERE legenda IS NULL AND COALESCE(legenda_tentativas, 0) < ?
+                ORDER BY COALESCE(legenda_tentativas, 0) ASC, data_adicionado ASC LIMIT ?
+            """, (int(max_tentativas), int(limite))).fetchall()]
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def registrar_falha_legenda(item_id, agent_id=None):
+        conn = Database._conexao(agent_id)
+        try:
+            conn.execute("UPDATE fila_postagem SET legenda_tentativas = COALESCE(legenda_tentativas, 0) + 1 WHERE id = ?", (item_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def atualizar_legenda(item_id, hashtags, legenda, custo_usd, agent_id=None):
+        conn = Database._conexao(agent_id)
+        try:
+            conn.execute("UPDATE fila_postagem SET hashtags = ?, legenda = ?, custo_usd = COALESCE(custo_usd, 0) + ? WHERE id = ?",
+                         (hashtags, legenda, custo_usd, item_id))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def pegar_itens_sem_arte(limite, agent_id=None, max_tentativas=4, espera_minutos=10):
+        """
+        Itens da fila cuja imagem do post ainda não foi gerada, dos mais antigos
+        para os mais novos. Itens com falha voltam depois de espera_minutos,
+        dobrando a cada nova falha, até max_tentativas.
+        """
+        conn = Database._conexao(agent_id)
+        try:
+            return [dict(row) for row in conn.execute("""
+                SELECT * FROM fila_postagem
+                WHERE arte_status IS NULL
+                   OR (arte_status = 'FALHA' AND COALESCE(arte_tentativas, 1) < ?
+                       AND COALESCE(arte_atualizado, data_adicionado) <=
+                           DATETIME('now', '-' || (? * (1 << (COALESCE(arte_tentativas, 1) - 1))) || ' minutes'))
+                ORDER BY data_adicionado ASC LIMIT ?
+            """, (int(max_tentativas), float(espera_minutos), int(limite))).fetchall()]
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def atualizar_arte(item_id, caminho, status, agent_id=None):
+        """Grava o resultado da renderização; falhas incrementam arte_tentativas"""
+        conn = Database._conexao(agent_id)
+        try:
+            conn.execute("""
+                UPDATE fila_postagem
+                SET arte_caminho = ?, arte_status = ?, arte_atualizado = CURRENT_TIMESTAMP,
+                    arte_tentativas = COALESCE(arte_tentativas, 0) + (? = 'FALHA')
+                WHERE id = ?
+            """, (caminho, status, status, item_id))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def pegar_artes_da_fila(agent_id=None):
+        """Caminhos das artes ainda referenciadas por itens da fila"""
+        conn = Database._conexao(agent_id)
+        try:
+            return {row[0] for row in conn.execute(
+                "SELECT arte_caminho FROM fila_postagem WHERE arte_caminho IS NOT NULL"
+            ).fetchall()}
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def pegar_imagens_cache_da_fila(agent_id=None):
+        """Caminhos no cache de imagens ainda referenciados por itens da fila"""
+        conn = Database._conexao(agent_id)
+        try:
+            return {row[0] for row in conn.execute(
+                "SELECT imagem_cache FROM fila_postagem WHERE imagem_cache IS NOT NULL"
+            ).fetchall()}
+        except sqlite3.OperationalError:
+            return set()
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def pegar_exemplos_relevancia(limite=20000, agent_id=None):
+        """
+        Exemplos rotulados pelo filtro de relevância: (titulo, conteudo, rotulo).
+        Rótulo 1 para o que a IA aprovou e chegou à fila (na fila, postado ou com
+        falha ao postar) e 0 para o que a IA reprovou. Decisões do próprio
+        classificador (origem_relevancia 'local') e rejeições por outros motivos
+        são ignoradas, assim como aprovações anteriores à coluna de origem.
+        """
+        conn = Database._conexao(agent_id)
+        try:
+            exemplos = [(row['titulo_original'], row['conteudo_original'], row['rotulo']) for row in conn.execute("""
+                SELECT titulo_original, conteudo_original, rotulo FROM (
+                    SELECT titulo_original, conteudo_original, 1 AS rotulo, data_processamento AS data FROM historico
+                    WHERE status IN ('POSTADO', 'FALHA') AND origem_relevancia = 'ia'
+                    UNION ALL
+                    SELECT titulo_original, conteudo_original, 0 AS rotulo, data_processamento AS data FROM historico
+                    WHERE status = 'REJEITADA' AND motivo_rejeicao = 'REPROVADA' AND COALESCE(origem_relevancia, 'ia') = 'ia'
+                    UNION ALL
+                    SELECT titulo_original, conteudo_original, 1 AS rotulo, data_adicionado AS data FROM fila_postagem
+                    WHERE origem_relevancia = 'ia'
+                )
+                WHERE titulo_original IS NOT NULL
+                ORDER BY data DESC LIMIT ?
+            """, (int(limite),)).fetchall()]
+        except sqlite3.OperationalError:
+            exemplos = []
+        finally:
+            conn.close()
+        return exemplos
+    
     @staticmethod
     def obter_custo_total():
         conn = get_db_connection()
@@ -162,7 +515,11 @@ class Database:
     @staticmethod
     def pegar_proximo_da_fila():
         conn = get_db_connection()
-        item = conn.execute("SELECT * FROM fila_postagem ORDER BY data_adicionado ASC LIMIT 1").fetchone()
+        # Itens cuja arte falhou ficam para depois dos demais
+        item = conn.execute("""
+            SELECT * FROM fila_postagem
+            ORDER BY COALESCE(arte_status, '') = 'FALHA' ASC, data_adicionado ASC LIMIT 1
+        """).fetchone()
         conn.close()
         return dict(item) if item else None
     
@@ -209,7 +566,7 @@ class Database:
         """Verifica se um título similar já existe na fila ou histórico"""
         if not titulo_original:
             return True
-            
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -224,7 +581,7 @@ class Database:
         if cursor.fetchone():
             conn.close()
             return True
-            
+        
         conn.close()
         return False
     
@@ -284,7 +641,30 @@ class Database:
             )
         """)
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cursores_busca (
+                api TEXT,
+                categoria TEXT,
+                idioma TEXT,
+                pasta TEXT,
+                ultimo_visto TEXT,
+                data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (api, categoria, idioma, pasta)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS noticias_adiadas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                etapa TEXT,
+                contexto TEXT,
+                data_adiada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         cursor.execute("INSERT OR IGNORE INTO estatisticas (chave, valor) VALUES ('custo_total_vida', 0.0)")
+        _garantir_colunas(cursor, "fila_postagem", COLUNAS_EXTRAS_FILA)
+        _garantir_colunas(cursor, "historico", COLUNAS_EXTRAS_HISTORICO)
         
         conn.commit()
         conn.close()
@@ -307,18 +687,22 @@ class Database:
                 INSERT INTO fila_postagem (
                     id, titulo_original, titulo_refinado, semantic_hash, descricao,
                     conteudo_original, conteudo_reescrito, url_imagem, fonte,
-                    categoria_ia, idioma_original, api_fonte, pasta_feed, custo_usd
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    categoria_ia, idioma_original, api_fonte, pasta_feed, custo_usd, hashtags, legenda, imagem_cache,
+                    qualidade_imagem, phash, origem_relevancia
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 str(uuid.uuid4()), noticia['titulo_original'], noticia['titulo_refinado'],
                 noticia['semantic_hash'], noticia.get('descricao', ''), noticia['conteudo_original'],
                 noticia['conteudo_reescrito'], noticia['url_imagem'], noticia['fonte'],
                 noticia['categoria_ia'], noticia['idioma_original'], noticia['api_fonte'],
-                noticia.get('pasta_feed', 'geral'), noticia['custo_usd']
+                noticia.get('pasta_feed', 'geral'), noticia['custo_usd'], noticia.get('hashtags'), noticia.get('legenda'),
+                noticia.get('imagem_cache'), noticia.get('qualidade_imagem'), noticia.get('phash'),
+                noticia.get('origem_relevancia')
             ))
             conn.commit()
+            return True
         except sqlite3.IntegrityError:
-            pass
+            return False
         finally:
             conn.close()
     
@@ -333,13 +717,14 @@ class Database:
                 INSERT INTO historico (
                     id, titulo_original, titulo_refinado, semantic_hash,
                     conteudo_original, conteudo_reescrito, idioma_original,
-                    api_fonte, pasta_feed, status, motivo_rejeicao, custo_usd
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    api_fonte, pasta_feed, status, motivo_rejeicao, custo_usd, phash, origem_relevancia
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 str(uuid.uuid4()), noticia.get('titulo_original'), noticia.get('titulo_refinado'),
                 noticia.get('semantic_hash'), noticia.get('conteudo_original'),
                 noticia.get('conteudo_reescrito'), noticia.get('idioma_original'),
-                noticia.get('api_fonte'), noticia.get('pasta_feed', 'geral'), status, motivo, custo
+                noticia.get('api_fonte'), noticia.get('pasta_feed', 'geral'), status, motivo, custo,
+                noticia.get('phash'), noticia.get('origem_relevancia')
             ))
             conn.commit()
         except sqlite3.IntegrityError:
@@ -354,7 +739,7 @@ class Database:
         """Verifica título duplicado no agente específico"""
         if not titulo_original:
             return True
-            
+        
         conn = Database.get_agent_connection(agent_id)
         cursor = conn.cursor()
         
@@ -367,7 +752,7 @@ class Database:
         if cursor.fetchone():
             conn.close()
             return True
-            
+        
         conn.close()
         return False
     
@@ -376,7 +761,7 @@ class Database:
         """Verifica duplicata semântica no agente específico"""
         if not semantic_hash:
             return True
-            
+        
         conn = Database.get_agent_connection(agent_id)
         cursor = conn.cursor()
         
@@ -389,7 +774,7 @@ class Database:
         if cursor.fetchone():
             conn.close()
             return True
-            
+        
         conn.close()
         return False
     
@@ -397,7 +782,10 @@ class Database:
     def pegar_proximo_da_fila_agente(agent_id):
         """Pega próximo item da fila do agente"""
         conn = Database.get_agent_connection(agent_id)
-        item = conn.execute("SELECT * FROM fila_postagem ORDER BY data_adicionado ASC LIMIT 1").fetchone()
+        item = conn.execute("""
+            SELECT * FROM fila_postagem
+            ORDER BY COALESCE(arte_status, '') = 'FALHA' ASC, data_adicionado ASC LIMIT 1
+        """).fetchone()
         conn.close()
         return dict(item) if item else None
     
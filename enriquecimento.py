@@ -0,0 +1,210 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ai_services import AIServices, MODELO_GEMINI
+from config import carregar_config
+from database import Database
+from resiliencia_llm import resiliencia_llm, LLMIndisponivel
+
+PERFIL_PADRAO = "noticiasbr.ai"
+# Etapa das notícias adiadas no enriquecimento, ao lado das etapas da cadeia de filtros
+ETAPA_ENRIQUECIMENTO = "enriquecimento"
+
+def _agente(escopo):
+    """agent_id do escopo do executor ("global" é o banco principal)"""
+    return None if escopo == "global" else escopo
+
+def montar_legenda(conteudo_reescrito, fonte, categoria_ia, hashtags, perfil=PERFIL_PADRAO):
+    """Legenda final do post: texto, fonte, tag da categoria e hashtags"""
+    conteudo_curado = conteudo_reescrito or "Sem conteúdo adicional."
+    categoria_ia = categoria_ia or "noticias"
+    return f"siga: @{perfil} | {conteudo_curado}\n\nFonte: {fonte or 'Fonte não informada'}\n\n#{categoria_ia.replace(' ','')} {hashtags or ''}".rstrip()
+
+def legenda_do_item(item, perfil=PERFIL_PADRAO):
+    """Legenda pré-gerada do item da fila ou, se ainda não houver, montada sem chamar a IA"""
+    return item.get("legenda") or montar_legenda(item.get("conteudo_reescrito"), item.get("fonte"),
+                                                 item.get("categoria_ia"), item.get("hashtags"), perfil)
+
+def enriquecer_contexto(contexto, perfil=PERFIL_PADRAO):
+    """Traduz, refina título, reescreve legenda, categoriza e monta a legenda final de uma notícia aprovada"""
+    noticia = contexto["noticia"]
+    dados_para_historico = contexto["dados"]
+    
+    # Com o disjuntor aberto o texto sairia sem tradução nem reescrita: adia a notícia
+    if not resiliencia_llm.disponivel(MODELO_GEMINI):
+        raise LLMIndisponivel("disjuntor aberto")
+    enriquecido, custo_enriquecimento = AIServices.enriquecer_noticia(
+        contexto["titulo_original"], contexto["conteudo_original"], noticia['idioma_original'], incluir_hashtags=True)
+    if not resiliencia_llm.disponivel(MODELO_GEMINI):
+        raise LLMIndisponivel("disjuntor aberto durante o enriquecimento")
+    
+    # Finaliza dados
+    dados_para_historico.update({
+        "titulo_refinado": enriquecido["titulo_refinado"],
+        "conteudo_reescrito": enriquecido["conteudo_reescrito"],
+        "categoria_ia": enriquecido["categoria_ia"],
+        "custo_usd": dados_para_historico["custo_usd"] + custo_enriquecimento,
+        "url_imagem": noticia.get("image"),
+        "fonte": noticia.get("source", {}).get("name"),
+        "descricao": noticia.get("description"),
+        "hashtags": enriquecido["hashtags"]
+    })
+    # Sem hashtags a legenda fica pendente para o preenchimento em segundo plano
+    if enriquecido["hashtags"]:
+        dados_para_historico["legenda"] = montar_legenda(
+            enriquecido["conteudo_reescrito"], dados_para_historico["fonte"], enriquecido["categoria_ia"], enriquecido["hashtags"], perfil)
+    return dados_para_historico
+
+def preencher_legendas_pendentes(agent_id=None, perfil=PERFIL_PADRAO):
+    """Gera hashtags e legenda dos itens da fila que entraram sem elas (itens antigos ou IA fora do ar)"""
+    if not resiliencia_llm.disponivel(MODELO_GEMINI):
+        return
+    
+    cfg = carregar_config()
+    itens = Database.pegar_itens_sem_legenda(int(cfg.get("legendas_lote_backfill", 10)), agent_id,
+                                             int(cfg.get("legendas_max_tentativas", 3)))
+    preenchidos = 0
+    for item in itens:
+        conteudo_curado = item.get("conteudo_reescrito") or "Sem conteúdo adicional."
+        hashtags, custo = AIServices.gerar_hashtags(f"{item['titulo_refinado']} {conteudo_curado}")
+        if not hashtags:
+            if not resiliencia_llm.disponivel(MODELO_GEMINI):
+                break  # IA fora do ar: não é culpa do item, tenta de novo na próxima execução
+            # Conta a falha e segue para os próximos: um item problemático não trava a fila.
+            # Esgotadas as tentativas, o post usa a legenda montada sem IA (legenda_do_item)
+            Database.registrar_falha_legenda(item["id"], agent_id)
+            continue
+        legenda = montar_legenda(item.get("conteudo_reescrito"), item.get("fonte"), item.get("categoria_ia"), hashtags, perfil)
+        Database.atualizar_legenda(item["id"], hashtags, legenda, custo, agent_id)
+        preenchidos += 1
+    
+    if preenchidos:
+        logging.info(f"[FILA] Legendas pré-geradas para {preenchidos} itens pendentes de {agent_id or 'global'}.")
+
+class ExecutorEnriquecimento:
+    """
+    Enriquece as notícias aprovadas de um ciclo em paralelo, limitado por um
+    semáforo global (todas as cadeias) e outro por agente. Os resultados são
+    entregues na ordem original das notícias, independente de qual termina antes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._semaforo_global = None
+        self._limite_global = None
+        self._semaforos_escopo = {}  # {escopo: (limite, semáforo)}
+        self._ativas = 0
+        self._estatisticas = {}  # {escopo: {...}}
+    
+    def _semaforos(self, escopo):
+        cfg = carregar_config()
+        limite_global = max(1, int(cfg.get("enriquecimento_max_global", 6)))
+        limite_escopo = max(1, int(cfg.get("enriquecimento_max_por_agente", 3)))
+        
+        with self._lock:
+            # Recria apenas se o limite mudou; tarefas em andamento liberam o semáforo antigo
+            if self._limite_global != limite_global:
+                self._semaforo_global = threading.BoundedSemaphore(limite_global)
+                self._limite_global = limite_global
+            atual = self._semaforos_escopo.get(escopo)
+            if atual is None or atual[0] != limite_escopo:
+                atual = self._semaforos_escopo[escopo] = (limite_escopo, threading.BoundedSemaphore(limite_escopo))
+            return self._semaforo_global, atual[1], limite_escopo
+    
+    def _executar_tarefa(self, funcao, contexto, semaforo_global, semaforo_escopo, enfileirado_em, medidas):
+        with semaforo_escopo, semaforo_global:
+            espera = time.perf_counter() - enfileirado_em
+            with self._lock:
+                self._ativas += 1
+                medidas["concorrencia_max"] = max(medidas["concorrencia_max"], self._ativas)
+                medidas["esperas"].append(espera)
+            try:
+                return funcao(contexto)
+            finally:
+                with self._lock:
+                    self._ativas -= 1
+    
+    def executar(self, escopo, contextos, funcao, ao_concluir):
+        """
+        Aplica funcao a cada contexto em paralelo e chama ao_concluir(resultado)
+        na ordem dos contextos. Falhas de uma notícia não interrompem as demais;
+        notícias sem modelo disponível voltam no próximo ciclo, antes das novas.
+        """
+        adiadas = Database.retomar_adiadas([ETAPA_ENRIQUECIMENTO], _agente(escopo))
+        contextos = [contexto for _, contexto in adiadas] + list(contextos)
+        if not contextos:
+            return
+        
+        semaforo_global, semaforo_escopo, limite_escopo = self._semaforos(escopo)
+        medidas = {"concorrencia_max": 0, "esperas": []}
+        inicio = time.perf_counter()
+        concluidas = 0
+        adiadas = []
+        
+        with ThreadPoolExecutor(max_workers=min(limite_escopo, len(contextos))) as executor:
+            futuros = [executor.submit(self._executar_tarefa, funcao, contexto, semaforo_global,
+                                       semaforo_escopo, time.perf_counter(), medidas)
+                       for contexto in contextos]
+            
+            for contexto, futuro in zip(contextos, futuros):
+                try:
+                    resultado = futuro.result()
+                except LLMIndisponivel:
+                    adiadas.append(contexto)
+                    continue
+                except Exception as e:
+                    logging.error(f"[ENRIQUECIMENTO] ERRO ao enriquecer '{contexto['titulo_original'][:80]}': {e}")
+                    continue
+                ao_concluir(resultado)
+                concluidas += 1
+        
+        if adiadas:
+            self._adiar(escopo, adiadas)
+        self._registrar_ciclo(escopo, len(contextos), concluidas, time.perf_counter() - inicio, medidas)
+    
+    def _adiar(self, escopo, contextos):
+        # Ficam no banco (sobrevivem a reinícios); acima do limite as mais antigas vão para o histórico
+        agent_id = _agente(escopo)
+        limite = int(carregar_config().get("llm_max_adiadas", 200))
+        descartadas = Database.adiar_noticias(ETAPA_ENRIQUECIMENTO, contextos, limite, agent_id)
+        logging.warning(f"[ENRIQUECIMENTO] {len(contextos)} notícias de {escopo} adiadas: modelo indisponível.")
+        if descartadas:
+            logging.warning(f"[ENRIQUECIMENTO] {len(descartadas)} notícias adiadas de {escopo} descartadas (limite {limite}).")
+        for dados in descartadas:
+            dados["titulo_refinado"] = f"[ADIADA] {dados['titulo_original'][:150]}"
+            if agent_id:
+                Database.registrar_no_historico_agente(agent_id, dados, "REJEITADA", f"Adiada além do limite ({limite})")
+            else:
+                Database.registrar_no_historico(dados, "REJEITADA", f"Adiada além do limite ({limite})")
+    
+    def _registrar_ciclo(self, escopo, total, concluidas, tempo_parede, medidas):
+        esperas = medidas["esperas"]
+        ciclo = {
+            "noticias": total,
+            "concluidas": concluidas,
+            "tempo_parede_s": round(tempo_parede, 3),
+            "concorrencia_max": medidas["concorrencia_max"],
+            "espera_media_s": round(sum(esperas) / len(esperas), 3) if esperas else 0.0,
+            "espera_max_s": round(max(esperas), 3) if esperas else 0.0
+        }
+        with self._lock:
+            stats = self._estatisticas.setdefault(escopo, {"ciclos": 0, "noticias": 0, "tempo_parede_total_s": 0.0})
+            stats["ciclos"] += 1
+            stats["noticias"] += total
+            stats["tempo_parede_total_s"] = round(stats["tempo_parede_total_s"] + tempo_parede, 3)
+            stats["ultimo_ciclo"] = ciclo
+        
+        logging.info(f"[ENRIQUECIMENTO] {escopo}: {concluidas}/{total} notícias em {tempo_parede:.1f}s "
+                     f"(concorrência máx. {ciclo['concorrencia_max']}, espera média {ciclo['espera_media_s']}s)")
+    
+    def estatisticas(self):
+        with self._lock:
+            resultado = {escopo: dict(stats) for escopo, stats in self._estatisticas.items()}
+            ativas, limite_global = self._ativas, self._limite_global
+        for escopo, stats in resultado.items():
+            stats["adiadas"] = Database.contar_adiadas(_agente(escopo))
+        return {"ativas": ativas, "limite_global": limite_global, "por_escopo": resultado}
+
+# Instância global compartilhada entre agentes
+executor_enriquecimento = ExecutorEnriquecimento()
@@ -0,0 +1,420 @@
+import time
+import threading
+import logging
+import numpy as np
+from database import Database
+from ai_services import AIServices, VEREDITO_ADIADO
+from media import MediaProcessor
+from config import carregar_config
+from quase_duplicatas import obter_indice, assinatura_minhash, normalizar_texto, hash_local
+from indice_semantico import obter_indice_semantico, vetorizar, referencia
+from indice_imagens import obter_indice_imagens, distancia_hamming
+from classificador_relevancia import obter_classificador
+
+# Estatísticas por cadeia e etapa: {cadeia: {etapa: {...}}}
+estatisticas_filtros = {}
+_estatisticas_lock = threading.Lock()
+
+class Rejeicao:
+    """Resultado de uma etapa que descarta a notícia"""
+    
+    def __init__(self, motivo=None, prefixo=None, registrar=True, dados=None, adiar=False):
+        self.motivo = motivo
+        self.prefixo = prefixo
+        self.registrar = registrar
+        self.dados = dados or {}
+        # Adiada: não vai para o histórico e volta na mesma etapa no próximo ciclo
+        self.adiar = adiar
+
+class EtapaFiltro:
+    """
+    Etapa da cadeia de filtros. A função recebe (contexto, ciclo) e retorna
+    None para aprovar ou uma Rejeicao. O custo é uma estimativa relativa
+    usada apenas para ordenar as etapas (mais baratas primeiro).
+    Com funcao_lote, a etapa recebe todos os contextos restantes de uma vez
+    e retorna uma lista de resultados na mesma ordem.
+    """
+    
+    def __init__(self, nome, custo, funcao, funcao_lote=None):
+        self.nome = nome
+        self.custo = custo
+        self.funcao = funcao
+        self.funcao_lote = funcao_lote
+
+class CadeiaFiltros:
+    """
+    Executa as etapas em ordem de custo sobre todas as notícias do ciclo.
+    Cada notícia sai da cadeia na primeira rejeição, então as chamadas de IA
+    e downloads de imagem só acontecem para quem passou pelos filtros baratos.
+    """
+    
+    def __init__(self, nome, etapas, registrar_historico, agent_id=None):
+        self.nome = nome
+        self.agent_id = agent_id
+        self.etapas = sorted(etapas, key=lambda etapa: etapa.custo)
+        self.registrar_historico = registrar_historico
+    
+    def _registrar_estatistica(self, etapa, avaliadas, rejeitadas, adiadas, tempo):
+        with _estatisticas_lock:
+            por_etapa = estatisticas_filtros.setdefault(self.nome, {})
+            stats = por_etapa.setdefault(etapa.nome, {
+                "custo_estimado": etapa.custo,
+                "avaliadas": 0,
+                "rejeitadas": 0,
+                "adiadas": 0,
+                "tempo_total_s": 0.0
+            })
+            stats["avaliadas"] += avaliadas
+            stats["rejeitadas"] += rejeitadas
+            stats["adiadas"] += adiadas
+            stats["tempo_total_s"] = round(stats["tempo_total_s"] + tempo, 3)
+    
+    def _adiar(self, etapa, contextos):
+        # No banco do agente: sobrevivem a reinícios, e os cursores de busca já passaram delas
+        limite = int(carregar_config().get("llm_max_adiadas", 200))
+        descartadas = Database.adiar_noticias(etapa.nome, contextos, limite, self.agent_id)
+        if descartadas:
+            logging.warning(f"[FILTRO] {len(descartadas)} notícias adiadas descartadas em {self.nome} (limite {limite}).")
+        for dados in descartadas:
+            dados["titulo_refinado"] = f"[ADIADA] {dados['titulo_original'][:150]}"
+            self.registrar_historico(dados, "REJEITADA", f"Adiada além do limite ({limite})")
+    
+    def _retomadas(self):
+        return Database.retomar_adiadas([etapa.nome for etapa in self.etapas], self.agent_id)
+    
+    def _rejeitar(self, contexto, rejeicao):
+        if not rejeicao.registrar:
+            return
+        
+        dados = contexto["dados"]
+        titulo_original = contexto["titulo_original"]
+        if rejeicao.prefixo:
+            dados["titulo_refinado"] = f"{rejeicao.prefixo} {titulo_original[:150]}"
+        dados.update(rejeicao.dados)
+        self.registrar_historico(dados, "REJEITADA", rejeicao.motivo)
+    
+    def executar(self, contextos):
+        """Retorna os contextos aprovados por todas as etapas, na ordem original"""
+        ciclo = {"titulos": set(), "semantic_hashes": set()}
+        retomadas = self._retomadas()
+        if retomadas:
+            logging.info(f"[FILTRO] Retomando {len(retomadas)} notícias adiadas em {self.nome}.")
+        
+        for etapa in self.etapas:
+            # Adiadas reentram na etapa em que pararam, depois das novas
+            contextos = contextos + [contexto for nome_etapa, contexto in retomadas if nome_etapa == etapa.nome]
+            if not contextos:
+                continue
+            
+            inicio = time.perf_counter()
+            if etapa.funcao_lote:
+                rejeicoes = etapa.funcao_lote(contextos, ciclo)
+            else:
+                rejeicoes = [etapa.funcao(contexto, ciclo) for contexto in contextos]
+            
+            aprovados, adiados = [], []
+            for contexto, rejeicao in zip(contextos, rejeicoes):
+                if rejeicao is None:
+                    aprovados.append(contexto)
+                elif rejeicao.adiar:
+                    adiados.append(contexto)
+                else:
+                    self._rejeitar(contexto, rejeicao)
+            if adiados:
+                self._adiar(etapa, adiados)
+            
+            self._registrar_estatistica(etapa, len(contextos), len(contextos) - len(aprovados) - len(adiados), len(adiados),
+                                        time.perf_counter() - inicio)
+            contextos = aprovados
+        
+        return contextos
+
+def preparar_contexto(noticia, pasta_feed=None):
+    """Extrai os dados básicos da notícia usados pelos filtros e pelo histórico"""
+    titulo_bruto = noticia.get("title") or ""
+    
+    # Remove fonte do título se presente
+    titulo_original = titulo_bruto.rsplit(" - ", 1)[0] if " - " in titulo_bruto else titulo_bruto
+    conteudo_original = noticia.get("content") or noticia.get("description", "")
+    
+    dados_para_historico = {
+        "titulo_original": titulo_original,
+        "conteudo_original": conteudo_original,
+        "idioma_original": noticia.get('idioma_original'),
+        "api_fonte": noticia.get('api_fonte'),
+        "custo_usd": 0.0,
+        "semantic_hash": None
+    }
+    if pasta_feed is not None:
+        dados_para_historico["pasta_feed"] = noticia.get('pasta_feed', pasta_feed)
+    
+    return {
+        "noticia": noticia,
+        "titulo_original": titulo_original,
+        "conteudo_original": conteudo_original,
+        "dados": dados_para_historico
+    }
+
+def enfileirar(dados, agent_id=None):
+    """
+    Adiciona a notícia aprovada à fila e só então a registra nos índices de
+    duplicatas (texto, vetores e foto), para que notícias descartadas depois
+    das etapas de dedupe não bloqueiem a mesma história nos próximos dias.
+    O índice semântico é gravado em disco por quem chama, ao fim do lote.
+    """
+    adicionada = Database.adicionar_na_fila_agente(agent_id, dados) if agent_id else Database.adicionar_na_fila(dados)
+    if not adicionada:
+        return adicionada
+    
+    titulo, conteudo = dados["titulo_original"], dados["conteudo_original"]
+    obter_indice(agent_id).adicionar(assinatura_minhash(normalizar_texto(titulo, conteudo)), referencia(titulo, conteudo))
+    obter_indice_semantico(agent_id).adicionar(vetorizar(titulo, conteudo), referencia=referencia(titulo, conteudo))
+    if dados.get("phash"):
+        obter_indice_imagens(agent_id).adicionar(int(dados["phash"], 16))
+    return adicionada
+
+def criar_cadeia_noticias(agent_id=None):
+    """
+    Monta a cadeia padrão de filtros do processamento de notícias,
+    usando o banco principal ou, com agent_id, o banco do agente.
+    """
+    if agent_id:
+        tag_log = f"[AGENT-{agent_id}]"
+        titulo_duplicado = lambda titulo: Database.verificar_titulo_duplicado_agente(agent_id, titulo)
+        duplicata_semantica = lambda semantic_hash: Database.verificar_duplicata_semantica_agente(agent_id, semantic_hash)
+        registrar_historico = lambda dados, status, motivo: Database.registrar_no_historico_agente(agent_id, dados, status, motivo)
+    else:
+        tag_log = "[FILTRO]"
+        titulo_duplicado = Database.verificar_titulo_duplicado
+        duplicata_semantica = Database.verificar_duplicata_semantica
+        registrar_historico = Database.registrar_no_historico
+    
+    cfg = carregar_config()
+    limiar_quase_duplicata = float(cfg.get("quase_duplicata_limiar", 0.7))
+    limiar_canonico = float(cfg.get("quase_duplicata_limiar_canonico", 0.3))
+    limiar_semantico = float(cfg.get("semantica_limiar", 0.8))
+    limiar_semantico_canonico = float(cfg.get("semantica_limiar_canonico", 0.45))
+    indice_semantico = obter_indice_semantico(agent_id)
+    classificador = obter_classificador(agent_id)
+    # Limiares de qualidade de imagem podem ser definidos por agente
+    cfg_agente = carregar_config(agent_id) if agent_id else cfg
+    qualidade_score_minimo = float(cfg_agente.get("qualidade_score_minimo", cfg.get("qualidade_score_minimo", 0.45)))
+    qualidade_notas_minimas = cfg_agente.get("qualidade_notas_minimas", cfg.get("qualidade_notas_minimas", {}))
+    indice_imagens = obter_indice_imagens(agent_id)
+    dedupe_distancia = int(cfg_agente.get("imagem_dedupe_distancia", cfg.get("imagem_dedupe_distancia", 6)))
+    # "rejeitar" descarta a notícia; "rebaixar" multiplica o score de qualidade pela penalidade
+    dedupe_rejeitar = cfg_agente.get("imagem_dedupe_acao", cfg.get("imagem_dedupe_acao", "rejeitar")) != "rebaixar"
+    dedupe_penalidade = float(cfg_agente.get("imagem_dedupe_penalidade", cfg.get("imagem_dedupe_penalidade", 0.5)))
+    
+    def filtrar_titulo_vazio(contexto, ciclo):
+        if not contexto["titulo_original"]:
+            return Rejeicao(registrar=False)
+    
+    def filtrar_titulo_duplicado(contexto, ciclo):
+        titulo_original = contexto["titulo_original"]
+        if titulo_duplicado(titulo_original):
+            logging.info(f"{tag_log} Notícia ignorada - título já processado: {titulo_original[:100]}...")
+            return Rejeicao("Título já processado", "[DUPLICATA TÍTULO]")
+    
+    def filtrar_duplicata_no_ciclo(contexto, ciclo):
+        # Depois da imagem: só quem sobreviveu até aqui disputa título e texto dentro do ciclo,
+        # então uma cópia descartada por imagem ruim não barra a mesma história de outra fonte
+        titulo_original = contexto["titulo_original"]
+        if titulo_original in ciclo["titulos"]:
+            logging.info(f"{tag_log} Notícia ignorada - título repetido no ciclo: {titulo_original[:100]}...")
+            return Rejeicao("Título já processado", "[DUPLICATA TÍTULO]")
+        
+        anteriores = ciclo.setdefault("sobreviventes", [])
+        if anteriores:
+            vetoriais = np.stack([anterior["vetor"] for anterior in anteriores]) @ contexto["vetor"]
+            locais = (np.stack([anterior["assinatura_minhash"] for anterior in anteriores]) == contexto["assinatura_minhash"]).mean(axis=1)
+            # A vizinha do ciclo substitui a do índice se for mais parecida (vale também para a manchete canônica)
+            j = int(vetoriais.argmax())
+            if vetoriais[j] > contexto["similaridade_vetorial"]:
+                contexto["similaridade_vetorial"] = float(vetoriais[j])
+                contexto["vizinho_vetorial"] = referencia(anteriores[j]["titulo_original"], anteriores[j]["conteudo_original"])
+            j = int(locais.argmax())
+            if locais[j] > contexto["similaridade_local"]:
+                contexto["similaridade_local"] = float(locais[j])
+                contexto["vizinho_local"] = referencia(anteriores[j]["titulo_original"], anteriores[j]["conteudo_original"])
+            
+            similaridade = contexto["similaridade_vetorial"]
+            if similaridade >= limiar_semantico:
+                logging.info(f"{tag_log} Duplicata semântica no ciclo ({similaridade:.0%}) ignorada sem IA: {titulo_original[:100]}...")
+                return Rejeicao(f"Duplicata Semântica ({similaridade:.0%})", "[DUPLICATA]")
+            similaridade = contexto["similaridade_local"]
+            if similaridade >= limiar_quase_duplicata:
+                logging.info(f"{tag_log} Quase duplicata no ciclo ({similaridade:.0%}) ignorada sem IA: {titulo_original[:100]}...")
+                return Rejeicao(f"Quase Duplicata ({similaridade:.0%})", "[DUPLICATA]")
+        
+        ciclo["titulos"].add(titulo_original)
+        anteriores.append(contexto)
+    
+    def filtrar_duplicata_vetorial_lote(contextos, ciclo):
+        # Uma multiplicação de matrizes para o ciclo inteiro. O vetor fica no contexto para a
+        # comparação dentro do ciclo; o índice só o recebe quando a notícia entra na fila
+        vetores = np.stack([vetorizar(contexto["titulo_original"], contexto["conteudo_original"]) for contexto in contextos])
+        no_indice = indice_semantico.mais_parecidas(vetores)
+        
+        rejeicoes = []
+        for i, contexto in enumerate(contextos):
+            similaridade, vizinho = no_indice[i]
+            contexto["vetor"] = vetores[i]
+            contexto["similaridade_vetorial"] = similaridade
+            contexto["vizinho_vetorial"] = vizinho
+            
+            if similaridade >= limiar_semantico:
+                logging.info(f"{tag_log} Duplicata semântica ({similaridade:.0%}) ignorada sem IA: {contexto['titulo_original'][:100]}...")
+                rejeicoes.append(Rejeicao(f"Duplicata Semântica ({similaridade:.0%})", "[DUPLICATA]"))
+                continue
+            rejeicoes.append(None)
+        return rejeicoes
+    
+    def filtrar_duplicata_vetorial(contexto, ciclo):
+        return filtrar_duplicata_vetorial_lote([contexto], ciclo)[0]
+    
+    def filtrar_quase_duplicata(contexto, ciclo):
+        texto = normalizar_texto(contexto["titulo_original"], contexto["conteudo_original"])
+        assinatura = assinatura_minhash(texto)
+        similaridade, vizinho = obter_indice(agent_id).mais_parecida(assinatura)
+        contexto["assinatura_minhash"] = assinatura
+        contexto["similaridade_local"] = similaridade
+        contexto["vizinho_local"] = vizinho
+        
+        if similaridade >= limiar_quase_duplicata:
+            logging.info(f"{tag_log} Quase duplicata ({similaridade:.0%}) ignorada sem IA: {contexto['titulo_original'][:100]}...")
+            return Rejeicao(f"Quase Duplicata ({similaridade:.0%})", "[DUPLICATA]")
+    
+    def filtrar_imagem_lote(contextos, ciclo):
+        imagens = [MediaProcessor.validar_imagem(contexto["noticia"].get("image"), indice_imagens, dedupe_distancia)
+                   for contexto in contextos]
+        validos = [i for i, imagem in enumerate(imagens) if imagem]
+        avaliacoes = dict(zip(validos, MediaProcessor.avaliar_qualidade([imagens[i].caminho for i in validos])))
+        hashes_ciclo = ciclo.setdefault("phashes", [])
+        
+        rejeicoes = []
+        for i, contexto in enumerate(contextos):
+            imagem = imagens[i]
+            if not imagem:
+                rejeicoes.append(Rejeicao(registrar=False))
+                continue
+            
+            # Mesma foto já na fila ou postada (índice) ou em outra notícia do próprio ciclo
+            if imagem.distancia_duplicata is None:
+                distancias = [distancia_hamming(imagem.phash, h) for h in hashes_ciclo]
+                if distancias and min(distancias) <= dedupe_distancia:
+                    imagem.distancia_duplicata = min(distancias)
+            if imagem.distancia_duplicata is not None and dedupe_rejeitar:
+                logging.info(f"{tag_log} Imagem já usada (distância {imagem.distancia_duplicata}): {contexto['titulo_original'][:100]}...")
+                rejeicoes.append(Rejeicao(f"Imagem duplicada (distância {imagem.distancia_duplicata})", "[DUPLICATA]"))
+                continue
+            
+            avaliacao = avaliacoes[i]
+            if avaliacao and imagem.distancia_duplicata is not None:
+                avaliacao["score"] = round(avaliacao["score"] * dedupe_penalidade, 3)
+            motivo = MediaProcessor.motivo_baixa_qualidade(avaliacao, qualidade_score_minimo, qualidade_notas_minimas)
+            if motivo:
+                logging.info(f"{tag_log} Imagem de baixa qualidade ({motivo}): {contexto['titulo_original'][:100]}...")
+                rejeicoes.append(Rejeicao(f"Imagem de baixa qualidade ({motivo})", "[IMAGEM]"))
+                continue
+            
+            # O índice só recebe a foto quando a notícia entra na fila (enfileirar)
+            hashes_ciclo.append(imagem.phash)
+            contexto["dados"]["imagem_cache"] = imagem.caminho
+            contexto["dados"]["qualidade_imagem"] = avaliacao["score"]
+            contexto["dados"]["phash"] = f"{imagem.phash:016x}"
+            rejeicoes.append(None)
+        return rejeicoes
+    
+    def filtrar_imagem(contexto, ciclo):
+        return filtrar_imagem_lote([contexto], ciclo)[0]
+    
+    def vizinhos_limitrofes(contexto):
+        """Notícias parecidas o bastante para a manchete canônica, sem repetir a mesma"""
+        vizinhos = []
+        for similaridade, limiar, vizinho in (
+                (contexto.get("similaridade_local", 0.0), limiar_canonico, contexto.get("vizinho_local")),
+                (contexto.get("similaridade_vetorial", 0.0), limiar_semantico_canonico, contexto.get("vizinho_vetorial"))):
+            if vizinho and similaridade >= limiar and vizinho not in vizinhos:
+                vizinhos.append(vizinho)
+        return vizinhos
+    
+    def filtrar_duplicata_semantica(contexto, ciclo):
+        # Sem nenhuma notícia parecida nos índices locais a manchete canônica da IA é dispensada
+        if (contexto.get("similaridade_local", 1.0) < limiar_canonico
+                and contexto.get("similaridade_vetorial", 1.0) < limiar_semantico_canonico):
+            semantic_hash = hash_local(contexto["titulo_original"], contexto["conteudo_original"])
+        else:
+            # Caso limítrofe: gera hash semântico com a IA para detectar duplicatas
+            semantic_hash, custo_hash = AIServices.gerar_titulo_canonico(contexto["titulo_original"], contexto["conteudo_original"])
+            contexto["dados"]["custo_usd"] += custo_hash
+            if not semantic_hash:
+                semantic_hash = hash_local(contexto["titulo_original"], contexto["conteudo_original"])
+            else:
+                # A vizinha pode ter entrado pelo caminho barato (hash "local:"), que nunca
+                # coincide com uma manchete da IA; então a manchete dela é gerada aqui
+                # (com o mesmo prompt de quando ela mesma for limítrofe, logo em cache)
+                for titulo_vizinho, conteudo_vizinho in vizinhos_limitrofes(contexto):
+                    canonico_vizinho, custo_vizinho = AIServices.gerar_titulo_canonico(titulo_vizinho, conteudo_vizinho)
+                    contexto["dados"]["custo_usd"] += custo_vizinho
+                    if canonico_vizinho and normalizar_texto(canonico_vizinho) == normalizar_texto(semantic_hash):
+                        contexto["dados"]["semantic_hash"] = semantic_hash
+                        logging.info(f"{tag_log} Mesma manchete canônica de '{titulo_vizinho[:60]}': {contexto['titulo_original'][:100]}...")
+                        return Rejeicao("Duplicata Semântica (manchete canônica da vizinha)", "[DUPLICATA]")
+        contexto["dados"]["semantic_hash"] = semantic_hash
+        
+        if semantic_hash in ciclo["semantic_hashes"] or duplicata_semantica(semantic_hash):
+            return Rejeicao("Duplicata Semântica", "[DUPLICATA]")
+        ciclo["semantic_hashes"].add(semantic_hash)
+    
+    def consultar_relevancia(contextos):
+        itens = [(contexto["titulo_original"], contexto["conteudo_original"]) for contexto in contextos]
+        if cfg.get("relevancia_em_lote", True):
+            return AIServices.filtrar_relevancia_lote(itens)
+        return [AIServices.filtrar_relevancia(titulo, conteudo) for titulo, conteudo in itens]
+    
+    def filtrar_relevancia_lote(contextos, ciclo):
+        # Casos óbvios são decididos pelo classificador local; o resto (e a auditoria) vai para a IA
+        decisoes = [classificador.decidir(contexto["titulo_original"], contexto["conteudo_original"]) for contexto in contextos]
+        consultar = [contexto for contexto, (local, auditar) in zip(contextos, decisoes) if local is None or auditar]
+        respostas = iter(consultar_relevancia(consultar) if consultar else [])
+        
+        rejeicoes = []
+        for contexto, (local, auditar) in zip(contextos, decisoes):
+            if local is None or auditar:
+                veredito, custo_filtro = next(respostas)
+                contexto["dados"]["custo_usd"] += custo_filtro
+                if auditar and veredito != VEREDITO_ADIADO:
+                    classificador.registrar_auditoria(local, veredito)
+                motivo = veredito
+                # Só decisões da IA (inclusive as auditorias) entram no treino do classificador
+                contexto["dados"]["origem_relevancia"] = "ia"
+            else:
+                veredito, motivo = local, f"{local} (classificador)"
+                contexto["dados"]["origem_relevancia"] = "local"
+            
+            if veredito == VEREDITO_ADIADO:
+                rejeicoes.append(Rejeicao(adiar=True))
+            else:
+                rejeicoes.append(None if veredito == "APROVADA" else Rejeicao(motivo, "[REJEITADO]", dados={"conteudo_reescrito": ""}))
+        return rejeicoes
+    
+    def filtrar_relevancia(contexto, ciclo):
+        return filtrar_relevancia_lote([contexto], ciclo)[0]
+    
+    etapas = [
+        EtapaFiltro("titulo_vazio", 0, filtrar_titulo_vazio),
+        EtapaFiltro("titulo_duplicado", 1, filtrar_titulo_duplicado),
+        EtapaFiltro("duplicata_vetorial", 3, filtrar_duplicata_vetorial, filtrar_duplicata_vetorial_lote),
+        EtapaFiltro("quase_duplicata", 5, filtrar_quase_duplicata),
+        EtapaFiltro("imagem", 30, filtrar_imagem, filtrar_imagem_lote),
+        EtapaFiltro("duplicata_no_ciclo", 35, filtrar_duplicata_no_ciclo),
+        EtapaFiltro("duplicata_semantica", 60, filtrar_duplicata_semantica),
+        EtapaFiltro("relevancia", 70, filtrar_relevancia, filtrar_relevancia_lote)
+    ]
+    
+    return CadeiaFiltros(agent_id or "global", etapas, registrar_historico, agent_id)
+
+def obter_estatisticas_filtros():
+    with _estatisticas_lock:
+        return {cadeia: {etapa: dict(stats) for etapa, stats in etapas.items()} for cadeia, etapas in estatisticas_filtros.items()}
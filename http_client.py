@@ -0,0 +1,137 @@
+import threading
+import logging
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from config import config_snapshot
+
+# Hosts distintos com estatísticas próprias; os demais são somados em "outros"
+MAX_HOSTS_ESTATISTICAS = 100
+
+class _AdaptadorContado(HTTPAdapter):
+    """HTTPAdapter cujos pools avisam a cada conexão TCP nova (o resto é reuso)"""
+    
+    def __init__(self, ao_conectar, **kwargs):
+        self._ao_conectar = ao_conectar
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        ao_conectar = self._ao_conectar
+        classes = {}
+        for esquema, base in self.poolmanager.pool_classes_by_scheme.items():
+            def _new_conn(pool, _base=base):
+                ao_conectar(pool.host)
+                return _base._new_conn(pool)
+            classes[esquema] = type(f"{base.__name__}Contado", (base,), {"_new_conn": _new_conn})
+        self.poolmanager.pool_classes_by_scheme = classes
+
+class ClienteHTTP:
+    """
+    Cliente HTTP compartilhado com pools de conexões keep-alive por host.
+    Usado pelas APIs de notícias e pelo processamento de imagens.
+    A sessão é recriada quando os parâmetros http_* da configuração mudam.
+    """
+    
+    def __init__(self):
+        self._sessao = None
+        self._assinatura = None
+        self._timeout = (5, 15)
+        self._lock = threading.Lock()
+        self._estatisticas = {}
+    
+    @staticmethod
+    def _assinatura_de(cfg):
+        return (
+            int(cfg.get("http_pool_hosts", 20)),
+            int(cfg.get("http_pool_por_host", 10)),
+            float(cfg.get("http_timeout_conexao", 5)),
+            float(cfg.get("http_timeout_leitura", 15))
+        )
+    
+    def _obter_sessao(self):
+        assinatura = self._assinatura_de(config_snapshot())
+        with self._lock:
+            if self._sessao is None or self._assinatura != assinatura:
+                pool_hosts, pool_por_host, timeout_conexao, timeout_leitura = assinatura
+                self._timeout = (timeout_conexao, timeout_leitura)
+                
+                sessao = requests.Session()
+                adaptador = _AdaptadorContado(self._contar_conexao, pool_connections=pool_hosts, pool_maxsize=pool_por_host)
+                sessao.mount("http://", adaptador)
+                sessao.mount("https://", adaptador)
+                # A sessão anterior não é fechada: outras threads podem estar no meio de uma requisição
+                self._sessao = sessao
+                self._assinatura = assinatura
+                logging.info(f"[HTTP] Sessão criada ({pool_hosts} hosts, {pool_por_host} conexões por host, timeout {self._timeout}).")
+            return self._sessao
+    
+    def timeout(self, leitura=None):
+        """Retorna a tupla (conexão, leitura), opcionalmente com outro timeout de leitura"""
+        self._obter_sessao()
+        conexao, leitura_padrao = self._timeout
+        return (conexao, leitura if leitura is not None else leitura_padrao)
+    
+    def get(self, url, timeout=None, **kwargs):
+        return self._requisitar("GET", url, timeout, **kwargs)
+    
+    def post(self, url, timeout=None, **kwargs):
+        return self._requisitar("POST", url, timeout, **kwargs)
+    
+    def _requisitar(self, metodo, url, timeout=None, **kwargs):
+        sessao = self._obter_sessao()
+        host = urlsplit(url).hostname or ""
+        
+        try:
+            response = sessao.request(metodo, url, timeout=timeout or self.timeout(), **kwargs)
+        except Exception:
+            self._registrar(host, 0.0, erro=True)
+            raise
+        
+        self._registrar(host, response.elapsed.total_seconds())
+        return response
+    
+    def _stats_host(self, host):
+        """Chamar com o lock adquirido"""
+        if host not in self._estatisticas and len(self._estatisticas) >= MAX_HOSTS_ESTATISTICAS:
+            host = "outros"
+        return self._estatisticas.setdefault(host, {
+            "requisicoes": 0,
+            "conexoes_novas": 0,
+            "erros": 0,
+            "latencia_total": 0.0,
+            "latencia_max": 0.0
+        })
+    
+    def _contar_conexao(self, host):
+        with self._lock:
+            self._stats_host(host)["conexoes_novas"] += 1
+    
+    def _registrar(self, host, latencia, erro=False):
+        with self._lock:
+            stats = self._stats_host(host)
+            stats["requisicoes"] += 1
+            if erro:
+                stats["erros"] += 1
+            else:
+                stats["latencia_total"] += latencia
+                stats["latencia_max"] = max(stats["latencia_max"], latencia)
+    
+    def estatisticas(self):
+        """Estatísticas por host: taxa de reuso de conexões e latência até os cabeçalhos"""
+        with self._lock:
+            resultado = {}
+            for host, stats in self._estatisticas.items():
+                sucesso = stats["requisicoes"] - stats["erros"]
+                resultado[host] = {
+                    "requisicoes": stats["requisicoes"],
+                    "conexoes_novas": stats["conexoes_novas"],
+                    "erros": stats["erros"],
+                    "taxa_reuso": round(max(0.0, 1 - stats["conexoes_novas"] / stats["requisicoes"]), 3) if stats["requisicoes"] else 0.0,
+                    "latencia_media_ms": round(stats["latencia_total"] / sucesso * 1000, 1) if sucesso else 0.0,
+                    "latencia_max_ms": round(stats["latencia_max"] * 1000, 1)
+                }
+            return resultado
+
+# Instância global compartilhada
+cliente_http = ClienteHTTP()
@@ -0,0 +1,122 @@
+import time
+import threading
+import logging
+import numpy as np
+from PIL import Image
+from database import Database
+from config import carregar_config
+from indice_semantico import _momento_sqlite
+
+def hash_diferenca(caminho):
+    """
+    dHash de 64 bits: a imagem em cinza reduzida para 9x8 e, em cada linha,
+    um bit por par de pixels vizinhos (1 quando o da esquerda é mais claro).
+    Resiste a recompressão, redimensionamento e pequenos ajustes de cor.
+    """
+    with Image.open(caminho) as imagem:
+        imagem.draft("L", (64, 64))
+        reduzida = imagem.convert("L").resize((9, 8), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(reduzida, dtype=np.int16)
+    bits = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count("1")
+
+BANDAS = 8
+BITS_POR_BANDA = 64 // BANDAS
+_MASCARA_BANDA = (1 << BITS_POR_BANDA) - 1
+_BITS_POR_BYTE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _distancias(valor, hashes):
+    """Distâncias de Hamming entre valor e um vetor uint64 de hashes"""
+    diferencas = np.bitwise_xor(hashes, np.uint64(valor))
+    return _BITS_POR_BYTE[diferencas.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class IndiceImagens:
+    """
+    Índice multi-índice de Hamming: o hash é dividido em 8 bandas de 8 bits e
+    cada banda tem sua tabela. Dois hashes a até 7 bits de distância coincidem
+    em pelo menos uma banda (casa dos pombos), então só os candidatos dessas
+    tabelas são comparados, de uma vez, com NumPy. Entradas fora da janela de
+    dias são ignoradas na busca e descartadas quando passam a ser a maioria.
+    """
+    
+    def __init__(self, janela_dias):
+        self.janela_segundos = janela_dias * 86400
+        self._lock = threading.Lock()
+        self._limpar()
+    
+    def _limpar(self):
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._momentos = np.zeros(1024, dtype=np.float64)
+        self._total = 0
+        self._tabelas = [{} for _ in range(BANDAS)]
+    
+    @staticmethod
+    def _bandas(valor):
+        return [(valor >> (banda * BITS_POR_BANDA)) & _MASCARA_BANDA for banda in range(BANDAS)]
+    
+    def _inserir(self, valor, momento):
+        if self._total == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+            self._momentos = np.concatenate([self._momentos, np.zeros_like(self._momentos)])
+        posicao = self._total
+        self._hashes[posicao] = valor
+        self._momentos[posicao] = momento
+        self._total += 1
+        for banda, chave in enumerate(self._bandas(valor)):
+            self._tabelas[banda].setdefault(chave, []).append(posicao)
+    
+    def adicionar(self, valor, momento=None):
+        with self._lock:
+            self._inserir(valor, momento or time.time())
+    
+    def _compactar_se_necessario(self, momento_min):
+        validas = np.flatnonzero(self._momentos[:self._total] >= momento_min)
+        if len(validas) * 2 >= self._total:
+            return
+        hashes, momentos = self._hashes[validas], self._momentos[validas]
+        self._limpar()
+        for valor, momento in zip(hashes.tolist(), momentos.tolist()):
+            self._inserir(valor, momento)
+    
+    def mais_proxima(self, valor, distancia_max):
+        """Distância da imagem mais parecida dentro da janela, ou None se nenhuma está a até distancia_max"""
+        momento_min = time.time() - self.janela_segundos
+        with self._lock:
+            self._compactar_se_necessario(momento_min)
+            if distancia_max < BANDAS:
+                candidatos = set()
+                for banda, chave in enumerate(self._bandas(valor)):
+                    candidatos.update(self._tabelas[banda].get(chave, ()))
+                posicoes = np.fromiter(candidatos, dtype=np.int64, count=len(candidatos))
+            else:
+                posicoes = np.arange(self._total)
+            posicoes = posicoes[self._momentos[posicoes] >= momento_min]
+            if not len(posicoes):
+                return None
+            
+            menor = int(_distancias(valor, self._hashes[posicoes]).min())
+            return menor if menor <= distancia_max else None
+    
+    def __len__(self):
+        return self._total
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+def obter_indice_imagens(agent_id=None):
+    """Índice do agente (ou global), construído na primeira chamada a partir do histórico e da fila"""
+    escopo = agent_id or "global"
+    with _indices_lock:
+        if escopo not in _indices:
+            indice = IndiceImagens(int(carregar_config().get("imagem_dedupe_dias", 14)))
+            for phash, data in Database.pegar_phashes_recentes(indice.janela_segundos // 86400, agent_id):
+                try:
+                    indice.adicionar(int(phash, 16), _momento_sqlite(data))
+                except (TypeError, ValueError):
+                    continue
+            _indices[escopo] = indice
+            logging.info(f"[IMAGEM] Índice de hashes perceptuais de {escopo} construído com {len(indice)} imagens.")
+        return _indices[escopo]
@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import zlib
+import threading
+import unicodedata
+import logging
+import numpy as np
+from datetime import datetime, timezone
+from config import DB_PATH, carregar_config, get_agent_db_path
+from database import Database
+
+DIMENSOES = 256
+# Início do conteúdo guardado como referência de cada notícia indexada. Cobre com folga o
+# orçamento da manchete canônica, então o prompt (e a entrada no cache do LLM) é o mesmo
+# gerado com o texto completo.
+TAMANHO_REFERENCIA = 1000
+
+STOPWORDS = set("""
+a o e é de da do das dos em no na nos nas um uma uns umas para por com sem sobre entre
+que se ao aos à às ou mais menos como mas foi são ser ter após até pelo pela pelos pelas
+the of and to in on for with at by from is are was were be an as its it this that after
+""".split())
+
+def _tokens(titulo, conteudo, tamanho_lead=300):
+    texto = f"{titulo or ''} {(conteudo or '')[:tamanho_lead]}"
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", texto) if t not in STOPWORDS and len(t) > 1]
+
+def vetorizar(titulo, conteudo=None):
+    """
+    Embedding local por hashing de unigramas e bigramas (peso log da frequência,
+    sinal pelo hash), normalizado em L2. Não depende de modelo nem de rede.
+    """
+    tokens = _tokens(titulo, conteudo)
+    vetor = np.zeros(DIMENSOES, dtype=np.float32)
+    termos = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    
+    for termo in termos:
+        h = zlib.crc32(termo.encode("utf-8"))
+        vetor[h % DIMENSOES] += 1.0 if (h >> 31) & 1 else -1.0
+    
+    vetor = np.sign(vetor) * np.log1p(np.abs(vetor))
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma > 0 else vetor
+
+def referencia(titulo, conteudo=None):
+    """(título, início do conteúdo) guardado nos índices para comparar a notícia depois"""
+    return (titulo or "", (conteudo or "")[:TAMANHO_REFERENCIA])
+
+def _empacotar_textos(textos):
+    """Lista de strings como um bloco UTF-8 e os deslocamentos de cada uma (para o .npz)"""
+    codificados = [texto.encode("utf-8") for texto in textos]
+    deslocamentos = np.cumsum([0] + [len(c) for c in codificados], dtype=np.int64)
+    return np.frombuffer(b"".join(codificados), dtype=np.uint8), deslocamentos
+
+def _desempacotar_textos(bloco, deslocamentos):
+    dados = bloco.tobytes()
+    return [dados[a:b].decode("utf-8") for a, b in zip(deslocamentos[:-1], deslocamentos[1:])]
+
+class IndiceSemantico:
+    """
+    Matriz normalizada (float32) de embeddings com o momento de inserção de
+    cada linha e a referência (título, início do conteúdo) da notícia.
+    As linhas ficam em ordem de tempo, então a janela é uma fatia contígua
+    encontrada por busca binária; linhas vencidas são descartadas quando
+    passam a ser a maioria. A busca é um produto matriz-vetor sobre a fatia,
+    ou matriz-matriz para todas as notícias de um ciclo de uma vez.
+    """
+    
+    def __init__(self, caminho, janela_dias):
+        self.caminho = caminho
+        self.janela_segundos = janela_dias * 86400
+        self._lock = threading.Lock()
+        self._matriz = np.zeros((1024, DIMENSOES), dtype=np.float32)
+        self._tempos = np.zeros(1024, dtype=np.float64)
+        self._referencias = []
+        self._total = 0
+        self._alterado = False
+    
+    def adicionar(self, vetor, momento=None, referencia=None):
+        with self._lock:
+            if self._total == len(self._matriz):
+                self._matriz = np.concatenate([self._matriz, np.zeros_like(self._matriz)])
+                self._tempos = np.concatenate([self._tempos, np.zeros_like(self._tempos)])
+            momento = momento if momento is not None else time.time()
+            # Mantém os tempos em ordem crescente (a janela é achada por busca binária)
+            if self._total and momento < self._tempos[self._total - 1]:
+                momento = self._tempos[self._total - 1]
+            self._matriz[self._total] = vetor
+            self._tempos[self._total] = momento
+            self._referencias.append(referencia)
+            self._total += 1
+            self._alterado = True
+    
+    def _inicio_janela(self):
+        """Primeira linha dentro da janela; descarta as vencidas se forem a maioria. Chamar com o lock."""
+        inicio = int(np.searchsorted(self._tempos[:self._total], time.time() - self.janela_segundos))
+        if inicio and inicio * 2 >= self._total:
+            restantes = self._total - inicio
+            self._matriz[:restantes] = self._matriz[inicio:self._total]
+            self._tempos[:restantes] = self._tempos[inicio:self._total]
+            del self._referencias[:inicio]
+            self._total = restantes
+            self._alterado = True
+            inicio = 0
+        return inicio
+    
+    def mais_parecidas(self, vetores):
+        """Para cada vetor (linhas de uma matriz), (similaridade de cosseno, referência) da mais parecida na janela"""
+        vetores = np.asarray(vetores, dtype=np.float32).reshape(-1, DIMENSOES)
+        with self._lock:
+            inicio = self._inicio_janela()
+            if inicio == self._total:
+                return [(0.0, None)] * len(vetores)
+            similaridades = np.dot(vetores, self._matriz[inicio:self._total].T)
+            melhores = similaridades.argmax(axis=1)
+            maximos = similaridades[np.arange(len(vetores)), melhores]
+            return [(float(maximo), self._referencias[inicio + int(melhor)]) if maximo > 0.0 else (0.0, None)
+                    for maximo, melhor in zip(maximos, melhores)]
+    
+    def mais_parecida(self, vetor):
+        """(similaridade de cosseno, referência) da notícia mais parecida na janela, ou (0.0, None)"""
+        vetor = np.asarray(vetor, dtype=np.float32)
+        with self._lock:
+            inicio = self._inicio_janela()
+            if inicio == self._total:
+                return 0.0, None
+            similaridades = np.dot(self._matriz[inicio:self._total], vetor)
+            melhor = int(similaridades.argmax())
+            if similaridades[melhor] <= 0.0:
+                return 0.0, None
+            return float(similaridades[melhor]), self._referencias[inicio + melhor]
+    
+    def maior_similaridade(self, vetor):
+        """Maior similaridade de cosseno com as notícias da janela (0.0 se vazio)"""
+        return self.mais_parecida(vetor)[0]
+    
+    def salvar(self):
+        """Grava o índice ao lado do banco, descartando o que saiu da janela"""
+        with self._lock:
+            if not self._alterado:
+                return
+            inicio = int(np.searchsorted(self._tempos[:self._total], time.time() - self.janela_segundos))
+            matriz, tempos = self._matriz[inicio:self._total].copy(), self._tempos[inicio:self._total].copy()
+            referencias = self._referencias[inicio:]
+            self._matriz = np.concatenate([matriz, np.zeros((max(1024, len(matriz)), DIMENSOES), dtype=np.float32)])
+            self._tempos = np.concatenate([tempos, np.zeros(max(1024, len(tempos)))])
+            self._referencias = referencias
+            self._total = len(matriz)
+            self._alterado = False
+            
+            titulos, deslocamentos_titulos = _empacotar_textos([(r or ("", ""))[0] for r in referencias])
+            conteudos, deslocamentos_conteudos = _empacotar_textos([(r or ("", ""))[1] for r in referencias])
+            caminho_tmp = self.caminho + ".tmp.npz"
+            try:
+                np.savez(caminho_tmp, matriz=matriz, tempos=tempos,
+                         titulos=titulos, deslocamentos_titulos=deslocamentos_titulos,
+                         conteudos=conteudos, deslocamentos_conteudos=deslocamentos_conteudos)
+                os.replace(caminho_tmp, self.caminho)
+            except OSError as e:
+                logging.error(f"[DUPLICATAS] ERRO ao salvar índice semântico {self.caminho}: {e}")
+    
+    def carregar(self):
+        if not os.path.exists(self.caminho):
+            return False
+        try:
+            with np.load(self.caminho) as dados:
+                matriz, tempos = dados["matriz"], dados["tempos"]
+                titulos = _desempacotar_textos(dados["titulos"], dados["deslocamentos_titulos"])
+                conteudos = _desempacotar_textos(dados["conteudos"], dados["deslocamentos_conteudos"])
+        except (OSError, ValueError, KeyError, UnicodeDecodeError) as e:
+            # Arquivos sem as referências (versões anteriores) também são reconstruídos
+            logging.warning(f"[DUPLICATAS] Índice semântico ilegível ({e}). Reconstruindo do banco...")
+            return False
+        if matriz.ndim != 2 or matriz.shape[1] != DIMENSOES or not len(titulos) == len(conteudos) == len(matriz):
+            return False
+        for posicao in np.argsort(tempos, kind="stable"):
+            self.adicionar(matriz[posicao], tempos[posicao], (titulos[posicao], conteudos[posicao]) if titulos[posicao] else None)
+        self._alterado = False
+        return True
+    
+    def __len__(self):
+        return self._total
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+def _momento_sqlite(data_str):
+    try:
+        return datetime.strptime(data_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+def obter_indice_semantico(agent_id=None):
+    """
+    Índice do agente (ou global), carregado do arquivo ao lado do banco ou,
+    na primeira vez, construído a partir do histórico e da fila.
+    """
+    escopo = agent_id or "global"
+    with _indices_lock:
+        if escopo not in _indices:
+            dias = int(carregar_config().get("semantica_janela_dias", 30))
+            caminho_db = get_agent_db_path(agent_id) if agent_id else DB_PATH
+            indice = IndiceSemantico(os.path.splitext(caminho_db)[0] + "_vetores.npz", dias)
+            
+            if not indice.carregar():
+                textos = sorted(Database.pegar_textos_recentes(dias, agent_id), key=lambda texto: _momento_sqlite(texto[2]))
+                for titulo, conteudo, data in textos:
+                    indice.adicionar(vetorizar(titulo, conteudo), _momento_sqlite(data), referencia(titulo, conteudo))
+                indice.salvar()
+            _indices[escopo] = indice
+            logging.info(f"[DUPLICATAS] Índice semântico de {escopo} pronto com {len(indice)} notícias.")
+        return _indices[escopo]
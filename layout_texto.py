@@ -0,0 +1,176 @@
+import threading
+from PIL import ImageFont
+
+# Espaço extra entre linhas usado pelo Pillow em textos de várias linhas
+ESPACAMENTO_LINHAS = 4
+# Tamanhos acima do resultado da busca binária conferidos individualmente
+VIZINHOS_CONFERIDOS = 2
+
+class _FonteMedida:
+    """Fonte carregada uma vez, com as métricas de cada glifo memorizadas"""
+    
+    def __init__(self, caminho, tamanho):
+        self.fonte = ImageFont.truetype(caminho, tamanho)
+        self._glifos = {}  # {caractere: (avanço, borda direita, base)}
+        # Mesmo passo entre linhas que ImageDraw.multiline_text aplica
+        self.passo_linha = self.fonte.getbbox("A")[3] + ESPACAMENTO_LINHAS
+    
+    def _glifo(self, caractere):
+        glifo = self._glifos.get(caractere)
+        if glifo is None:
+            _, _, direita, base = self.fonte.getbbox(caractere)
+            glifo = self._glifos[caractere] = (self.fonte.getlength(caractere), direita, base)
+        return glifo
+    
+    def largura(self, texto):
+        """Soma dos avanços (posição da caneta depois do texto)"""
+        return sum(self._glifo(caractere)[0] for caractere in texto)
+    
+    def extensao(self, linha):
+        """Borda direita e base da linha, como em textbbox, sem layout do FreeType"""
+        if not linha:
+            return 0, 0
+        direita = self.largura(linha[:-1]) + self._glifo(linha[-1])[1]
+        return direita, max(self._glifo(caractere)[2] for caractere in linha)
+
+class LayoutTexto:
+    """
+    Ajuste de títulos na caixa do post. As fontes são carregadas uma vez por
+    (arquivo, tamanho) e as larguras saem da soma dos avanços de glifo em
+    cache, então a busca binária pelo maior tamanho que cabe não precisa de
+    nenhum layout do FreeType; só o resultado final é conferido com textbbox.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fontes = {}  # {(caminho, tamanho): _FonteMedida}
+        self._estatisticas = {"ajustes": 0, "fontes_carregadas": 0, "passos_busca": 0, "correcoes": 0}
+    
+    def _medida(self, caminho, tamanho):
+        chave = (caminho, tamanho)
+        with self._lock:
+            medida = self._fontes.get(chave)
+            if medida is None:
+                medida = self._fontes[chave] = _FonteMedida(caminho, tamanho)
+                self._estatisticas["fontes_carregadas"] += 1
+            return medida
+    
+    def fonte(self, caminho, tamanho):
+        return self._medida(caminho, tamanho).fonte
+    
+    @staticmethod
+    def quebrar_linhas(texto, medida, largura_max):
+        """
+        Quebra gulosa pela largura real em pixels. Como no textwrap, uma palavra
+        maior que a linha inteira é partida, começando no espaço que sobra na linha atual.
+        """
+        largura_espaco = medida.largura(" ")
+        linhas, atual, largura_atual = [], "", 0.0
+        
+        def cabe(inicio, trecho):
+            # A linha é limitada pela borda direita do último glifo, não pelo avanço
+            return inicio + medida.extensao(trecho)[0] <= largura_max
+        
+        for palavra in texto.split():
+            if atual and cabe(largura_atual + largura_espaco, palavra):
+                atual += " " + palavra
+                largura_atual += largura_espaco + medida.largura(palavra)
+                continue
+            
+            while not cabe(0, palavra) and len(palavra) > 1:
+                inicio = largura_atual + largura_espaco if atual else 0
+                corte = len(palavra) - 1
+                while corte > 0 and not cabe(inicio, palavra[:corte]):
+                    corte -= 1
+                if corte == 0 and atual:
+                    linhas.append(atual)
+                    atual, largura_atual = "", 0.0
+                    continue
+                corte = max(corte, 1)
+                linhas.append(f"{atual} {palavra[:corte]}" if atual else palavra[:corte])
+                atual, largura_atual = "", 0.0
+                palavra = palavra[corte:]
+            
+            if atual:
+                linhas.append(atual)
+            atual, largura_atual = palavra, medida.largura(palavra)
+        
+        if atual:
+            linhas.append(atual)
+        return linhas
+    
+    def _cabe(self, titulo, caminho, tamanho, largura_max, altura_max):
+        medida = self._medida(caminho, tamanho)
+        linhas = self.quebrar_linhas(titulo, medida, largura_max)
+        if not linhas:
+            return True, linhas
+        largura = max(medida.extensao(linha)[0] for linha in linhas)
+        altura = (len(linhas) - 1) * medida.passo_linha + medida.extensao(linhas[-1])[1]
+        return largura <= largura_max and altura <= altura_max, linhas
+    
+    def ajustar(self, draw, titulo, caminho, largura_max, altura_max, tamanho_max=52, tamanho_min=36):
+        """
+        Maior tamanho de fonte entre tamanho_min e tamanho_max em que o título
+        quebrado cabe na caixa. Retorna (fonte, texto_quebrado, largura, altura);
+        se nada couber, usa tamanho_min.
+        """
+        inicio, fim = tamanho_min, tamanho_max
+        melhor = None
+        passos = 0
+        while inicio <= fim:
+            meio = (inicio + fim) // 2
+            passos += 1
+            cabe, linhas = self._cabe(titulo, caminho, meio, largura_max, altura_max)
+            if cabe:
+                melhor = (meio, linhas)
+                inicio = meio + 1
+            else:
+                fim = meio - 1
+        
+        # A quebra de linha torna o encaixe só quase monotônico; confere os tamanhos logo acima
+        if melhor:
+            for tamanho in range(min(melhor[0] + VIZINHOS_CONFERIDOS, tamanho_max), melhor[0], -1):
+                passos += 1
+                cabe, linhas = self._cabe(titulo, caminho, tamanho, largura_max, altura_max)
+                if cabe:
+                    melhor = (tamanho, linhas)
+                    break
+        
+        tamanho, linhas = melhor or (tamanho_min, self._cabe(titulo, caminho, tamanho_min, largura_max, altura_max)[1])
+        
+        # Conferência com o layout real (kerning, bordas dos glifos); recua se estourar
+        correcoes = 0
+        while True:
+            fonte = self.fonte(caminho, tamanho)
+            texto_fmt = "\n".join(linhas)
+            _, _, largura, altura = draw.textbbox((0, 0), texto_fmt, font=fonte)
+            if (largura <= largura_max and altura <= altura_max) or tamanho <= tamanho_min:
+                break
+            tamanho -= 1
+            correcoes += 1
+            linhas = self._cabe(titulo, caminho, tamanho, largura_max, altura_max)[1]
+        
+        with self._lock:
+            self._estatisticas["ajustes"] += 1
+            self._estatisticas["passos_busca"] += passos
+            self._estatisticas["correcoes"] += correcoes
+        return fonte, texto_fmt, largura, altura
+    
+    def contadores(self):
+        with self._lock:
+            return dict(self._estatisticas)
+    
+    def mesclar(self, contadores):
+        """Soma contadores vindos de outro processo (pool de renderização)"""
+        with self._lock:
+            for campo, valor in contadores.items():
+                self._estatisticas[campo] = self._estatisticas.get(campo, 0) + valor
+    
+    def estatisticas(self):
+        with self._lock:
+            resultado = dict(self._estatisticas)
+        resultado["passos_por_ajuste"] = round(resultado["passos_busca"] / resultado["ajustes"], 2) if resultado["ajustes"] else 0.0
+        return resultado
+
+# Instância global compartilhada
+layout_texto = LayoutTexto()
@@ -0,0 +1,138 @@
+import hashlib
+import math
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from config import carregar_config
+from database import Database
+
+class CotaAdiada(Exception):
+    """Busca não realizada para preservar a cota diária ou o limite por segundo"""
+
+class _Balde:
+    def __init__(self, taxa):
+        self.taxa = taxa
+        self.capacidade = max(1.0, taxa)
+        self.tokens = self.capacidade
+        self.ultimo = time.monotonic()
+        self.bloqueado_ate = 0.0
+    
+    def reabastecer(self):
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+        self.ultimo = agora
+
+class LimitadorCota:
+    """
+    Token bucket por API e chave, com orçamento diário persistido no banco.
+    Quando o consumo está adiantado em relação ao ritmo do dia, as categorias
+    de menor prioridade (as últimas em categorias_ativas) são adiadas para
+    manter as principais atualizadas até a virada da cota (meia-noite UTC).
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baldes = {}  # {(provedor, chave): _Balde}
+        self._uso = {}  # {(provedor, chave, dia): usados}
+        self._adiadas = {}  # {provedor: quantidade}
+    
+    @staticmethod
+    def _hash_chave(chave_api):
+        return hashlib.sha256((chave_api or "").encode("utf-8")).hexdigest()[:12]
+    
+    @staticmethod
+    def _dia_atual():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    
+    @staticmethod
+    def _fracao_restante_dia():
+        agora = datetime.now(timezone.utc)
+        segundos = agora.hour * 3600 + agora.minute * 60 + agora.second
+        return max(0.0, (86400 - segundos) / 86400)
+    
+    def _usados(self, provedor, chave, dia):
+        if (provedor, chave, dia) not in self._uso:
+            self._uso = {k: v for k, v in self._uso.items() if k[2] == dia}
+            self._uso[(provedor, chave, dia)] = Database.obter_uso_cota(provedor, chave, dia)
+        return self._uso[(provedor, chave, dia)]
+    
+    def _adiar(self, provedor, motivo):
+        self._adiadas[provedor] = self._adiadas.get(provedor, 0) + 1
+        raise CotaAdiada(motivo)
+    
+    def reservar(self, provedor, chave_api, prioridade=0, total_prioridades=1):
+        """
+        Consome uma requisição da cota do provedor ou levanta CotaAdiada.
+        Espera pelo token bucket no máximo cota_espera_max segundos.
+        """
+        cfg = carregar_config()
+        cota = cfg.get("cota_diaria", {}).get(provedor)
+        taxa = float(cfg.get("cota_por_segundo", {}).get(provedor, 1))
+        espera_max = float(cfg.get("cota_espera_max", 30))
+        chave = self._hash_chave(chave_api)
+        dia = self._dia_atual()
+        
+        with self._lock:
+            if cota:
+                restante = cota - self._usados(provedor, chave, dia)
+                if restante <= 0:
+                    self._adiar(provedor, f"cota diária de {cota} requisições esgotada")
+                
+                # Abaixo do ritmo ideal só as categorias mais prioritárias continuam
+                ritmo_ideal = cota * self._fracao_restante_dia()
+                if restante < ritmo_ideal:
+                    permitidas = max(1, math.ceil(restante / ritmo_ideal * total_prioridades))
+                    if prioridade >= permitidas:
+                        self._adiar(provedor, f"prioridade {prioridade + 1}/{total_prioridades} adiada ({restante} requisições restantes hoje)")
+            
+            balde = self._baldes.get((provedor, chave))
+            if balde is None or balde.taxa != taxa:
+                balde = self._baldes[(provedor, chave)] = _Balde(taxa)
+        
+        limite = time.monotonic() + espera_max
+        while True:
+            with self._lock:
+                balde.reabastecer()
+                agora = time.monotonic()
+                if agora >= balde.bloqueado_ate and balde.tokens >= 1:
+                    balde.tokens -= 1
+                    if cota:
+                        self._uso[(provedor, chave, dia)] = self._usados(provedor, chave, dia) + 1
+                    break
+                espera = max(balde.bloqueado_ate - agora, (1 - balde.tokens) / balde.taxa if balde.taxa > 0 else espera_max)
+            
+            if time.monotonic() + espera > limite:
+                with self._lock:
+                    self._adiar(provedor, "limite de requisições por segundo")
+            time.sleep(espera)
+        
+        if cota:
+            Database.registrar_uso_cota(provedor, chave, dia)
+    
+    def registrar_limite_excedido(self, provedor, chave_api, pausa=60):
+        """Pausa o balde após um HTTP 429 do provedor"""
+        chave = self._hash_chave(chave_api)
+        with self._lock:
+            balde = self._baldes.get((provedor, chave))
+            if balde:
+                balde.tokens = 0
+                balde.bloqueado_ate = time.monotonic() + pausa
+        logging.warning(f"[COTA] {provedor} retornou 429. Pausando requisições por {pausa}s.")
+    
+    def estatisticas(self):
+        cfg = carregar_config()
+        dia = self._dia_atual()
+        with self._lock:
+            resultado = {}
+            for (provedor, chave, dia_uso), usados in self._uso.items():
+                if dia_uso != dia:
+                    continue
+                info = resultado.setdefault(provedor, {"usados_hoje": 0, "cota_diaria": cfg.get("cota_diaria", {}).get(provedor)})
+                info["usados_hoje"] += usados
+            for provedor, adiadas in self._adiadas.items():
+                resultado.setdefault(provedor, {"usados_hoje": 0, "cota_diaria": cfg.get("cota_diaria", {}).get(provedor)})["adiadas"] = adiadas
+            return resultado
+
+# Instância global compartilhada entre agentes
+limitador_cota = LimitadorCota()
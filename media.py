@@ -1,48 +1,255 @@
 import os
-import requests
-import textwrap
-import numpy as np
+import threading
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageDraw, UnidentifiedImageError
 import logging
 from config import BASE_DIR, carregar_config
+from cache_imagens import cache_imagens, ImagemInvalida
+from indice_imagens import hash_diferenca
+from layout_texto import layout_texto
+
+# Lado máximo da miniatura usada na checagem de imagem escura
+LADO_MINIATURA = 256
+# Bytes lidos antes de desistir de achar as dimensões no cabeçalho
+MAX_BYTES_CABECALHO = 1024 * 1024
+
+LARGURA_POST, ALTURA_POST = 1080, 1350
+# Recorte do post reduzido 5x, usado na avaliação de qualidade
+AMOSTRA_QUALIDADE = (LARGURA_POST // 5, ALTURA_POST // 5)
+
+# Pesos da média geométrica das notas de qualidade (somam 1)
+PESOS_QUALIDADE = {"brilho": 0.15, "contraste": 0.2, "nitidez": 0.3, "resolucao": 0.25, "bordas": 0.1}
+
+# Camadas fixas do post (escurecimento + overlay da marca) já combinadas,
+# por (opacidade, tamanho, arquivo do overlay, mtime do arquivo)
+MAX_CAMADAS_FIXAS = 8
+_camadas_fixas = OrderedDict()
+_camadas_lock = threading.Lock()
+
+class ImagemValidada:
+    """Imagem aceita: caminho no cache, dHash e distância até a imagem já vista mais parecida (None se nenhuma)"""
+    
+    def __init__(self, caminho, phash, distancia_duplicata=None):
+        self.caminho = caminho
+        self.phash = phash
+        self.distancia_duplicata = distancia_duplicata
 
 class MediaProcessor:
+
+    @staticmethod
+    def _camada_fixa(opacidade, tamanho, caminho_overlay):
+        """
+        Escurecimento na opacidade pedida com o overlay por cima, numa só
+        camada RGBA. Montada uma vez e reaproveitada até o overlay mudar no disco.
+        """
+        try:
+            mtime = os.stat(caminho_overlay).st_mtime_ns
+        except OSError:
+            mtime = None
+        chave = (round(float(opacidade), 4), tamanho, caminho_overlay, mtime)
+        
+        with _camadas_lock:
+            camada = _camadas_fixas.get(chave)
+            if camada is not None:
+                _camadas_fixas.move_to_end(chave)
+                return camada
+        
+        camada = Image.new('RGBA', tamanho, (0, 0, 0, int(255 * opacidade)))
+        if mtime is not None:
+            try:
+                with Image.open(caminho_overlay) as overlay_personalizado:
+                    camada = Image.alpha_composite(camada, overlay_personalizado.convert("RGBA").resize(tamanho))
+            except FileNotFoundError:
+                pass
+        
+        with _camadas_lock:
+            # Versões antigas do mesmo overlay não serão mais usadas
+            for antiga in [c for c in _camadas_fixas if c[:3] == chave[:3]]:
+                del _camadas_fixas[antiga]
+            _camadas_fixas[chave] = camada
+            while len(_camadas_fixas) > MAX_CAMADAS_FIXAS:
+                _camadas_fixas.popitem(last=False)
+        return camada
+    
+    @staticmethod
+    def _verificador_dimensoes(cfg):
+        """
+        Verificação feita durante o download: assim que os bytes recebidos
+        contêm o cabeçalho, recusa imagens pequenas demais ou grandes demais
+        sem esperar pelo resto do arquivo.
+        """
+        min_lado = int(cfg.get("imagem_min_lado", 200))
+        max_pixels = float(cfg.get("imagem_max_megapixels", 50)) * 1_000_000
+        
+        def verificar(parcial):
+            try:
+                # Image.open só lê o cabeçalho; os pixels não são decodificados
+                with Image.open(BytesIO(parcial)) as imagem:
+                    largura, altura = imagem.size
+            except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+                if len(parcial) >= MAX_BYTES_CABECALHO:
+                    raise ImagemInvalida("cabeçalho da imagem ilegível")
+                return None
+            
+            if min(largura, altura) < min_lado:
+                raise ImagemInvalida(f"pequena demais ({largura}x{altura})")
+            if largura * altura > max_pixels:
+                raise ImagemInvalida(f"grande demais ({largura}x{altura})")
+            return True
+        
+        return verificar
+    
+    @staticmethod
+    def _fracao_escura(caminho):
+        """Fração de pixels escuros, medida numa miniatura em tons de cinza"""
+        with Image.open(caminho) as imagem:
+            # Em JPEG, draft decodifica já reduzido (escala do DCT) e em cinza
+            imagem.draft("L", (LADO_MINIATURA, LADO_MINIATURA))
+            imagem.thumbnail((LADO_MINIATURA, LADO_MINIATURA), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            dados_imagem = np.asarray(imagem.convert("L"))
+        return np.count_nonzero(dados_imagem <= 15) / dados_imagem.size
     
     @staticmethod
-    def validar_imagem(url_imagem):
+    def _amostra_recortada(caminho):
+        """
+        Região da imagem que aparece no post (recorte de cobertura 4:5),
+        reduzida para AMOSTRA_QUALIDADE em tons de cinza, e o fator de
+        ampliação que a imagem original sofre para cobrir 1080x1350.
+        """
+        with Image.open(caminho) as imagem:
+            largura, altura = imagem.size
+            ampliacao = max(LARGURA_POST / largura, ALTURA_POST / altura)
+            
+            imagem.draft("L", (AMOSTRA_QUALIDADE[0] * 2, AMOSTRA_QUALIDADE[1] * 2))
+            w, h = imagem.size
+            escala = max(LARGURA_POST / w, ALTURA_POST / h)
+            recorte_w, recorte_h = LARGURA_POST / escala, ALTURA_POST / escala
+            caixa = ((w - recorte_w) / 2, (h - recorte_h) / 2, (w + recorte_w) / 2, (h + recorte_h) / 2)
+            amostra = imagem.convert("L").resize(AMOSTRA_QUALIDADE, Image.Resampling.BILINEAR, box=caixa, reducing_gap=2.0)
+        return np.asarray(amostra, dtype=np.float32), ampliacao
+    
+    @staticmethod
+    def avaliar_qualidade(caminhos):
+        """
+        Avalia um lote de imagens de uma vez. Retorna, na mesma ordem, um
+        dicionário com as métricas, as notas (0 a 1) e o score final
+        (média geométrica ponderada das notas), ou None se a imagem não abrir.
+        """
+        amostras, ampliacoes, indices = [], [], []
+        for i, caminho in enumerate(caminhos):
+            try:
+                amostra, ampliacao = MediaProcessor._amostra_recortada(caminho)
+            except Exception as e:
+                logging.warning(f"[IMAGEM] Falha ao avaliar qualidade de {caminho}: {e}")
+                continue
+            amostras.append(amostra)
+            ampliacoes.append(ampliacao)
+            indices.append(i)
+        
+        resultados = [None] * len(caminhos)
+        if not amostras:
+            return resultados
+        
+        lote = np.stack(amostras) / 255.0  # (N, altura, largura)
+        ampliacao = np.array(ampliacoes, dtype=np.float32)
+        
+        brilho = lote.mean(axis=(1, 2))
+        contraste = lote.std(axis=(1, 2))
+        
+        # Variância do laplaciano (4 vizinhos): baixa em imagens borradas
+        laplaciano = (lote[:, 1:-1, :-2] + lote[:, 1:-1, 2:] + lote[:, :-2, 1:-1] + lote[:, 2:, 1:-1]
+                      - 4 * lote[:, 1:-1, 1:-1])
+        nitidez = laplaciano.var(axis=(1, 2)) * 255 ** 2
+        
+        # Faixas de 8% em cada lado quase sem variação indicam tarjas/letterbox
+        faixa_h = max(1, lote.shape[1] * 8 // 100)
+        faixa_w = max(1, lote.shape[2] * 8 // 100)
+        faixas = [lote[:, :faixa_h, :], lote[:, -faixa_h:, :], lote[:, :, :faixa_w], lote[:, :, -faixa_w:]]
+        bordas_uniformes = np.mean([faixa.std(axis=(1, 2)) < 0.02 for faixa in faixas], axis=0)
+        
+        notas = {
+            "brilho": np.clip(np.minimum(brilho, 1 - brilho) / 0.15, 0, 1),
+            "contraste": np.clip(contraste / 0.15, 0, 1),
+            "nitidez": np.clip(nitidez / 150.0, 0, 1),
+            "resolucao": np.clip((2.5 - ampliacao) / 1.5, 0, 1),
+            "bordas": 1 - bordas_uniformes
+        }
+        score = np.exp(sum(peso * np.log(np.maximum(notas[nome], 1e-3)) for nome, peso in PESOS_QUALIDADE.items()))
+        
+        for posicao, i in enumerate(indices):
+            resultados[i] = {
+                "score": round(float(score[posicao]), 3),
+                "brilho": round(float(brilho[posicao]), 3),
+                "contraste": round(float(contraste[posicao]), 3),
+                "nitidez": round(float(nitidez[posicao]), 1),
+                "ampliacao": round(float(ampliacao[posicao]), 2),
+                "bordas_uniformes": round(float(bordas_uniformes[posicao]), 2),
+                "notas": {nome: round(float(valor[posicao]), 3) for nome, valor in notas.items()}
+            }
+        return resultados
+    
+    @staticmethod
+    def motivo_baixa_qualidade(avaliacao, score_minimo, notas_minimas):
+        """Motivo da reprovação pela avaliação de qualidade, ou None se a imagem passa"""
+        if avaliacao is None:
+            return "imagem ilegível"
+        for nome, minimo in notas_minimas.items():
+            nota = avaliacao["notas"].get(nome)
+            if nota is not None and nota < minimo:
+                return f"{nome} {nota:.2f} < {minimo:.2f}"
+        if avaliacao["score"] < score_minimo:
+            return f"score {avaliacao['score']:.2f} < {score_minimo:.2f}"
+        return None
+    
+    @staticmethod
+    def validar_imagem(url_imagem, indice_imagens=None, distancia_max=6):
+        """
+        Retorna uma ImagemValidada se a imagem for válida, senão None. Com
+        indice_imagens, a distância até uma já vista (a até distancia_max bits)
+        vem em distancia_duplicata; recusar ou rebaixar fica com o chamador.
+        """
         if not url_imagem:
-            return False
+            return None
+        
+        cfg = carregar_config()
         
         try:
-            response = requests.get(url_imagem, timeout=10)
-            response.raise_for_status()
-            
-            imagem = Image.open(BytesIO(response.content))
-            dados_imagem = np.array(imagem.convert("L"))
+            caminho_cache = cache_imagens.obter(
+                url_imagem,
+                limite_bytes=int(float(cfg.get("imagem_max_mb", 15)) * 1024 * 1024),
+                verificar_parcial=MediaProcessor._verificador_dimensoes(cfg)
+            )
             
-            if (np.sum(dados_imagem <= 15) / dados_imagem.size) * 100 > 95:
+            if MediaProcessor._fracao_escura(caminho_cache) > 0.95:
                 logging.warning(f"[IMAGEM] Imagem ignorada: predominantemente preta.")
-                return False
-            
-            return True
+                return None
             
+            phash = hash_diferenca(caminho_cache)
+            distancia = indice_imagens.mais_proxima(phash, distancia_max) if indice_imagens is not None else None
+            return ImagemValidada(caminho_cache, phash, distancia)
+        
+        except ImagemInvalida as e:
+            logging.warning(f"[IMAGEM] Imagem recusada {url_imagem}: {e}")
+            return None
         except Exception as e:
             logging.warning(f"[IMAGEM] Falha ao analisar imagem {url_imagem}: {e}")
-            return False
+            return None
     
     @staticmethod
-    def criar_imagem_post(titulo, url_imagem, categoria_ia):
-        cfg = carregar_config()
-        
-        W, H = 1080, 1350
+    def _compor_post(titulo, url_imagem, categoria_ia, caminho_cache, cfg):
+        """Monta a imagem RGB do post (fundo, camada fixa e textos); None se o fundo não carregar"""
+        W, H = LARGURA_POST, ALTURA_POST
         
         fonte_path = os.path.join(BASE_DIR, "minha_fonte.ttf")
-        img_final_path = os.path.join(BASE_DIR, "post_gerado.png")
         
         try:
-            img_fundo = Image.open(BytesIO(requests.get(url_imagem, timeout=10).content))
-            img_fundo = img_fundo.convert("RGBA")
+            # Usa a cópia guardada na validação; só baixa se ela não existir mais
+            if not caminho_cache or not os.path.exists(caminho_cache):
+                caminho_cache = cache_imagens.obter(url_imagem)
+            with Image.open(caminho_cache) as imagem:
+                img_fundo = imagem.convert("RGBA")
             
             # Calcular dimensões mantendo proporção
             img_w, img_h = img_fundo.size
@@ -70,52 +277,60 @@ class MediaProcessor:
             # Garantir que a imagem final tenha exatamente as dimensões corretas
             if img_fundo.size != (W, H):
                 img_fundo = img_fundo.resize((W, H), Image.Resampling.LANCZOS)
-            
+        
         except Exception as e:
             logging.error(f"[IMAGEM] Falha ao carregar imagem {url_imagem}. Erro: {e}")
             return None
         
-        overlay = Image.new('RGBA', (W, H), (0, 0, 0, int(255 * cfg["opacidade"])))
-        base = Image.alpha_composite(img_fundo, overlay)
-        
-        try:
-            overlay_personalizado = Image.open(os.path.join(BASE_DIR, "overlay.png"))
-            overlay_personalizado = overlay_personalizado.convert("RGBA").resize((W, H))
-            base = Image.alpha_composite(base, overlay_personalizado)
-        except FileNotFoundError:
-            pass
+        camada = MediaProcessor._camada_fixa(cfg.get("opacidade", 0.3), (W, H),
+                                             os.path.join(BASE_DIR, cfg.get("arquivo_overlay", "overlay.png")))
+        base = Image.alpha_composite(img_fundo, camada)
         
         draw = ImageDraw.Draw(base)
         M_ESQ, M_DIR, V_INI = 110, 110, H * 0.60
         caixa_w = W - M_ESQ - M_DIR
         caixa_h = H - V_INI - 50
         
-        fonte_categoria = ImageFont.truetype(fonte_path, 32)
+        fonte_categoria = layout_texto.fonte(fonte_path, 32)
         categoria_texto = f"#{categoria_ia.upper()}"
         _, _, cat_w, cat_h = draw.textbbox((0, 0), categoria_texto, font=fonte_categoria)
         
         espacamento_cat_titulo = 25
         caixa_h_titulo = caixa_h - cat_h - espacamento_cat_titulo
         
-        tamanho_fonte = 52
-        texto_fmt = titulo
-        
-        while tamanho_fonte >= 36:
-            fonte = ImageFont.truetype(fonte_path, tamanho_fonte)
-            char_w = fonte.getbbox('a')[2]
-            chars_linha = int(caixa_w / char_w) if char_w > 0 else 1
-            texto_fmt = "\n".join(textwrap.wrap(titulo, width=chars_linha))
-            _, _, w, h = draw.textbbox((0, 0), texto_fmt, font=fonte)
-            
-            if w <= caixa_w and h <= caixa_h_titulo:
-                break
-            tamanho_fonte -= 2
+        fonte, texto_fmt, w, h = layout_texto.ajustar(draw, titulo, fonte_path, caixa_w, caixa_h_titulo,
+                                                      tamanho_max=52, tamanho_min=36)
         
         pos_cat_y = V_INI + (caixa_h - (cat_h + espacamento_cat_titulo + h)) / 2
         draw.text((M_ESQ, pos_cat_y), categoria_texto, font=fonte_categoria, fill="white", align="left")
         
         pos_y_titulo = pos_cat_y + cat_h + espacamento_cat_titulo
         draw.text((M_ESQ, pos_y_titulo), texto_fmt, font=fonte, fill="white", align="left")
+        return base.convert("RGB")
+    
+    @staticmethod
+    def criar_imagem_post(titulo, url_imagem, categoria_ia, caminho_cache=None, cfg=None, caminho_saida=None):
+        """
+        Gera a imagem do post em caminho_saida (padrão: post_gerado.png).
+        cfg permite usar a opacidade e o overlay de um agente.
+        """
+        imagem = MediaProcessor._compor_post(titulo, url_imagem, categoria_ia, caminho_cache, cfg or carregar_config())
+        if imagem is None:
+            return None
         
-        base.convert("RGB").save(img_final_path)
-        return img_final_path
\ No newline at end of file
+        img_final_path = caminho_saida or os.path.join(BASE_DIR, "post_gerado.png")
+        # Grava num temporário e renomeia: quem lê o arquivo nunca vê uma imagem pela metade
+        caminho_tmp = f"{img_final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        imagem.save(caminho_tmp, format="PNG")
+        os.replace(caminho_tmp, img_final_path)
+        return img_final_path
+    
+    @staticmethod
+    def criar_imagem_post_bytes(titulo, url_imagem, categoria_ia, caminho_cache=None, cfg=None):
+        """Como criar_imagem_post, mas retorna o PNG em memória sem gravar arquivo"""
+        imagem = MediaProcessor._compor_post(titulo, url_imagem, categoria_ia, caminho_cache, cfg or carregar_config())
+        if imagem is None:
+            return None
+        saida = BytesIO()
+        imagem.save(saida, format="PNG")
+        return saida.getvalue()
\ No newline at end of file
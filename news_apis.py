@@ -1,13 +1,53 @@
 import requests
 import logging
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from config import carregar_config
+from http_client import cliente_http
+from cache_busca import cache_busca
+from limitador_cota import limitador_cota, CotaAdiada
+from database import Database
 from datetime import datetime, timedelta, timezone
 
+# Semáforos por API compartilhados entre agentes (limitam buscas simultâneas)
+_semaforos_api = {}  # {api: (limite, semáforo)}
+_semaforos_lock = threading.Lock()
+
 class NewsAPIs:
     
     @staticmethod
-    def get_gnews(categoria, idioma, pais):
+    def _parse_data(data_str, sem_fuso=False):
+        """
+        Converte uma data ISO 8601 em datetime (UTC ou, com sem_fuso, sem timezone)
+        """
+        data_obj = datetime.fromisoformat(data_str.replace('Z', '+00:00'))
+        if sem_fuso:
+            return data_obj.replace(tzinfo=None)
+        if data_obj.tzinfo is None:
+            return data_obj.replace(tzinfo=timezone.utc)
+        return data_obj
+    
+    @staticmethod
+    def _requisitar_json(url, provedor=None, chave_api=None, prioridade=0, total_prioridades=1):
+        """
+        GET com resposta JSON, compartilhado entre agentes pelo cache de buscas.
+        Com provedor, a requisição só sai se houver cota (senão levanta CotaAdiada).
+        """
+        def baixar():
+            if provedor:
+                limitador_cota.reservar(provedor, chave_api, prioridade, total_prioridades)
+            response = cliente_http.get(url)
+            if provedor and response.status_code == 429:
+                limitador_cota.registrar_limite_excedido(provedor, chave_api)
+            response.raise_for_status()
+            return response.json()
+        
+        return cache_busca.obter(url, baixar)
+    
+    @staticmethod
+    def get_gnews(categoria, idioma, pais, desde=None, prioridade=0, total_prioridades=1):
         cfg = carregar_config()
         
         if not cfg.get("gnews_api_key"):
@@ -17,12 +57,15 @@ class NewsAPIs:
         
         try:
             logging.info(f"[BUSCA] Buscando em GNews/{categoria} ({pais.upper()})...")
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            articles = response.json().get("articles", [])
+            articles = NewsAPIs._requisitar_json(url, 'gnews', cfg['gnews_api_key'], prioridade, total_prioridades).get("articles", [])
             
-            # Filtro temporal - últimas 3 horas
-            ponto_de_corte = datetime.now(timezone.utc) - timedelta(hours=3)
+            # Filtro temporal - após o cursor salvo ou, na primeira busca, últimas 3 horas
+            if desde:
+                ponto_de_corte = NewsAPIs._parse_data(desde)
+                janela = "após o cursor"
+            else:
+                ponto_de_corte = datetime.now(timezone.utc) - timedelta(hours=3)
+                janela = "últimas 3h"
             noticias_filtradas = []
             
             for article in articles:
@@ -30,27 +73,31 @@ class NewsAPIs:
                 if not data_publicacao_str:
                     continue
                 
-                data_publicacao_obj = datetime.fromisoformat(data_publicacao_str.replace('Z', '+00:00'))
+                data_publicacao_obj = NewsAPIs._parse_data(data_publicacao_str)
                 
-                if data_publicacao_obj >= ponto_de_corte:
+                if data_publicacao_obj > ponto_de_corte or (not desde and data_publicacao_obj == ponto_de_corte):
                     noticias_filtradas.append(article)
             
-            logging.info(f"[FILTRO] GNews/{categoria}: {len(articles)} recebidos, {len(noticias_filtradas)} aprovados (últimas 3h).")
+            logging.info(f"[FILTRO] GNews/{categoria}: {len(articles)} recebidos, {len(noticias_filtradas)} aprovados ({janela}).")
             
             return [{
                 "title": article.get("title"),
                 "description": article.get("description"),
                 "content": article.get("content"),
                 "image": article.get("image"),
-                "source": {"name": article.get("source", {}).get("name")}
+                "source": {"name": article.get("source", {}).get("name")},
+                "data_publicacao": NewsAPIs._parse_data(article["publishedAt"]).isoformat()
             } for article in noticias_filtradas]
             
+        except CotaAdiada as e:
+            logging.info(f"[COTA] GNews/{categoria} ({pais.upper()}) adiada: {e}")
+            return []
         except Exception as e:
             logging.error(f"[BUSCA] ERRO ao buscar em GNews/{categoria} ({pais.upper()}): {e}")
             return []
     
     @staticmethod
-    def get_newsdata(categoria, idioma, pais):
+    def get_newsdata(categoria, idioma, pais, desde=None, prioridade=0, total_prioridades=1):
         cfg = carregar_config()
         
         if not cfg.get("newsdata_api_key"):
@@ -68,24 +115,46 @@ class NewsAPIs:
         
         try:
             logging.info(f"[BUSCA] Buscando em NewsData/{categoria} ({pais.upper()})...")
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            articles = response.json().get("results", [])
+            articles = NewsAPIs._requisitar_json(url, 'newsdata', cfg['newsdata_api_key'], prioridade, total_prioridades).get("results", [])
             
-            return [{
-                "title": article.get("title"),
-                "description": article.get("description"),
-                "content": article.get("content"),
-                "image": article.get("image_url"),
-                "source": {"name": article.get("source_id")}
-            } for article in articles]
+            ponto_de_corte = NewsAPIs._parse_data(desde) if desde else None
+            noticias = []
+            for article in articles:
+                # pubDate vem como 'AAAA-MM-DD HH:MM:SS' em UTC
+                data_publicacao = None
+                if article.get("pubDate"):
+                    try:
+                        data_publicacao = NewsAPIs._parse_data(article["pubDate"].replace(' ', 'T'))
+                    except ValueError:
+                        pass
+                
+                # Sem cursor não há filtro temporal; com cursor só passam artigos mais novos
+                if ponto_de_corte and (data_publicacao is None or data_publicacao <= ponto_de_corte):
+                    continue
+                
+                noticias.append({
+                    "title": article.get("title"),
+                    "description": article.get("description"),
+                    "content": article.get("content"),
+                    "image": article.get("image_url"),
+                    "source": {"name": article.get("source_id")},
+                    "data_publicacao": data_publicacao.isoformat() if data_publicacao else None
+                })
             
+            if desde:
+                logging.info(f"[FILTRO] NewsData/{categoria}: {len(articles)} recebidos, {len(noticias)} aprovados (após o cursor).")
+            
+            return noticias
+            
+        except CotaAdiada as e:
+            logging.info(f"[COTA] NewsData/{categoria} ({pais.upper()}) adiada: {e}")
+            return []
         except Exception as e:
             logging.error(f"[BUSCA] ERRO ao buscar em NewsData/{categoria} ({pais.upper()}): {e}")
             return []
     
     @staticmethod
-    def get_local_news(pasta_feed=None):
+    def get_local_news(pasta_feed=None, desde=None):
         """
         Busca notícias via API REST do servidor interno
         """
@@ -96,12 +165,15 @@ class NewsAPIs:
         logging.info(f"[BUSCA] Buscando via API REST: {api_url}")
         
         try:
-            response = requests.get(api_url, timeout=15)
-            response.raise_for_status()
-            articles = response.json()
+            articles = NewsAPIs._requisitar_json(api_url)
             
-            # Filtro temporal - últimos 30 minutos
-            ponto_de_corte = datetime.now() - timedelta(minutes=30)
+            # Filtro temporal - após o cursor salvo ou, na primeira busca, últimos 30 minutos
+            if desde:
+                ponto_de_corte = NewsAPIs._parse_data(desde, sem_fuso=True)
+                janela = "após o cursor"
+            else:
+                ponto_de_corte = datetime.now() - timedelta(minutes=30)
+                janela = "últimos 30min"
             noticias_filtradas = []
             
             for article in articles:
@@ -111,17 +183,17 @@ class NewsAPIs:
                 
                 # Converte a data ISO 8601 para datetime
                 try:
-                    date_inserted_obj = datetime.fromisoformat(date_inserted_str.replace('Z', '+00:00'))
                     # Remove timezone info para comparar com datetime local
-                    date_inserted_obj = date_inserted_obj.replace(tzinfo=None)
+                    date_inserted_obj = NewsAPIs._parse_data(date_inserted_str, sem_fuso=True)
                 except ValueError:
                     # Se houver erro na conversão, pula o artigo
                     continue
                 
-                if date_inserted_obj >= ponto_de_corte:
+                if date_inserted_obj > ponto_de_corte or (not desde and date_inserted_obj == ponto_de_corte):
+                    article["_data_publicacao"] = date_inserted_obj.isoformat()
                     noticias_filtradas.append(article)
             
-            logging.info(f"[FILTRO] API REST Local: {len(articles)} recebidos, {len(noticias_filtradas)} aprovados (últimos 30min).")
+            logging.info(f"[FILTRO] API REST Local: {len(articles)} recebidos, {len(noticias_filtradas)} aprovados ({janela}).")
             
             return [{
                 "title": article.get("title"),
@@ -129,7 +201,8 @@ class NewsAPIs:
                 "content": article.get("content_text"),
                 "image": article.get("main_image_url"),
                 "source": {"name": article.get("source_name")},
-                "pasta": article.get("pasta")
+                "pasta": article.get("pasta"),
+                "data_publicacao": article["_data_publicacao"]
             } for article in noticias_filtradas]
             
         except requests.RequestException as e:
@@ -149,9 +222,7 @@ class NewsAPIs:
         logging.info(f"[CONFIG] Buscando pastas disponíveis: {api_url}")
         
         try:
-            response = requests.get(api_url, timeout=15)
-            response.raise_for_status()
-            articles = response.json()
+            articles = NewsAPIs._requisitar_json(api_url)
             
             # Extrai valores únicos do campo 'pasta'
             pastas_encontradas = set()
@@ -177,49 +248,175 @@ class NewsAPIs:
             return ['geral', 'esportes', 'tecnologia', 'politica', 'economia', 'saude', 'entretenimento']
     
     @staticmethod
-    def buscar_todas_noticias(agent_config=None):
-        if agent_config is None:
-            cfg = carregar_config()
+    def _buscar_combinacao(api, idioma, pais, categoria, prioridade, total_prioridades, pasta_feed, agent_id=None):
+        """
+        Busca uma única combinação api × idioma × categoria e anota os artigos.
+        Só repassa artigos mais novos que o cursor salvo. Retorna (artigos, cursor),
+        onde cursor é a chave da combinação com a data do artigo mais recente (ou None);
+        quem aproveita os artigos é quem avança o cursor.
+        """
+        desde = Database.obter_cursor_busca(api, categoria, idioma, pasta_feed, agent_id)
+        
+        if api == 'servidor_local':
+            artigos = NewsAPIs.get_local_news(pasta_feed, desde)
+            for artigo in artigos:
+                artigo['api_fonte'] = 'servidor_local'
+                artigo['idioma_original'] = 'pt'  # Assumindo português
+                artigo['categoria_busca'] = 'local'
+                artigo['pasta_feed'] = pasta_feed
         else:
-            cfg = agent_config
+            artigos = []
+            
+            if api == 'gnews':
+                artigos = NewsAPIs.get_gnews(categoria, idioma, pais, desde, prioridade, total_prioridades)
+            elif api == 'newsdata':
+                artigos = NewsAPIs.get_newsdata(categoria, idioma, pais, desde, prioridade, total_prioridades)
+            
+            for artigo in artigos:
+                artigo['api_fonte'] = api
+                artigo['idioma_original'] = idioma
+                artigo['categoria_busca'] = categoria
         
-        if not cfg.get("apis_ativas") or not cfg.get("idiomas_busca") or not cfg.get("categorias_ativas"):
-            return []
+        # Data do artigo mais recente repassado, para o cursor da combinação
+        datas = [artigo['data_publicacao'] for artigo in artigos if artigo.get('data_publicacao')]
+        cursor = None
+        if datas:
+            sem_fuso = api == 'servidor_local'
+            mais_recente = max(datas, key=lambda data: NewsAPIs._parse_data(data, sem_fuso))
+            cursor = (api, categoria, idioma, pasta_feed, mais_recente)
         
-        pasta_feed = cfg.get("pasta_feed", "geral")
-        logging.info(f"--- [BUSCA] Iniciando ciclo de busca nas APIs {cfg['apis_ativas']} (pasta: {pasta_feed}) ---")
-        todas_noticias = []
+        return artigos, cursor
+    
+    @staticmethod
+    def avancar_cursores(cursores, agent_id=None):
+        """Grava os cursores das combinações cujos artigos já foram processados"""
+        for api, categoria, idioma, pasta_feed, mais_recente in cursores:
+            Database.atualizar_cursor_busca(api, categoria, idioma, pasta_feed, mais_recente, agent_id)
+    
+    @staticmethod
+    def _montar_tarefas(cfg):
+        """
+        Lista as combinações de busca na mesma ordem do ciclo sequencial.
+        A posição da categoria em categorias_ativas define sua prioridade na cota.
+        """
+        tarefas = []
         
         for api in cfg["apis_ativas"]:
             # Condição especial para API local
             if api == 'servidor_local':
-                artigos = NewsAPIs.get_local_news(pasta_feed)
-                for artigo in artigos:
-                    artigo['api_fonte'] = 'servidor_local'
-                    artigo['idioma_original'] = 'pt'  # Assumindo português
-                    artigo['categoria_busca'] = 'local'
-                    artigo['pasta_feed'] = pasta_feed
-                todas_noticias.extend(artigos)
+                tarefas.append((api, 'pt', 'br', 'local', 0, 1))
                 continue  # Pula para próxima API
             
             # Lógica para APIs online
             for idioma in cfg["idiomas_busca"]:
                 pais = 'us' if idioma == 'en' else 'br'
                 
-                for categoria in cfg["categorias_ativas"]:
-                    artigos = []
-                    
-                    if api == 'gnews':
-                        artigos = NewsAPIs.get_gnews(categoria, idioma, pais)
-                    elif api == 'newsdata':
-                        artigos = NewsAPIs.get_newsdata(categoria, idioma, pais)
-                    
-                    for artigo in artigos:
-                        artigo['api_fonte'] = api
-                        artigo['idioma_original'] = idioma
-                        artigo['categoria_busca'] = categoria
-                    
-                    todas_noticias.extend(artigos)
+                total_prioridades = len(cfg["categorias_ativas"])
+                for prioridade, categoria in enumerate(cfg["categorias_ativas"]):
+                    tarefas.append((api, idioma, pais, categoria, prioridade, total_prioridades))
+        
+        return tarefas
+    
+    @staticmethod
+    def _semaforo_api(api, limites):
+        """
+        Semáforo compartilhado pelo processo que limita buscas simultâneas por API.
+        É recriado quando o limite configurado muda; buscas em andamento liberam
+        o semáforo antigo, que elas mesmas guardaram.
+        """
+        limite = max(1, int(limites.get(api, 2)))
+        with _semaforos_lock:
+            atual = _semaforos_api.get(api)
+            if atual is None or atual[0] != limite:
+                atual = _semaforos_api[api] = (limite, threading.BoundedSemaphore(limite))
+            return atual[1]
+    
+    @staticmethod
+    def _buscar_concorrente(tarefas, pasta_feed, agent_id=None):
+        """
+        Executa as buscas em um pool de threads respeitando o limite por API
+        e o prazo total do ciclo. Combinações que não terminam a tempo são descartadas
+        e não entram nos cursores retornados, para serem buscadas de novo no próximo ciclo.
+        """
+        cfg_global = carregar_config()
+        max_workers = max(1, int(cfg_global.get("busca_max_workers", 8)))
+        limites = cfg_global.get("busca_limite_por_api", {})
+        prazo = float(cfg_global.get("busca_prazo_ciclo", 90))
+        limite_tempo = time.monotonic() + prazo
+        
+        def executar(tarefa):
+            api = tarefa[0]
+            semaforo = NewsAPIs._semaforo_api(api, limites)
+            restante = limite_tempo - time.monotonic()
+            
+            if restante <= 0 or not semaforo.acquire(timeout=restante):
+                logging.warning(f"[BUSCA] Prazo do ciclo esgotado antes de buscar {api}/{tarefa[3]}.")
+                return [], None
+            
+            try:
+                return NewsAPIs._buscar_combinacao(*tarefa, pasta_feed, agent_id)
+            finally:
+                semaforo.release()
+        
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(tarefas)), thread_name_prefix="busca")
+        futures = [executor.submit(executar, tarefa) for tarefa in tarefas]
+        
+        concluidas, pendentes = wait(futures, timeout=max(0.0, limite_tempo - time.monotonic()))
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+        if pendentes:
+            logging.warning(f"[BUSCA] Prazo de {prazo:.0f}s esgotado: {len(pendentes)} de {len(tarefas)} buscas descartadas.")
+        
+        # Junta os resultados na ordem original das combinações
+        todas_noticias = []
+        cursores = []
+        for future in futures:
+            if future in concluidas and not future.cancelled() and future.exception() is None:
+                artigos, cursor = future.result()
+                todas_noticias.extend(artigos)
+                if cursor:
+                    cursores.append(cursor)
+            elif future in concluidas and not future.cancelled():
+                logging.error(f"[BUSCA] ERRO inesperado em busca concorrente: {future.exception()}")
+        
+        return todas_noticias, cursores
+    
+    @staticmethod
+    def buscar_todas_noticias(agent_config=None, agent_id=None):
+        """Busca todas as combinações e avança os cursores logo em seguida"""
+        noticias, cursores = NewsAPIs.buscar_noticias_com_cursores(agent_config, agent_id)
+        NewsAPIs.avancar_cursores(cursores, agent_id)
+        return noticias
+    
+    @staticmethod
+    def buscar_noticias_com_cursores(agent_config=None, agent_id=None):
+        """
+        Busca todas as combinações sem gravar os cursores. Retorna (noticias, cursores);
+        chame avancar_cursores depois que as notícias forem filtradas e enfileiradas,
+        para que uma falha no meio do caminho não pule artigos.
+        """
+        if agent_config is None:
+            cfg = carregar_config()
+        else:
+            cfg = agent_config
+        
+        if not cfg.get("apis_ativas") or not cfg.get("idiomas_busca") or not cfg.get("categorias_ativas"):
+            return [], []
+        
+        pasta_feed = cfg.get("pasta_feed", "geral")
+        logging.info(f"--- [BUSCA] Iniciando ciclo de busca nas APIs {cfg['apis_ativas']} (pasta: {pasta_feed}) ---")
+        
+        tarefas = NewsAPIs._montar_tarefas(cfg)
+        
+        if carregar_config().get("busca_concorrente", True) and len(tarefas) > 1:
+            todas_noticias, cursores = NewsAPIs._buscar_concorrente(tarefas, pasta_feed, agent_id)
+        else:
+            todas_noticias, cursores = [], []
+            for tarefa in tarefas:
+                artigos, cursor = NewsAPIs._buscar_combinacao(*tarefa, pasta_feed, agent_id)
+                todas_noticias.extend(artigos)
+                if cursor:
+                    cursores.append(cursor)
         
         logging.info(f"--- [BUSCA] Ciclo finalizado. {len(todas_noticias)} notícias encontradas ---")
-        return todas_noticias
\ No newline at end of file
+        return todas_noticias, cursores
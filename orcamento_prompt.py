@@ -0,0 +1,114 @@
+import re
+import math
+import bisect
+import threading
+from config import config_snapshot
+
+# Estimativa para Gemini em português/inglês: ~4 caracteres por token
+CARACTERES_POR_TOKEN = 4
+
+# Orçamento em tokens do texto variável (artigo) de cada prompt; ajustável em orcamento_tokens
+ORCAMENTO_PADRAO = {
+    "Título Canônico": 80,
+    "Filtro de Relevância": 180,
+    "Filtro de Relevância em Lote": 180,  # por notícia do lote
+    "Tradução": 1200,
+    "Reescrita de Legenda": 1200,
+    "Categorização": 300,
+    "Geração de Hashtags": 300,
+    "Enriquecimento Unificado": 1200
+}
+
+FAIXAS_HISTOGRAMA = [250, 500, 1000, 2000, 4000]
+
+_estatisticas = {}  # {funcao: {...}}
+_estatisticas_lock = threading.Lock()
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto or "") / CARACTERES_POR_TOKEN)
+
+def _cortar_palavras(texto, max_caracteres):
+    corte = texto[:max_caracteres]
+    if len(texto) > max_caracteres and " " in corte:
+        corte = corte.rsplit(" ", 1)[0]
+    return corte.rstrip() + "…"
+
+def truncar(texto, max_tokens):
+    """
+    Mantém os parágrafos iniciais (o lead) enquanto couberem; do parágrafo que
+    estoura, aproveita frases inteiras. Só corta no meio de uma frase quando
+    nem a primeira cabe. Retorna (texto, truncado).
+    """
+    if not texto or estimar_tokens(texto) <= max_tokens:
+        return texto, False
+    
+    max_caracteres = max_tokens * CARACTERES_POR_TOKEN
+    partes = []
+    usados = 0
+    
+    for paragrafo in re.split(r"\n\s*\n|\n", texto.strip()):
+        paragrafo = paragrafo.strip()
+        if not paragrafo:
+            continue
+        if usados + len(paragrafo) + 1 <= max_caracteres:
+            partes.append(paragrafo)
+            usados += len(paragrafo) + 1
+            continue
+        
+        frases = []
+        for frase in re.split(r"(?<=[.!?…])\s+", paragrafo):
+            if usados + len(frase) + 1 > max_caracteres:
+                break
+            frases.append(frase)
+            usados += len(frase) + 1
+        if frases:
+            partes.append(" ".join(frases))
+        elif not partes:
+            partes.append(_cortar_palavras(paragrafo, max_caracteres - 1))
+        break
+    
+    return "\n".join(partes), True
+
+def ajustar(funcao, texto):
+    """Aplica ao texto o orçamento de tokens da função"""
+    orcamento = config_snapshot().get("orcamento_tokens", {}).get(funcao, ORCAMENTO_PADRAO.get(funcao))
+    if not orcamento:
+        return texto
+    texto_ajustado, truncado = truncar(texto, int(orcamento))
+    if truncado:
+        with _estatisticas_lock:
+            _stats_funcao(funcao)["truncados"] += 1
+    return texto_ajustado
+
+def _stats_funcao(funcao):
+    return _estatisticas.setdefault(funcao, {
+        "prompts": 0,
+        "tokens_total": 0,
+        "tokens_max": 0,
+        "truncados": 0,
+        "histograma": [0] * (len(FAIXAS_HISTOGRAMA) + 1)
+    })
+
+def registrar_prompt(funcao, prompt):
+    tokens = estimar_tokens(prompt)
+    with _estatisticas_lock:
+        stats = _stats_funcao(funcao)
+        stats["prompts"] += 1
+        stats["tokens_total"] += tokens
+        stats["tokens_max"] = max(stats["tokens_max"], tokens)
+        stats["histograma"][bisect.bisect_right(FAIXAS_HISTOGRAMA, tokens)] += 1
+
+def obter_estatisticas_prompts():
+    """Tamanho estimado dos prompts por função, com histograma por faixa de tokens"""
+    rotulos = [f"<{FAIXAS_HISTOGRAMA[0]}"] + [f"{a}-{b}" for a, b in zip(FAIXAS_HISTOGRAMA, FAIXAS_HISTOGRAMA[1:])] + [f">={FAIXAS_HISTOGRAMA[-1]}"]
+    with _estatisticas_lock:
+        return {
+            funcao: {
+                "prompts": stats["prompts"],
+                "tokens_medio": round(stats["tokens_total"] / stats["prompts"], 1) if stats["prompts"] else 0.0,
+                "tokens_max": stats["tokens_max"],
+                "truncados": stats["truncados"],
+                "histograma": dict(zip(rotulos, stats["histograma"]))
+            }
+            for funcao, stats in _estatisticas.items()
+        }
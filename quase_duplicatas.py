@@ -0,0 +1,131 @@
+import re
+import time
+import zlib
+import hashlib
+import threading
+import unicodedata
+import logging
+import numpy as np
+from database import Database
+from config import carregar_config
+from indice_semantico import _momento_sqlite, referencia
+
+NUM_PERMUTACOES = 128
+BANDAS = 64
+LINHAS_POR_BANDA = NUM_PERMUTACOES // BANDAS
+TAMANHO_SHINGLE = 5
+PRIMO = np.uint64(4294967291)
+
+_gerador = np.random.RandomState(1)
+_COEF_A = _gerador.randint(1, 2 ** 31, size=NUM_PERMUTACOES).astype(np.uint64)
+_COEF_B = _gerador.randint(0, 2 ** 31, size=NUM_PERMUTACOES).astype(np.uint64)
+
+def normalizar_texto(titulo, conteudo=None, tamanho_lead=300):
+    """Título + início do conteúdo em minúsculas, sem acentos e pontuação"""
+    texto = f"{titulo or ''} {(conteudo or '')[:tamanho_lead]}"
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", texto))
+
+def hash_local(titulo, conteudo=None):
+    """Hash estável usado como semantic_hash quando a manchete canônica da IA é dispensada"""
+    return "local:" + hashlib.sha1(normalizar_texto(titulo, conteudo).encode("utf-8")).hexdigest()[:20]
+
+def assinatura_minhash(texto):
+    """Assinatura MinHash dos shingles de caracteres do texto normalizado"""
+    if len(texto) < TAMANHO_SHINGLE:
+        shingles = {texto}
+    else:
+        shingles = {texto[i:i + TAMANHO_SHINGLE] for i in range(len(texto) - TAMANHO_SHINGLE + 1)}
+    
+    valores = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (a·x + b) mod p para todas as permutações de uma vez: matriz permutações × shingles
+    hashes = (np.outer(_COEF_A, valores) + _COEF_B[:, None]) % PRIMO
+    return hashes.min(axis=1).astype(np.uint32)
+
+class IndiceQuaseDuplicatas:
+    """
+    Índice LSH (bandas de MinHash) de notícias já vistas nos últimos janela_dias.
+    Responde a similaridade Jaccard estimada da notícia mais parecida e a
+    referência (título, início do conteúdo) dela. Entradas fora da janela são
+    ignoradas na busca e descartadas quando passam a ser a maioria.
+    """
+    
+    def __init__(self, janela_dias):
+        self.janela_segundos = janela_dias * 86400
+        self._lock = threading.Lock()
+        self._limpar()
+    
+    def _limpar(self):
+        self._assinaturas = []
+        self._momentos = []
+        self._referencias = []
+        self._baldes = [{} for _ in range(BANDAS)]
+    
+    def _chaves_bandas(self, assinatura):
+        return [assinatura[i * LINHAS_POR_BANDA:(i + 1) * LINHAS_POR_BANDA].tobytes() for i in range(BANDAS)]
+    
+    def _inserir(self, assinatura, momento, referencia):
+        indice = len(self._assinaturas)
+        self._assinaturas.append(assinatura)
+        self._momentos.append(momento)
+        self._referencias.append(referencia)
+        for banda, chave in enumerate(self._chaves_bandas(assinatura)):
+            self._baldes[banda].setdefault(chave, []).append(indice)
+    
+    def adicionar(self, assinatura, referencia=None, momento=None):
+        with self._lock:
+            self._inserir(assinatura, momento or time.time(), referencia)
+    
+    def _compactar_se_necessario(self, momento_min):
+        validas = [i for i, momento in enumerate(self._momentos) if momento >= momento_min]
+        if len(validas) * 2 >= len(self._momentos):
+            return
+        entradas = [(self._assinaturas[i], self._momentos[i], self._referencias[i]) for i in validas]
+        self._limpar()
+        for entrada in entradas:
+            self._inserir(*entrada)
+    
+    def mais_parecida(self, assinatura):
+        """(similaridade, referência) da notícia mais parecida na janela, ou (0.0, None)"""
+        momento_min = time.time() - self.janela_segundos
+        with self._lock:
+            self._compactar_se_necessario(momento_min)
+            candidatos = set()
+            for banda, chave in enumerate(self._chaves_bandas(assinatura)):
+                candidatos.update(self._baldes[banda].get(chave, ()))
+            candidatos = [i for i in candidatos if self._momentos[i] >= momento_min]
+            
+            if not candidatos:
+                return 0.0, None
+            
+            matriz = np.stack([self._assinaturas[i] for i in candidatos])
+            similaridades = (matriz == assinatura).mean(axis=1)
+            melhor = int(similaridades.argmax())
+            return float(similaridades[melhor]), self._referencias[candidatos[melhor]]
+    
+    def maior_similaridade(self, assinatura):
+        return self.mais_parecida(assinatura)[0]
+    
+    def __len__(self):
+        return len(self._assinaturas)
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+def obter_indice(agent_id=None):
+    """
+    Índice do agente (ou global), construído na primeira chamada a partir do
+    histórico e da fila recentes e atualizado incrementalmente depois disso.
+    """
+    escopo = agent_id or "global"
+    with _indices_lock:
+        if escopo not in _indices:
+            dias = int(carregar_config().get("quase_duplicata_dias", 30))
+            indice = IndiceQuaseDuplicatas(dias)
+            for titulo, conteudo, data in Database.pegar_textos_recentes(dias, agent_id):
+                indice.adicionar(assinatura_minhash(normalizar_texto(titulo, conteudo)),
+                                 referencia(titulo, conteudo), _momento_sqlite(data))
+            _indices[escopo] = indice
+            logging.info(f"[DUPLICATAS] Índice local de {escopo} construído com {len(indice)} notícias.")
+        return _indices[escopo]
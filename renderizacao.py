@@ -0,0 +1,273 @@
+import os
+import time
+import uuid
+import threading
+import logging
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import ARTES_DIR, carregar_config, config_snapshot
+from database import Database
+from media import MediaProcessor
+from layout_texto import layout_texto
+from cache_imagens import cache_imagens
+
+ARTE_PRONTA = "PRONTA"
+ARTE_FALHA = "FALHA"
+
+# Saída padrão das renderizações sem caminho definido
+DIR_AVULSAS = os.path.join(ARTES_DIR, "avulsas")
+
+# Chaves da configuração que definem o visual do post (enviadas aos processos de render)
+CHAVES_ESTILO = ("opacidade", "arquivo_overlay")
+
+# Estatísticas por escopo: {escopo: {...}}
+estatisticas_renderizacao = {}
+_estatisticas_lock = threading.Lock()
+
+# Um render antecipado por escopo de cada vez (busca e job periódico podem coincidir)
+_em_andamento = {}
+_em_andamento_lock = threading.Lock()
+
+def _contar(escopo, **valores):
+    with _estatisticas_lock:
+        stats = estatisticas_renderizacao.setdefault(escopo, {
+            "antecipadas": 0,
+            "falhas": 0,
+            "no_post_prontas": 0,
+            "no_post_sincronas": 0,
+            "artes_removidas": 0
+        })
+        for campo, valor in valores.items():
+            stats[campo] += valor
+
+def caminho_arte(item_id, agent_id=None):
+    return os.path.join(ARTES_DIR, agent_id or "global", f"{item_id}.png")
+
+def _gerar_post(titulo, url_imagem, categoria_ia, caminho_cache, estilo, caminho_saida, em_memoria):
+    if em_memoria:
+        return MediaProcessor.criar_imagem_post_bytes(titulo, url_imagem, categoria_ia, caminho_cache, estilo)
+    return MediaProcessor.criar_imagem_post(titulo, url_imagem, categoria_ia, caminho_cache, estilo, caminho_saida)
+
+def _contadores_processo():
+    return {"layout_texto": layout_texto.contadores(), "cache_imagens": cache_imagens.contadores()}
+
+def _iniciar_processo(fila_logs, nivel):
+    """Inicializador dos processos de render: os logs seguem para o processo principal"""
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [logging.handlers.QueueHandler(fila_logs)]
+    raiz.setLevel(nivel)
+
+def _renderizar_em_processo(*argumentos):
+    """
+    Executado no processo de render (fontes e camadas ficam em cache nele).
+    Retorna o resultado e quanto o trabalho somou aos contadores de layout e
+    de cache de imagens, para o processo principal exibir no status.
+    """
+    antes = _contadores_processo()
+    resultado = _gerar_post(*argumentos)
+    depois = _contadores_processo()
+    return resultado, {nome: {campo: valor - antes[nome].get(campo, 0) for campo, valor in contadores.items()}
+                       for nome, contadores in depois.items()}
+
+class _RepassarLog(logging.Handler):
+    """Entrega no processo principal os registros de log vindos dos processos de render"""
+    
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+class ServicoRenderizacao:
+    """
+    Renderiza posts num pool de processos, fora do GIL do servidor e dos
+    agendadores. Cada trabalho grava num caminho próprio (nunca num arquivo
+    compartilhado) e devolve o caminho ou, com em_memoria, os bytes do PNG.
+    Com render_max_workers = 0 a renderização acontece na thread chamadora.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._max_workers = None
+        self._fila_logs = None
+        self._pendentes = 0
+        self._estatisticas = {"enviadas": 0, "concluidas": 0, "falhas": 0, "tempo_total_s": 0.0, "pico_fila": 0}
+    
+    def _obter_executor(self):
+        max_workers = int(config_snapshot().get("render_max_workers", 2))
+        with self._lock:
+            if max_workers <= 0:
+                return None
+            if self._executor is None or self._max_workers != max_workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                # spawn: o processo principal tem threads (Flask, agendadores), então fork não é seguro
+                contexto = multiprocessing.get_context("spawn")
+                if self._fila_logs is None:
+                    self._fila_logs = contexto.Queue()
+                    logging.handlers.QueueListener(self._fila_logs, _RepassarLog()).start()
+                self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto, initializer=_iniciar_processo,
+                                                     initargs=(self._fila_logs, logging.getLogger().getEffectiveLevel()))
+                self._max_workers = max_workers
+                logging.info(f"[RENDER] Pool de renderização iniciado com {max_workers} processos.")
+            return self._executor
+    
+    def _descartar_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+    
+    def _registrar(self, inicio, resultado):
+        with self._lock:
+            self._pendentes -= 1
+            self._estatisticas["concluidas" if resultado else "falhas"] += 1
+            self._estatisticas["tempo_total_s"] = round(self._estatisticas["tempo_total_s"] + time.perf_counter() - inicio, 3)
+    
+    def renderizar(self, titulo, url_imagem, categoria_ia, caminho_cache=None, estilo=None,
+                   caminho_saida=None, em_memoria=False):
+        """
+        Gera o post e retorna o caminho (ou os bytes, com em_memoria, sem gravar
+        arquivo); None em caso de falha. Sem caminho_saida, o arquivo vai para
+        artes/avulsas, limpo por coletar_artes depois da carência.
+        """
+        base = estilo if estilo is not None else config_snapshot()
+        estilo = {chave: base[chave] for chave in CHAVES_ESTILO if base.get(chave) is not None}
+        if em_memoria:
+            caminho_saida = None
+        else:
+            caminho_saida = caminho_saida or os.path.join(DIR_AVULSAS, f"{uuid.uuid4().hex}.png")
+            os.makedirs(os.path.dirname(caminho_saida), exist_ok=True)
+        argumentos = (titulo, url_imagem, categoria_ia, caminho_cache, estilo, caminho_saida, em_memoria)
+        
+        with self._lock:
+            self._pendentes += 1
+            self._estatisticas["enviadas"] += 1
+            self._estatisticas["pico_fila"] = max(self._estatisticas["pico_fila"], self._pendentes)
+        inicio = time.perf_counter()
+        resultado = None
+        
+        try:
+            executor = self._obter_executor()
+            if executor is None:
+                resultado = _gerar_post(*argumentos)
+            else:
+                try:
+                    resultado, contadores = executor.submit(_renderizar_em_processo, *argumentos).result()
+                    layout_texto.mesclar(contadores["layout_texto"])
+                    cache_imagens.mesclar(contadores["cache_imagens"])
+                except BrokenProcessPool:
+                    logging.error("[RENDER] Pool de renderização quebrado; recriando e renderizando nesta thread.")
+                    self._descartar_executor(executor)
+                    resultado = _gerar_post(*argumentos)
+        except Exception as e:
+            logging.error(f"[RENDER] Falha ao renderizar '{titulo[:60]}': {e}")
+        finally:
+            self._registrar(inicio, resultado)
+        return resultado
+    
+    def estatisticas(self):
+        with self._lock:
+            resultado = dict(self._estatisticas)
+            resultado["fila"] = self._pendentes
+            resultado["workers"] = self._max_workers or 0
+        feitas = resultado["concluidas"] + resultado["falhas"]
+        resultado["tempo_medio_s"] = round(resultado["tempo_total_s"] / feitas, 3) if feitas else 0.0
+        return resultado
+
+# Instância global compartilhada
+servico_renderizacao = ServicoRenderizacao()
+
+def _renderizar(item, cfg, agent_id):
+    return servico_renderizacao.renderizar(item["titulo_refinado"], item["url_imagem"], item["categoria_ia"],
+                                           item.get("imagem_cache"), cfg, caminho_arte(item["id"], agent_id))
+
+def renderizar_pendentes(agent_id=None, cfg=None):
+    """
+    Gera a imagem final dos itens da fila que ainda não têm arte e grava o
+    caminho e o status no item. Depois remove as artes de itens que saíram da fila.
+    """
+    escopo = agent_id or "global"
+    with _em_andamento_lock:
+        if _em_andamento.get(escopo):
+            return
+        _em_andamento[escopo] = True
+    
+    try:
+        cfg = cfg or carregar_config()
+        itens = Database.pegar_itens_sem_arte(int(cfg.get("render_antecipado_lote", 10)), agent_id,
+                                              int(cfg.get("render_max_tentativas", 4)),
+                                              float(cfg.get("render_espera_retentativa_minutos", 10)))
+        prontas = falhas = 0
+        # Os itens do lote são renderizados em paralelo pelo pool de processos
+        with ThreadPoolExecutor(max_workers=max(1, int(cfg.get("render_max_workers", 2)))) as executor:
+            caminhos = list(executor.map(lambda item: _renderizar(item, cfg, agent_id), itens))
+        for item, caminho in zip(itens, caminhos):
+            if caminho:
+                Database.atualizar_arte(item["id"], caminho, ARTE_PRONTA, agent_id)
+                prontas += 1
+            else:
+                Database.atualizar_arte(item["id"], None, ARTE_FALHA, agent_id)
+                falhas += 1
+        
+        _contar(escopo, antecipadas=prontas, falhas=falhas)
+        if itens:
+            logging.info(f"[RENDER] {escopo}: {prontas} artes geradas antecipadamente, {falhas} falhas.")
+        coletar_artes(agent_id, cfg)
+    finally:
+        with _em_andamento_lock:
+            _em_andamento[escopo] = False
+
+def arte_do_item(item, cfg=None, agent_id=None):
+    """Caminho da arte pronta do item ou, se ela não existir, gerada na hora (e gravada no item)"""
+    caminho = item.get("arte_caminho")
+    if item.get("arte_status") == ARTE_PRONTA and caminho and os.path.exists(caminho):
+        _contar(agent_id or "global", no_post_prontas=1)
+        return caminho
+    
+    _contar(agent_id or "global", no_post_sincronas=1)
+    caminho = _renderizar(item, cfg or carregar_config(), agent_id)
+    Database.atualizar_arte(item["id"], caminho, ARTE_PRONTA if caminho else ARTE_FALHA, agent_id)
+    return caminho
+
+def _remover_antigos(diretorio, carencia, ativas=()):
+    if not os.path.isdir(diretorio):
+        return 0
+    agora = time.time()
+    removidas = 0
+    
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        if caminho in ativas:
+            continue
+        try:
+            if agora - os.stat(caminho).st_mtime < carencia:
+                continue
+            os.remove(caminho)
+            removidas += 1
+        except OSError as e:
+            logging.warning(f"[RENDER] Não foi possível remover {caminho}: {e}")
+    return removidas
+
+def coletar_artes(agent_id=None, cfg=None):
+    """
+    Remove artes de itens que não estão mais na fila (postados, reprovados ou
+    limpos) e as renderizações avulsas. Arquivos recentes são preservados para
+    não apagar uma arte cujo item ainda está sendo gravado ou postado.
+    """
+    cfg = cfg or carregar_config()
+    carencia = float(cfg.get("artes_carencia_minutos", 30)) * 60
+    diretorio = os.path.dirname(caminho_arte("x", agent_id))
+    removidas = 0
+    if os.path.isdir(diretorio):
+        removidas = _remover_antigos(diretorio, carencia, Database.pegar_artes_da_fila(agent_id))
+    removidas += _remover_antigos(DIR_AVULSAS, carencia)
+    
+    if removidas:
+        _contar(agent_id or "global", artes_removidas=removidas)
+        logging.info(f"[RENDER] {removidas} artes de itens fora da fila removidas de {agent_id or 'global'}.")
+    return removidas
+
+def obter_estatisticas_renderizacao():
+    with _estatisticas_lock:
+        return {escopo: dict(stats) for escopo, stats in estatisticas_renderizacao.items()}
@@ -0,0 +1,208 @@
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+
+CODIGOS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+ERROS_RETENTAVEIS = {"ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+                     "TooManyRequests", "GatewayTimeout", "Aborted"}
+
+class LLMIndisponivel(Exception):
+    """Modelo fora do ar, com disjuntor aberto ou sem resposta dentro do prazo"""
+
+class _PrazoEsgotado(Exception):
+    pass
+
+def _eh_retentavel(erro):
+    if isinstance(erro, (TimeoutError, ConnectionError, requests.Timeout, requests.ConnectionError)):
+        return True
+    if type(erro).__name__ in ERROS_RETENTAVEIS:
+        return True
+    codigo = getattr(erro, "code", None)
+    if not isinstance(codigo, int):
+        codigo = getattr(getattr(erro, "response", None), "status_code", None)
+    return codigo in CODIGOS_RETENTAVEIS
+
+class _Disjuntor:
+    def __init__(self):
+        self.estado = "fechado"
+        self.falhas_consecutivas = 0
+        self.aberto_ate = 0.0
+        self.sonda_em_andamento = False
+        self.estatisticas = {
+            "chamadas": 0,
+            "retentativas": 0,
+            "falhas": 0,
+            "prazos_estourados": 0,
+            "hedges_disparados": 0,
+            "hedges_vencedores": 0,
+            "aberturas": 0,
+            "rejeitadas_disjuntor": 0
+        }
+
+class ResilienciaLLM:
+    """
+    Chamadas ao LLM com retentativa (backoff exponencial com jitter) em erros
+    transitórios, prazo total por chamada, requisição hedge opcional e um
+    disjuntor por modelo. Com o disjuntor aberto as chamadas falham na hora com
+    LLMIndisponivel, para que o chamador adie o trabalho em vez de rejeitá-lo.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._disjuntores = {}  # {modelo: _Disjuntor}
+        self._executor = None
+        self._max_workers = None
+    
+    def _obter_executor(self, max_workers):
+        with self._lock:
+            if self._executor is None or self._max_workers != max_workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+                self._max_workers = max_workers
+            return self._executor
+    
+    def _disjuntor(self, modelo):
+        if modelo not in self._disjuntores:
+            self._disjuntores[modelo] = _Disjuntor()
+        return self._disjuntores[modelo]
+    
+    def disponivel(self, modelo):
+        """False enquanto o disjuntor do modelo estiver aberto"""
+        with self._lock:
+            disjuntor = self._disjuntor(modelo)
+            return disjuntor.estado != "aberto" or time.monotonic() >= disjuntor.aberto_ate
+    
+    def _liberar(self, modelo):
+        """Decide se a chamada pode seguir; no meio-aberto só uma sonda passa por vez"""
+        with self._lock:
+            disjuntor = self._disjuntor(modelo)
+            disjuntor.estatisticas["chamadas"] += 1
+            if disjuntor.estado == "aberto" and time.monotonic() >= disjuntor.aberto_ate:
+                disjuntor.estado = "meio_aberto"
+            if disjuntor.estado == "aberto" or (disjuntor.estado == "meio_aberto" and disjuntor.sonda_em_andamento):
+                disjuntor.estatisticas["rejeitadas_disjuntor"] += 1
+                raise LLMIndisponivel(f"disjuntor de {modelo} aberto")
+            if disjuntor.estado == "meio_aberto":
+                disjuntor.sonda_em_andamento = True
+    
+    def _registrar_sucesso(self, modelo):
+        with self._lock:
+            disjuntor = self._disjuntor(modelo)
+            if disjuntor.estado != "fechado":
+                logging.info(f"[IA] Disjuntor de {modelo} fechado. Chamadas normalizadas.")
+            disjuntor.estado = "fechado"
+            disjuntor.falhas_consecutivas = 0
+            disjuntor.sonda_em_andamento = False
+    
+    def _registrar_falha(self, modelo, limite_falhas, pausa):
+        with self._lock:
+            disjuntor = self._disjuntor(modelo)
+            disjuntor.estatisticas["falhas"] += 1
+            disjuntor.falhas_consecutivas += 1
+            disjuntor.sonda_em_andamento = False
+            if disjuntor.estado == "meio_aberto" or disjuntor.falhas_consecutivas >= limite_falhas:
+                if disjuntor.estado != "aberto":
+                    disjuntor.estatisticas["aberturas"] += 1
+                    logging.warning(f"[IA] Disjuntor de {modelo} aberto após {disjuntor.falhas_consecutivas} falhas. Pausando por {pausa:.0f}s.")
+                disjuntor.estado = "aberto"
+                disjuntor.aberto_ate = time.monotonic() + pausa
+    
+    def _contar(self, modelo, campo):
+        with self._lock:
+            self._disjuntor(modelo).estatisticas[campo] += 1
+    
+    def _tentar(self, modelo, chamada, executor, prazo_tentativa, atraso_hedge):
+        """Uma tentativa, com hedge opcional: vale a primeira resposta bem-sucedida"""
+        inicio = time.monotonic()
+        pendentes = {executor.submit(chamada)}
+        hedge = None
+        
+        if atraso_hedge and atraso_hedge < prazo_tentativa:
+            feitos, _ = wait(pendentes, timeout=atraso_hedge)
+            if not feitos:
+                self._contar(modelo, "hedges_disparados")
+                hedge = executor.submit(chamada)
+                pendentes.add(hedge)
+        
+        erro = None
+        while pendentes:
+            restante = prazo_tentativa - (time.monotonic() - inicio)
+            if restante <= 0:
+                raise _PrazoEsgotado(f"sem resposta em {prazo_tentativa:.0f}s")
+            feitos, pendentes = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                if futuro.exception() is None:
+                    if futuro is hedge:
+                        self._contar(modelo, "hedges_vencedores")
+                    return futuro.result()
+                erro = futuro.exception()
+        raise erro
+    
+    def executar(self, modelo, chamada, cfg):
+        """
+        Executa chamada() com as políticas de resiliência configuradas.
+        Retorna o resultado ou levanta LLMIndisponivel (falha transitória
+        persistente) ou o erro original (falha não retentável).
+        """
+        max_tentativas = max(1, int(cfg.get("llm_max_tentativas", 4)))
+        backoff_base = float(cfg.get("llm_backoff_base", 1.0))
+        backoff_max = float(cfg.get("llm_backoff_max", 20.0))
+        prazo = float(cfg.get("llm_prazo_chamada", 60))
+        atraso_hedge = float(cfg.get("llm_hedge_apos", 0))  # 0 desativa o hedge
+        limite_falhas = int(cfg.get("llm_disjuntor_falhas", 5))
+        pausa = float(cfg.get("llm_disjuntor_pausa", 60))
+        executor = self._obter_executor(int(cfg.get("llm_max_workers", 16)))
+        
+        self._liberar(modelo)
+        limite = time.monotonic() + prazo
+        ultimo_erro = None
+        
+        for tentativa in range(max_tentativas):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            if tentativa:
+                self._contar(modelo, "retentativas")
+            
+            try:
+                resultado = self._tentar(modelo, chamada, executor, restante, atraso_hedge)
+                self._registrar_sucesso(modelo)
+                return resultado
+            except _PrazoEsgotado as e:
+                self._contar(modelo, "prazos_estourados")
+                ultimo_erro = e
+                break
+            except Exception as e:
+                if not _eh_retentavel(e):
+                    self._registrar_sucesso(modelo)  # o serviço respondeu; o erro é da requisição
+                    raise
+                ultimo_erro = e
+            
+            espera = random.uniform(0, min(backoff_max, backoff_base * 2 ** tentativa))
+            if time.monotonic() + espera >= limite:
+                break
+            logging.info(f"[IA] Erro transitório em {modelo} ({ultimo_erro}). Nova tentativa em {espera:.1f}s.")
+            time.sleep(espera)
+        
+        self._registrar_falha(modelo, limite_falhas, pausa)
+        raise LLMIndisponivel(f"{modelo} indisponível: {ultimo_erro}")
+    
+    def estatisticas(self):
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                modelo: {
+                    "estado": disjuntor.estado,
+                    "falhas_consecutivas": disjuntor.falhas_consecutivas,
+                    "reabre_em_s": round(max(0.0, disjuntor.aberto_ate - agora), 1) if disjuntor.estado == "aberto" else 0.0,
+                    **disjuntor.estatisticas
+                }
+                for modelo, disjuntor in self._disjuntores.items()
+            }
+
+# Instância global compartilhada
+resiliencia_llm = ResilienciaLLM()